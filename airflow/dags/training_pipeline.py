@@ -28,6 +28,13 @@ with DAG(
         ti.xcom_push("data_ingestion_artifact", data_ingestion_artifact)
 
 
+    def data_drift(**kwargs):
+        ti  = kwargs['ti']
+        data_ingestion_artifact = ti.xcom_pull(task_ids="data_ingestion",key="data_ingestion_artifact")
+        data_drift_artifact=training_pipeline.start_data_drift_detection(data_ingestion_artifact=data_ingestion_artifact)
+        ti.xcom_push('data_drift_artifact', data_drift_artifact)
+
+
     def data_validation(**kwargs):
         from finance_complaint.entity import DataIngestionArtifact,DataValidationArtifact,DataTransformationArtifact,\
         ModelTrainerArtifact,ModelEvaluationArtifact,ModelPusherArtifact,PartialModelTrainerRefArtifact,PartialModelTrainerMetricArtifact
@@ -80,6 +87,8 @@ with DAG(
         if model_evaluation_artifact.model_accepted:
             model_pusher_artifact = training_pipeline.start_model_pusher(model_trainer_artifact=model_trainer_artifact)
             print(f'Model pusher artifact: {model_pusher_artifact}')
+            data_ingestion_artifact = ti.xcom_pull(task_ids="data_ingestion",key="data_ingestion_artifact")
+            training_pipeline.get_data_drift_detection(data_ingestion_artifact=data_ingestion_artifact).update_reference_sketch()
         else:
             print("Trained model rejected.")
             print("Trained model rejected.")
@@ -103,6 +112,17 @@ with DAG(
     """
     )
 
+    data_drift_task = PythonOperator(
+        task_id="data_drift",
+        python_callable=data_drift,
+    )
+    data_drift_task.doc_md = dedent(
+        """\
+    #### Data drift task
+    This task compares the ingested batch with the training data of the pushed model
+    """
+    )
+
     data_validation_task = PythonOperator(
         task_id="data_validation",
         python_callable=data_validation,
@@ -162,4 +182,4 @@ with DAG(
     This task created train and test file
     """
     )
-    data_ingestion_task >> data_validation_task >>data_transformation_task >> model_trainer_task >>model_evaluation_task >> push_model_task >> upload_data_task
\ No newline at end of file
+    data_ingestion_task >> data_drift_task >> data_validation_task >>data_transformation_task >> model_trainer_task >>model_evaluation_task >> push_model_task >> upload_data_task
\ No newline at end of file
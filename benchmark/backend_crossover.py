@@ -0,0 +1,138 @@
+"""
+Wall-clock time of the spark and pandas backends of DataValidation, and of the custom
+transformers of finance_complaint/ml/feature.py, over growing synthetic feature stores.
+
+The synthetic feature store is written with pyarrow in the same hive partitioned layout
+as data ingestion. Spark session startup is measured once and reported separately: a
+pipeline stage running in its own process pays it on top of the warm spark time.
+
+    python benchmark/backend_crossover.py --rows 1000 10000 100000 1000000
+"""
+from finance_complaint.components.data_validation import DataValidation
+from finance_complaint.components.data_validation_arrow import (ArrowDataValidation, get_arrow_schema,
+                                                                get_partitioning)
+from finance_complaint.config.spark_manager import spark_session
+from finance_complaint.entity import (DataIngestionArtifact, DataValidationConfig, TrainingPipelineConfig,
+                                      FinanceDataSchema)
+from finance_complaint.ml.feature import DerivedFeatureGenerator, FrequencyImputerModel
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pandas as pd
+import numpy as np
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+ISSUES = ["Incorrect information on your report", "Problem with a credit reporting company's investigation",
+          "Attempts to collect debt not owed", "Managing an account", "Trouble during payment process"]
+
+
+def write_synthetic_feature_store(file_path: str, n_row: int, schema: FinanceDataSchema, seed: int = 42):
+    random = np.random.default_rng(seed)
+    date_received = (pd.Timestamp("2022-07-01", tz="UTC")
+                     + pd.to_timedelta(random.integers(0, 365 * 24 * 3600, n_row), unit="s"))
+    data = {field.name: [None] * n_row for field in schema.feature_store_schema.fields}
+    for column, domain in schema.categorical_domains.items():
+        values = random.choice(np.array(domain + [None], dtype=object), n_row)
+        data[column] = values
+    data[schema.col_issue] = random.choice(np.array(ISSUES, dtype=object), n_row)
+    data[schema.col_complaint_id] = np.arange(n_row).astype(str)
+    data[schema.col_date_received] = date_received
+    data[schema.col_date_sent_to_company] = date_received + pd.to_timedelta(random.integers(0, 30, n_row), unit="D")
+    data[schema.col_date_received_year] = date_received.year.astype("int32")
+    data[schema.col_date_received_month] = date_received.month.astype("int32")
+    table = pa.Table.from_pandas(pd.DataFrame(data), schema=get_arrow_schema(schema.feature_store_schema),
+                                 preserve_index=False)
+    ds.write_dataset(table, file_path, format="parquet",
+                     partitioning=get_partitioning(schema.partition_columns, schema))
+
+
+def run_validation(data_validation_class, feature_store_file_path: str, artifact_root: str) -> float:
+    training_pipeline_config = TrainingPipelineConfig(artifact_dir=os.path.join(artifact_root, "artifact", "run"))
+    data_validation_config = DataValidationConfig(training_pipeline_config=training_pipeline_config)
+    data_ingestion_artifact = DataIngestionArtifact(feature_store_file_path=feature_store_file_path,
+                                                    metadata_file_path=None, download_dir=None)
+    data_validation = data_validation_class(data_validation_config=data_validation_config,
+                                            data_ingestion_artifact=data_ingestion_artifact)
+    start_time = time.perf_counter()
+    data_validation.initiate_data_validation()
+    return time.perf_counter() - start_time
+
+
+def derive_features_pandas(derived_feature: DerivedFeatureGenerator, dataframe: pd.DataFrame) -> pd.DataFrame:
+    """
+    Same result as DerivedFeatureGenerator.transform on a pandas dataframe.
+    """
+    input_cols = derived_feature.getInputCols()
+    dataframe = dataframe.copy()
+    epoch_seconds = []
+    for column in input_cols:
+        dataframe[column] = pd.to_datetime(dataframe[column], utc=True)
+        # timestamps cast to long are whole epoch seconds in spark
+        epoch_seconds.append((dataframe[column] - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1))
+    dataframe[derived_feature.getOutputCols()[0]] = ((epoch_seconds[1] - epoch_seconds[0]).abs()
+                                                    / derived_feature.second_within_day)
+    return dataframe
+
+
+def impute_frequency_pandas(frequency_imputer: FrequencyImputerModel, dataframe: pd.DataFrame) -> pd.DataFrame:
+    """
+    Same result as FrequencyImputerModel.transform on a pandas dataframe.
+    """
+    dataframe = dataframe.copy()
+    for output_column, input_column, top_category in zip(frequency_imputer.getOutputCols(),
+                                                         frequency_imputer.getInputCols(),
+                                                         frequency_imputer.getTopCategorys()):
+        dataframe[output_column] = dataframe[input_column].fillna(top_category)
+    return dataframe
+
+
+def run_transformers(feature_store_file_path: str, schema: FinanceDataSchema) -> (float, float):
+    derived_feature = DerivedFeatureGenerator(inputCols=schema.derived_input_features,
+                                              outputCols=schema.derived_output_features)
+    frequency_imputer = FrequencyImputerModel(inputCols=schema.one_hot_encoding_features,
+                                              outputCols=schema.im_one_hot_encoding_features)
+    frequency_imputer.setTopCategorys(value=[domain[0] for column, domain in schema.categorical_domains.items()
+                                             if column in schema.one_hot_encoding_features])
+
+    start_time = time.perf_counter()
+    dataframe = ds.dataset(feature_store_file_path, format="parquet").to_table().to_pandas()
+    impute_frequency_pandas(frequency_imputer, derive_features_pandas(derived_feature, dataframe))
+    pandas_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    dataframe = spark_session.read.schema(schema.feature_store_schema).parquet(feature_store_file_path)
+    (frequency_imputer.transform(derived_feature.transform(dataframe))
+     .write.format("noop").mode("overwrite").save())
+    spark_time = time.perf_counter() - start_time
+    return pandas_time, spark_time
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    args = parser.parse_args()
+    schema = FinanceDataSchema()
+
+    start_time = time.perf_counter()
+    spark_session.get_session()
+    print(f"Spark session startup: [{time.perf_counter() - start_time:8.3f}s]")
+
+    print(f"{'rows':>10} {'validation pandas':>18} {'validation spark':>17} "
+          f"{'transform pandas':>17} {'transform spark':>16}")
+    for n_row in args.rows:
+        root = tempfile.mkdtemp()
+        try:
+            feature_store_file_path = os.path.join(root, "feature_store", "finance_complaint")
+            write_synthetic_feature_store(file_path=feature_store_file_path, n_row=n_row, schema=schema)
+            pandas_validation_time = run_validation(ArrowDataValidation, feature_store_file_path,
+                                                    os.path.join(root, "pandas"))
+            spark_validation_time = run_validation(DataValidation, feature_store_file_path,
+                                                   os.path.join(root, "spark"))
+            pandas_transform_time, spark_transform_time = run_transformers(feature_store_file_path, schema)
+            print(f"{n_row:>10} {pandas_validation_time:>17.3f}s {spark_validation_time:>16.3f}s "
+                  f"{pandas_transform_time:>16.3f}s {spark_transform_time:>15.3f}s")
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
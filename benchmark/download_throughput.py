@@ -0,0 +1,88 @@
+"""
+Download throughput of DataIngestion.download_files against a local stand-in
+for the CFPB search API.
+
+Every request to the stand-in server sleeps for a fixed latency and returns a
+fixed number of complaint records, so the measured time is dominated by the
+round trips, as it is against the real API.
+
+    python benchmark/download_throughput.py --latency 0.5 --workers 1 4 8
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from finance_complaint.components.data_ingestion import DataIngestion
+from finance_complaint.entity import DataIngestionConfig, TrainingPipelineConfig
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+
+def get_request_handler(latency: float, n_record: int):
+    record = {"_source": {"complaint_id": "1", "product": "Mortgage", "issue": "Trouble during payment process",
+                          "date_received": "2022-07-01T12:00:00-05:00", "consumer_disputed": "N/A"}}
+    payload = json.dumps([record] * n_record).encode("utf-8")
+
+    class RequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return RequestHandler
+
+
+def run(max_workers: int, server_url: str, from_date: str, to_date: str, max_request_per_second: float) -> float:
+    artifact_root = tempfile.mkdtemp()
+    try:
+        training_pipeline_config = TrainingPipelineConfig(artifact_dir=os.path.join(artifact_root, "artifact", "run"))
+        data_ingestion_config = DataIngestionConfig(training_pipeline_config=training_pipeline_config)
+        data_ingestion_config.from_date = from_date
+        data_ingestion_config.to_date = to_date
+        data_ingestion_config.datasource_url = f"{server_url}/?date_received_max=<todate>&date_received_min=<fromdate>"
+        data_ingestion_config.max_workers = max_workers
+        data_ingestion_config.max_request_per_second = max_request_per_second
+
+        data_ingestion = DataIngestion(data_ingestion_config=data_ingestion_config)
+        n_interval = len(data_ingestion.get_required_interval())
+
+        start_time = time.perf_counter()
+        data_ingestion.download_files()
+        elapsed = time.perf_counter() - start_time
+
+        n_file = len(os.listdir(data_ingestion_config.download_dir))
+        assert n_file == n_interval, f"Expected {n_interval} files, found {n_file}"
+        print(f"workers: [{max_workers:>3}] intervals: [{n_interval}] time: [{elapsed:8.3f}s] "
+              f"throughput: [{n_interval / elapsed:8.2f} intervals/s]")
+        return elapsed
+    finally:
+        shutil.rmtree(artifact_root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds the server waits per request")
+    parser.add_argument("--records", type=int, default=1000, help="Records returned per request")
+    parser.add_argument("--from-date", default="2022-07-01")
+    parser.add_argument("--to-date", default="2023-06-30")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--max-request-per-second", type=float, default=None)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), get_request_handler(args.latency, args.records))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server_url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        for max_workers in args.workers:
+            run(max_workers=max_workers, server_url=server_url, from_date=args.from_date,
+                to_date=args.to_date, max_request_per_second=args.max_request_per_second)
+    finally:
+        server.shutdown()
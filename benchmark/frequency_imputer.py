@@ -0,0 +1,77 @@
+"""
+Job count and wall-clock time of FrequencyImputer._fit against the previous implementation,
+which sorted the category counts of each column and took the first row, one job per column.
+
+A synthetic dataframe with skewed string columns is generated and cached first, so that every
+path scans the same in-memory data. Jobs are counted with the spark status tracker of a job group.
+
+    python benchmark/frequency_imputer.py --rows 5000000 --columns 5 --categories 1000
+"""
+from finance_complaint.config.spark_manager import spark_session
+from finance_complaint.ml.feature import FrequencyImputer
+from pyspark.sql import DataFrame
+from pyspark.sql.functions import col, desc, floor, lit, pow, rand, when
+from typing import Callable, List
+import argparse
+import time
+
+
+def get_legacy_top_categories(dataframe: DataFrame, columns: List[str]) -> List[str]:
+    top_categories = []
+    for column in columns:
+        category_count_by_desc = dataframe.groupBy(column).count().filter(f'{column} is not null').sort(
+            desc('count'))
+        top_categories.append(category_count_by_desc.take(1)[0][column])
+    return top_categories
+
+
+def get_synthetic_dataframe(n_row: int, n_column: int, n_category: int) -> DataFrame:
+    dataframe = spark_session.range(n_row)
+    for index in range(n_column):
+        # squaring a uniform value skews the categories towards 0, about 10% of values are missing
+        category = floor(pow(rand(seed=index), lit(2)) * n_category).cast("string")
+        dataframe = dataframe.withColumn(f"col_{index}",
+                                         when(rand(seed=n_column + index) < 0.1, lit(None)).otherwise(category))
+    return dataframe.drop("id")
+
+
+def run(name: str, fit: Callable[[], List[str]]) -> (List[str], int, float):
+    spark_context = spark_session.sparkContext
+    spark_context.setJobGroup(name, name)
+    start_time = time.perf_counter()
+    top_categories = fit()
+    elapsed_time = time.perf_counter() - start_time
+    n_job = len(spark_context.statusTracker().getJobIdsForGroup(name))
+    spark_context.setJobGroup("", "")
+    return top_categories, n_job, elapsed_time
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5000000)
+    parser.add_argument("--columns", type=int, default=5)
+    parser.add_argument("--categories", type=int, default=1000)
+    parser.add_argument("--sample-fraction", type=float, default=0.1)
+    args = parser.parse_args()
+
+    dataframe = get_synthetic_dataframe(n_row=args.rows, n_column=args.columns, n_category=args.categories).cache()
+    dataframe.count()
+    columns = dataframe.columns
+
+    def fit_imputer(approximate: bool) -> List[str]:
+        frequency_imputer = FrequencyImputer(inputCols=columns, outputCols=[f"im_{column}" for column in columns],
+                                             approximate=approximate, sampleFraction=args.sample_fraction)
+        return frequency_imputer.fit(dataframe).getTopCategorys()
+
+    legacy_top_categories, legacy_n_job, legacy_time = run("legacy", lambda: get_legacy_top_categories(dataframe,
+                                                                                                        columns))
+    exact_top_categories, exact_n_job, exact_time = run("exact", lambda: fit_imputer(approximate=False))
+    approximate_top_categories, approximate_n_job, approximate_time = run("approximate",
+                                                                          lambda: fit_imputer(approximate=True))
+
+    print(f"{'':<24} {'jobs':>6} {'seconds':>10}")
+    print(f"{'per column sort':<24} {legacy_n_job:>6} {legacy_time:>10.3f}")
+    print(f"{'single job':<24} {exact_n_job:>6} {exact_time:>10.3f}")
+    print(f"{'single job, sampled':<24} {approximate_n_job:>6} {approximate_time:>10.3f}")
+    print(f"Exact top categories identical: [{legacy_top_categories == exact_top_categories}]")
+    print(f"Sampled top categories identical: [{legacy_top_categories == approximate_top_categories}]")
@@ -0,0 +1,102 @@
+"""
+Planning time and end-to-end transform latency of the fitted transformation pipeline with and
+without FusedFeatureTransformer, for batch prediction sized inputs up to training sized ones.
+
+The pipeline of DataTransformation is fitted once on a synthetic feature store written as in
+benchmark/backend_crossover.py. Planning time is the time to build the transformed dataframe and
+its executed plan, latency the time to transform and collect the rows. Each measurement is the
+median of --repeat runs. Outputs of both pipelines are compared row by row.
+
+    python benchmark/fused_transformer.py --train-rows 100000 --rows 10 1000 100000
+"""
+from backend_crossover import write_synthetic_feature_store
+from finance_complaint.components.data_transformation import DataTransformation
+from finance_complaint.config.spark_manager import spark_session
+from finance_complaint.entity import (DataTransformationConfig, DataValidationArtifact, TrainingPipelineConfig,
+                                      FinanceDataSchema)
+from finance_complaint.ml.feature import get_fused_pipeline_model
+from pyspark.ml.pipeline import PipelineModel
+from pyspark.sql import DataFrame
+from typing import Callable
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+
+def get_median_time(function: Callable[[], object], repeat: int) -> float:
+    elapsed_times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function()
+        elapsed_times.append(time.perf_counter() - start_time)
+    return statistics.median(elapsed_times)
+
+
+def get_planning_time(pipeline_model: PipelineModel, dataframe: DataFrame, repeat: int) -> float:
+    return get_median_time(lambda: pipeline_model.transform(dataframe)._jdf.queryExecution().executedPlan(), repeat)
+
+
+def get_latency(pipeline_model: PipelineModel, dataframe: DataFrame, repeat: int) -> float:
+    return get_median_time(lambda: pipeline_model.transform(dataframe).collect(), repeat)
+
+
+def is_identical(pipeline_model: PipelineModel, fused_pipeline_model: PipelineModel, dataframe: DataFrame,
+                 schema: FinanceDataSchema) -> bool:
+    transformed_dataframe = pipeline_model.transform(dataframe)
+    fused_dataframe = fused_pipeline_model.transform(dataframe)
+    if ([(field.name, field.dataType) for field in transformed_dataframe.schema.fields]
+            != [(field.name, field.dataType) for field in fused_dataframe.schema.fields]):
+        return False
+    rows = transformed_dataframe.orderBy(schema.col_complaint_id).collect()
+    fused_rows = fused_dataframe.orderBy(schema.col_complaint_id).collect()
+    return rows == fused_rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--train-rows", type=int, default=100000)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10, 1000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    schema = FinanceDataSchema()
+
+    root = tempfile.mkdtemp()
+    try:
+        feature_store_file_path = os.path.join(root, "feature_store", "finance_complaint")
+        write_synthetic_feature_store(file_path=feature_store_file_path, n_row=args.train_rows, schema=schema)
+        dataframe = (spark_session.read.schema(schema.feature_store_schema).parquet(feature_store_file_path)
+                     .select(schema.col_complaint_id, *schema.required_columns, *schema.partition_columns)
+                     .cache())
+        dataframe.count()
+
+        training_pipeline_config = TrainingPipelineConfig(artifact_dir=os.path.join(root, "artifact", "run"))
+        data_transformation_config = DataTransformationConfig(training_pipeline_config=training_pipeline_config)
+        # estimators are fitted on the synthetic data itself
+        data_transformation_config.use_column_profile = False
+        data_transformation_config.incremental_fit = False
+        data_validation_artifact = DataValidationArtifact(accepted_file_path=feature_store_file_path, rejected_dir=None,
+                                                          report_file_path=None, column_profile_file_path=None)
+        data_transformation = DataTransformation(data_validation_artifact=data_validation_artifact,
+                                                 data_transformation_config=data_transformation_config)
+        pipeline_model = data_transformation.get_data_transformation_pipeline(train_dataframe=dataframe).fit(dataframe)
+        fused_pipeline_model = get_fused_pipeline_model(pipeline_model=pipeline_model)
+        print(f"Stages: [{len(pipeline_model.stages)}] fused into: [{len(fused_pipeline_model.stages)}]")
+
+        print(f"{'rows':>10} {'planning':>10} {'planning fused':>15} {'latency':>10} {'latency fused':>14} "
+              f"{'identical':>10}")
+        for n_row in args.rows:
+            input_dataframe = dataframe.limit(n_row).cache()
+            input_dataframe.count()
+            planning_time = get_planning_time(pipeline_model, input_dataframe, args.repeat)
+            fused_planning_time = get_planning_time(fused_pipeline_model, input_dataframe, args.repeat)
+            latency = get_latency(pipeline_model, input_dataframe, args.repeat)
+            fused_latency = get_latency(fused_pipeline_model, input_dataframe, args.repeat)
+            identical = is_identical(pipeline_model, fused_pipeline_model, input_dataframe, schema)
+            print(f"{n_row:>10} {planning_time:>9.3f}s {fused_planning_time:>14.3f}s {latency:>9.3f}s "
+                  f"{fused_latency:>13.3f}s {str(identical):>10}")
+            input_dataframe.unpersist()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
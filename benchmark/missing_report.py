@@ -0,0 +1,62 @@
+"""
+Missing value report of DataValidation.get_missing_report against the previous
+implementation, which ran one count job per column.
+
+A synthetic dataframe with the same number of string columns as the CFPB
+complaint data is generated and cached first, so that both paths scan the
+same in-memory data and only the number of jobs differs.
+
+    python benchmark/missing_report.py --rows 5000000 --columns 18
+"""
+from finance_complaint.components.data_validation import DataValidation, MissingReport
+from finance_complaint.config.spark_manager import spark_session
+from pyspark.sql import DataFrame
+from pyspark.sql.functions import col, lit, rand, when
+from typing import Dict
+import argparse
+import time
+
+
+def get_legacy_missing_report(dataframe: DataFrame) -> Dict[str, MissingReport]:
+    missing_report: Dict[str, MissingReport] = dict()
+    number_of_row = dataframe.count()
+    for column in dataframe.columns:
+        missing_row = dataframe.filter(f"{column} is null").count()
+        missing_report[column] = MissingReport(total_row=number_of_row,
+                                               missing_row=missing_row,
+                                               missing_percentage=(missing_row * 100) / number_of_row)
+    return missing_report
+
+
+def get_synthetic_dataframe(n_row: int, n_column: int) -> DataFrame:
+    dataframe = spark_session.range(n_row)
+    for index in range(n_column):
+        # column i has roughly (i / n_column) missing values
+        missing_fraction = index / n_column
+        dataframe = dataframe.withColumn(f"col_{index}",
+                                         when(rand(seed=index) < missing_fraction, lit(None))
+                                         .otherwise((col("id") % 1000).cast("string")))
+    return dataframe.drop("id")
+
+
+def measure(name: str, func, dataframe: DataFrame) -> Dict[str, MissingReport]:
+    start_time = time.perf_counter()
+    missing_report = func(dataframe)
+    elapsed = time.perf_counter() - start_time
+    print(f"{name:>12}: [{elapsed:8.3f}s]")
+    return missing_report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--columns", type=int, default=18)
+    args = parser.parse_args()
+
+    dataframe = get_synthetic_dataframe(n_row=args.rows, n_column=args.columns).cache()
+    print(f"Rows: [{dataframe.count()}] Columns: [{len(dataframe.columns)}]")
+
+    legacy_report = measure("per column", get_legacy_missing_report, dataframe)
+    single_pass_report = measure("single pass", DataValidation.get_missing_report, dataframe)
+    for column in legacy_report:
+        assert legacy_report[column][:3] == single_pass_report[column][:3], f"Missing reports differ for {column}"
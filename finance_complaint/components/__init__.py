@@ -1,5 +1,7 @@
 from finance_complaint.components.data_ingestion import *
 from finance_complaint.components.data_validation import *
+from finance_complaint.components.data_validation_arrow import *
+from finance_complaint.components.data_drift import *
 from finance_complaint.components.data_transformation import *
 from finance_complaint.components.model_trainer import *
 from finance_complaint.components.model_pusher import *
@@ -0,0 +1,220 @@
+from finance_complaint.entity import DataIngestionArtifact, DataDriftArtifact
+from finance_complaint.entity import DataDriftConfig
+from finance_complaint.entity import FinanceDataSchema
+from finance_complaint.config.spark_manager import spark_session
+from finance_complaint.exception import FinanceException
+from finance_complaint.logger import logging
+from finance_complaint.ml.feature import DerivedFeatureGenerator
+from finance_complaint.ml.sketch import (CountMinSketch, HistogramSketch, save_sketches, load_sketches,
+                                         merge_sketches, get_psi, get_js_divergence)
+from finance_complaint.utils import write_yaml_file, read_yaml_file
+
+from pyspark.sql import DataFrame
+from pyspark.sql.functions import col, lit, struct, array, explode
+
+import os, sys
+from collections import namedtuple
+from datetime import datetime
+from typing import Dict, List
+import numpy as np
+
+ColumnDrift = namedtuple("ColumnDrift", ["psi", "js_divergence", "is_drift"])
+SKETCH_KEY = "sketch_key"
+SKETCH_ROW = "sketch_row"
+SKETCH_BUCKET = "sketch_bucket"
+SKETCH_PAIR = "__pair"
+
+
+class DataDriftDetection:
+    """
+    Compares each ingested batch with the data the current model was trained on using per column
+    sketches: count-min sketches of categorical features and fixed bin histograms of numerical
+    features. A batch is sketched in one aggregation job, the comparison only reads sketches so
+    its cost does not depend on data size. Once a model is pushed the reference sketch is built
+    from the feature store over its training window, later batch sketches are merged into it.
+    """
+
+    def __init__(self, data_drift_config: DataDriftConfig,
+                       data_ingestion_artifact: DataIngestionArtifact,
+                       schema=FinanceDataSchema()):
+        try:
+            self.data_drift_config = data_drift_config
+            self.data_ingestion_artifact = data_ingestion_artifact
+            self.schema = schema
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    @property
+    def categorical_columns(self) -> List[str]:
+        return self.schema.one_hot_encoding_features + self.schema.tfidf_features
+
+    @property
+    def numerical_columns(self) -> List[str]:
+        return self.schema.numerical_features
+
+    def get_batch_sketch_file_path(self, from_date: str, to_date: str) -> str:
+        return os.path.join(self.data_drift_config.batch_sketch_dir, f"{from_date}_{to_date}.npz")
+
+    def read_data(self, from_date: str, to_date: str) -> DataFrame:
+        try:
+            dataframe: DataFrame = (spark_session.read
+                                    .schema(self.schema.feature_store_schema)
+                                    .parquet(self.data_ingestion_artifact.feature_store_file_path)
+                                    .filter(self.schema.get_date_window_filter(from_date=from_date, to_date=to_date)))
+            # numerical features are derived the same way as in the transformation pipeline
+            derived_feature = DerivedFeatureGenerator(inputCols=self.schema.derived_input_features,
+                                                      outputCols=self.schema.derived_output_features)
+            dataframe = derived_feature.transform(dataframe)
+            logging.info(f"Feature store for date window: [{from_date}, {to_date}] is read")
+            return dataframe
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    def get_batch_sketch(self, dataframe: DataFrame) -> Dict[str, object]:
+        """
+        Sketches every drift column in one job: the sketch buckets of all columns are unpivoted
+        into (sketch key, row, bucket) triples and counted with a single group by.
+        """
+        try:
+            sketches: Dict[str, object] = dict()
+            bucket_pairs = []
+            for column in self.categorical_columns:
+                sketch = CountMinSketch(width=self.data_drift_config.cms_width,
+                                        depth=self.data_drift_config.cms_depth)
+                for row, bucket_column in enumerate(sketch.get_bucket_columns(col(column))):
+                    bucket_pairs.append(struct(lit(column).alias(SKETCH_KEY), lit(row).alias(SKETCH_ROW),
+                                               bucket_column.alias(SKETCH_BUCKET)))
+                sketches[column] = sketch
+            for column in self.numerical_columns:
+                sketch = HistogramSketch(bin_edges=self.data_drift_config.numerical_bin_edges)
+                bucket_pairs.append(struct(lit(column).alias(SKETCH_KEY), lit(0).alias(SKETCH_ROW),
+                                           sketch.get_bucket_column(col(column)).alias(SKETCH_BUCKET)))
+                sketches[column] = sketch
+
+            bucket_count_rows = (dataframe
+                                 .select(explode(array(*bucket_pairs)).alias(SKETCH_PAIR))
+                                 .select(f"{SKETCH_PAIR}.*")
+                                 .groupBy(SKETCH_KEY, SKETCH_ROW, SKETCH_BUCKET)
+                                 .count()
+                                 .collect())
+            for row in bucket_count_rows:
+                sketch = sketches[row[SKETCH_KEY]]
+                if isinstance(sketch, CountMinSketch):
+                    sketch.add(row=row[SKETCH_ROW], bucket=row[SKETCH_BUCKET], n=row["count"])
+                else:
+                    sketch.add(bucket=row[SKETCH_BUCKET], n=row["count"])
+            logging.info(f"Batch sketched from [{len(bucket_count_rows)}] bucket counts")
+            return sketches
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    @staticmethod
+    def get_drift_report(reference_sketches: Dict[str, object], batch_sketches: Dict[str, object],
+                         metric: str, threshold: float) -> Dict[str, ColumnDrift]:
+        """
+        Divergence of each column between the reference and the batch sketch. Count-min sketch
+        rows are independent hashings of the categories, their divergences are averaged.
+        """
+        try:
+            drift_report: Dict[str, ColumnDrift] = dict()
+            for column, batch_sketch in batch_sketches.items():
+                if column not in reference_sketches:
+                    continue
+                distribution_pairs = list(zip(reference_sketches[column].get_distributions(),
+                                              batch_sketch.get_distributions()))
+                psi = float(np.mean([get_psi(expected, actual) for expected, actual in distribution_pairs]))
+                js_divergence = float(np.mean([get_js_divergence(expected, actual)
+                                               for expected, actual in distribution_pairs]))
+                score = psi if metric == "psi" else js_divergence
+                drift_report[column] = ColumnDrift(psi=psi, js_divergence=js_divergence, is_drift=score > threshold)
+            return drift_report
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    def update_reference_sketch(self) -> str:
+        """
+        Brings the reference sketch to the training date window, called once the model trained on
+        that window is pushed. While the window keeps its start date, the batch sketches ingested
+        after the window the reference covers are merged into it. Otherwise the reference is
+        sketched from the feature store over the whole window, in one job.
+        """
+        try:
+            from_date, to_date = self.data_drift_config.from_date, self.data_drift_config.to_date
+            reference_sketch_file_path = self.data_drift_config.reference_sketch_file_path
+            reference_window_file_path = self.data_drift_config.reference_window_file_path
+            reference_window = None
+            if os.path.exists(reference_sketch_file_path) and os.path.exists(reference_window_file_path):
+                reference_window = read_yaml_file(reference_window_file_path)
+
+            if reference_window is None or reference_window["from_date"] != from_date:
+                # without an end date the window covers the feature store up to today
+                covered_to_date = to_date if to_date is not None else datetime.now().strftime("%Y-%m-%d")
+                logging.info(f"Sketching reference from feature store window: [{from_date}, {covered_to_date}]")
+                reference_sketches = self.get_batch_sketch(dataframe=self.read_data(from_date=from_date,
+                                                                                    to_date=covered_to_date))
+            else:
+                reference_sketches = load_sketches(reference_sketch_file_path)
+                covered_to_date = reference_window["to_date"]
+                n_batch = 0
+                if os.path.exists(self.data_drift_config.batch_sketch_dir):
+                    for file_name in sorted(os.listdir(self.data_drift_config.batch_sketch_dir)):
+                        _, batch_to_date = os.path.splitext(file_name)[0].split("_")
+                        # a batch starts where the previous one ended, it is in the reference only
+                        # once the covered window reaches its end
+                        if batch_to_date <= covered_to_date:
+                            continue
+                        if to_date is not None and batch_to_date > to_date:
+                            continue
+                        batch_sketches = load_sketches(os.path.join(self.data_drift_config.batch_sketch_dir,
+                                                                    file_name))
+                        reference_sketches = merge_sketches(reference_sketches, batch_sketches)
+                        covered_to_date = batch_to_date
+                        n_batch += 1
+                logging.info(f"Merged [{n_batch}] batch sketches into reference of window: "
+                             f"[{from_date}, {covered_to_date}]")
+
+            logging.info(f"Writing reference sketch into: [{reference_sketch_file_path}]")
+            os.makedirs(os.path.dirname(reference_sketch_file_path), exist_ok=True)
+            save_sketches(file_path=reference_sketch_file_path, sketches=reference_sketches)
+            write_yaml_file(file_path=reference_window_file_path,
+                            data={"from_date": from_date, "to_date": covered_to_date})
+            return reference_sketch_file_path
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    def initiate_data_drift_detection(self) -> DataDriftArtifact:
+        try:
+            logging.info(f"{'>>'*20} Data Drift Detection Started {'<<'*20}")
+            batch_sketches = self.get_batch_sketch(dataframe=self.read_data(
+                from_date=self.data_ingestion_artifact.from_date, to_date=self.data_ingestion_artifact.to_date))
+
+            os.makedirs(self.data_drift_config.batch_sketch_dir, exist_ok=True)
+            batch_sketch_file_path = self.get_batch_sketch_file_path(from_date=self.data_ingestion_artifact.from_date,
+                                                                     to_date=self.data_ingestion_artifact.to_date)
+            logging.info(f"Saving batch sketch at: [{batch_sketch_file_path}]")
+            save_sketches(file_path=batch_sketch_file_path, sketches=batch_sketches)
+
+            reference_sketch_file_path = self.data_drift_config.reference_sketch_file_path
+            drift_report: Dict[str, ColumnDrift] = dict()
+            if os.path.exists(reference_sketch_file_path):
+                drift_report = self.get_drift_report(reference_sketches=load_sketches(reference_sketch_file_path),
+                                                     batch_sketches=batch_sketches,
+                                                     metric=self.data_drift_config.metric,
+                                                     threshold=self.data_drift_config.threshold)
+            else:
+                logging.info("No reference sketch available yet, drift is not computed")
+
+            write_yaml_file(file_path=self.data_drift_config.report_file_path,
+                            data={column: dict(column_drift._asdict()) for column, column_drift in drift_report.items()})
+            metric = "psi" if self.data_drift_config.metric == "psi" else "js_divergence"
+            drift_score = max([getattr(column_drift, metric) for column_drift in drift_report.values()], default=0.0)
+            data_drift_artifact = DataDriftArtifact(
+                report_file_path=self.data_drift_config.report_file_path,
+                batch_sketch_file_path=batch_sketch_file_path,
+                reference_sketch_file_path=reference_sketch_file_path,
+                is_drift_found=any(column_drift.is_drift for column_drift in drift_report.values()),
+                drift_score=drift_score)
+            logging.info(f"Data Drift artifact: [{data_drift_artifact}]")
+            return data_drift_artifact
+        except Exception as e:
+            raise FinanceException(e, sys)
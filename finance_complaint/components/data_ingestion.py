@@ -1,86 +1,270 @@
-from collections import namedtuple
+from collections import namedtuple, Counter
 from finance_complaint.entity import DataIngestionArtifact
 from finance_complaint.entity import DataIngestionConfig
 from finance_complaint.entity import DataIngestionMetadata
+from finance_complaint.entity import DataIngestionVolumeMetadata, DailyVolume
+from finance_complaint.entity import DataIngestionManifest, ManifestEntry
+from finance_complaint.entity import FinanceDataSchema
+from finance_complaint.data_access.raw_response_cache import RawResponseCache
 from finance_complaint.exception import FinanceException
 from finance_complaint.logger import logging
-import os, sys
+import os, sys, shutil
 from finance_complaint.config.spark_manager import spark_session
-from datetime import datetime
-import pandas as pd
+from pyspark.sql import DataFrame, Observation
+from pyspark.sql.functions import col, lit, when, count, collect_list, input_file_name, regexp_extract, year, month
+from pyspark.sql.functions import coalesce, concat, monotonically_increasing_id
+from pyspark.sql.types import StructType, StructField, StringType, IntegerType
+from pyspark import StorageLevel
+from datetime import datetime, timedelta
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from urllib.parse import urlparse
+import threading
+import hashlib
+import heapq
+import random
+import codecs
 import uuid
 import json
 import re
 import time
-from typing import List
+from typing import List, Dict, Iterator, Tuple, Optional
+
+DownloadUrl = namedtuple("DownloadUrl", ["url","file_path", "n_retry", "from_date", "to_date"])
+DownloadResult = namedtuple("DownloadResult", ["download_url", "is_success", "wait_second", "content"])
+SOURCE_FILE_NAME = "source_file_name"
+TOTAL_ROW = "total_row"
+REJECTED_FILE_NAME = "rejected_file_name"
+INDEX_PREFIX = "__index_"
+# partition column of the complaint_id index before it was partitioned by month
+LEGACY_KEY_BUCKET = "key_bucket="
+DEDUP_KEY = "dedup_key"
+
+
+def iter_json_array(chunks: Iterator[bytes]) -> Iterator:
+    """
+    Yields the elements of a top level JSON array one at a time while the
+    array is read from `chunks`, so only the element being decoded and the
+    current chunk are held in memory.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    is_array_open = False
+    for chunk in chunks:
+        buffer += text_decoder.decode(chunk)
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position == len(buffer):
+                break
+            if not is_array_open:
+                if buffer[position] != "[":
+                    raise ValueError(f"Expected a JSON array but found: [{buffer[position:position + 100]}]")
+                is_array_open = True
+                position += 1
+                continue
+            if buffer[position] == "]":
+                return
+            try:
+                element, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # element is not complete yet, wait for the next chunk
+                break
+            yield element
+        buffer = buffer[position:]
+    raise ValueError("Response ended before the JSON array was closed")
+
+
+def get_file_checksum(file_path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as file_obj:
+        for block in iter(lambda: file_obj.read(1024 * 1024), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+class RateLimiter:
+    """
+    Spaces out requests made to the same host so that at most
+    `max_request_per_second` requests are started per second, whatever
+    the number of download workers.
+    """
+    def __init__(self, max_request_per_second: float = None):
+        self.min_interval = 1 / max_request_per_second if max_request_per_second else 0
+        self.next_request_time: Dict[str, float] = dict()
+        self.lock = threading.Lock()
+
+    def wait(self, url: str):
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            request_time = max(now, self.next_request_time.get(host, now))
+            self.next_request_time[host] = request_time + self.min_interval
+        if request_time > now:
+            time.sleep(request_time - now)
 
-DownloadUrl = namedtuple("DownloadUrl", ["url","file_path", "n_retry"])
 
 class DataIngestion:
-    def __init__(self, data_ingestion_config: DataIngestionConfig, n_retry:int = 5,):
+    def __init__(self, data_ingestion_config: DataIngestionConfig, n_retry:int = 5,
+                       schema=FinanceDataSchema()):
         try:
             logging.info(f"{'>>'*20} Starting Data Ingestion {'<<'*20}")
             self.data_ingestion_config = data_ingestion_config
             self.failed_downloaded_urls: List[DownloadUrl] = []
             self.n_retry = n_retry
+            self.schema = schema
+            self.row_count_by_file: Dict[str, int] = dict()
+            self.volume_metadata = DataIngestionVolumeMetadata(volume_file_path=self.data_ingestion_config.volume_file_path)
+            self.interval_volume: Dict[Tuple[str, str], DailyVolume] = dict()
+            self.manifest = DataIngestionManifest(manifest_file_path=self.data_ingestion_config.manifest_file_path)
+            self.n_retry_attempt = 0
+            self.retry_wait_second = 0.0
+            self.raw_response_cache = RawResponseCache(cache_dir=self.data_ingestion_config.cache_dir,
+                                                       max_byte=self.data_ingestion_config.cache_max_byte,
+                                                       max_age_day=self.data_ingestion_config.cache_max_age_day,
+                                                       closed_after_day=self.data_ingestion_config.cache_closed_after_day)
+
+            # one pooled session shared by every download worker
+            self.session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.data_ingestion_config.max_workers)
+            self.session.mount("https://", adapter)
+            self.session.mount("http://", adapter)
+            self.rate_limiter = RateLimiter(max_request_per_second=self.data_ingestion_config.max_request_per_second)
         
         except Exception as e:
             raise FinanceException(e, sys)
 
-    def get_required_interval(self):
-
-        start_date = datetime.strptime(self.data_ingestion_config.from_date, "%Y-%m-%d")
-        end_date = datetime.strptime(self.data_ingestion_config.to_date, "%Y-%m-%d")
-        n_diff_days = (end_date - start_date).days
-        freq = None
-
-        if n_diff_days >365:
-            freq = "Y"
-        elif n_diff_days > 30:
-            freq = "M"
-        elif n_diff_days > 7:
-            freq = "W"
-
-        logging.debug(f"{n_diff_days} hence freq: {freq}")
+    def get_required_interval(self) -> List[Tuple[str, str]]:
+        """
+        Splits the days of [from_date, to_date] not covered by the manifest into intervals whose
+        expected payload is close to `target_interval_byte`, using the bytes per day recorded by
+        previous runs. Busy periods get short intervals and quiet periods are merged into long ones,
+        which keeps each request in a reliable size while making as few requests as possible.
+        Days of intervals planned by an earlier run are left out: the manifest holds those intervals
+        with their own bounds, so a resumed run does not plan them again along other bounds.
+        """
+        try:
+            start_date = datetime.strptime(self.data_ingestion_config.from_date, "%Y-%m-%d")
+            end_date = datetime.strptime(self.data_ingestion_config.to_date, "%Y-%m-%d")
+            target_interval_byte = self.data_ingestion_config.target_interval_byte
+            max_interval_day = self.data_ingestion_config.max_interval_day
+
+            daily_volume = self.volume_metadata.get_daily_volume()
+            # days never downloaded before are expected to be as big as an average known day
+            if len(daily_volume) > 0:
+                default_daily_byte = sum(volume.n_byte for volume in daily_volume.values()) // len(daily_volume)
+            else:
+                default_daily_byte = self.data_ingestion_config.default_daily_byte
+
+            covered_days = self.manifest.covered_days
+            required_intervals: List[Tuple[str, str]] = []
+            interval_start, interval_byte = None, 0
+            day = start_date
+            while day < end_date:
+                day_key = day.strftime("%Y-%m-%d")
+                if day_key in covered_days:
+                    if interval_start is not None:
+                        required_intervals.append((interval_start, day))
+                    interval_start, interval_byte = None, 0
+                    day += timedelta(days=1)
+                    continue
+                day_byte = daily_volume[day_key].n_byte if day_key in daily_volume else default_daily_byte
+                if interval_start is None:
+                    interval_start = day
+                is_full = interval_byte + day_byte > target_interval_byte
+                is_too_long = (day - interval_start).days >= max_interval_day
+                if day > interval_start and (is_full or is_too_long):
+                    required_intervals.append((interval_start, day))
+                    interval_start, interval_byte = day, 0
+                interval_byte += day_byte
+                day += timedelta(days=1)
+            if interval_start is not None:
+                required_intervals.append((interval_start, end_date))
+
+            required_intervals = [(from_date.strftime("%Y-%m-%d"), to_date.strftime("%Y-%m-%d"))
+                                  for from_date, to_date in required_intervals]
+            logging.info(f"Prepared [{len(required_intervals)}] intervals for target size "
+                         f"[{target_interval_byte}] bytes, [{len(covered_days)}] days already in manifest: "
+                         f"{required_intervals}")
+            return required_intervals
+        except Exception as e:
+            raise FinanceException(e, sys)
 
-        if freq is None:
-            intervals = pd.date_range(start=self.data_ingestion_config.from_date,
-                                      end=self.data_ingestion_config.to_date,
-                                      periods=2).astype('str').tolist()
-        else:
-            intervals = pd.date_range(start=self.data_ingestion_config.from_date,
-                                      end=self.data_ingestion_config.to_date,
-                                      freq=freq).astype('str').tolist()
+    def get_download_url(self, from_date: str, to_date: str) -> DownloadUrl:
+        logging.info(f"Generating data download url between {from_date} and {to_date}")
+        datasource_url: str = self.data_ingestion_config.datasource_url
 
-        logging.debug(f"Prepared Interval: {intervals}")
+        url= datasource_url.replace('<todate>', to_date).replace('<fromdate>', from_date)
+        logging.info(f"URL: {url}")
 
-        if self.data_ingestion_config.to_date not in intervals:
-            intervals.append(self.data_ingestion_config.to_date)
-        return intervals
+        file_name = f"{self.data_ingestion_config.file_name}_{from_date}_{to_date}.json"
+        file_path = os.path.join(self.data_ingestion_config.download_dir, file_name)
+        return DownloadUrl(url=url, file_path=file_path, n_retry=self.n_retry, from_date=from_date, to_date=to_date)
 
     def download_files(self, n_day_interval_url: int = None):
         try:
-            required_interval= self.get_required_interval()
-            logging.info("Started downloading files")
-            for index in range(1, len(required_interval)):
-                from_date, to_date = required_interval[index-1], required_interval[index]
-                logging.info(f"Generating data download url between {from_date} and {to_date}")
-                datasource_url: str = self.data_ingestion_config.datasource_url
-
-                url= datasource_url.replace('<todate>', to_date).replace('<fromdate>', from_date)
-                logging.info(f"URL: {url}")
-
-                file_name = f"{self.data_ingestion_config.file_name}_{from_date}_{to_date}.json"
-                file_path = os.path.join(self.data_ingestion_config.download_dir, file_name)
-                download_url = DownloadUrl(url=url, file_path=file_path, n_retry=self.n_retry)
-                self.download_data(download_url = download_url)
-            logging.info(f"File download completed")
+            download_urls: Dict[str, DownloadUrl] = dict()
+            if self.data_ingestion_config.from_date != self.data_ingestion_config.to_date:
+                for from_date, to_date in self.get_required_interval():
+                    download_urls[DataIngestionManifest.get_key(from_date, to_date)] = self.get_download_url(
+                                                                                from_date=from_date, to_date=to_date)
+
+            # intervals a previous run left pending or failed are fetched again
+            for manifest_entry in self.manifest.incomplete_entries:
+                key = DataIngestionManifest.get_key(manifest_entry.from_date, manifest_entry.to_date)
+                if key not in download_urls:
+                    logging.info(f"Resuming {manifest_entry.status} interval between "
+                                 f"{manifest_entry.from_date} and {manifest_entry.to_date}")
+                    download_urls[key] = self.get_download_url(from_date=manifest_entry.from_date,
+                                                               to_date=manifest_entry.to_date)
+
+            for download_url in download_urls.values():
+                self.manifest.update_entry(from_date=download_url.from_date, to_date=download_url.to_date,
+                                           file_path=download_url.file_path, status=DataIngestionManifest.PENDING,
+                                           checksum=None, n_row=None, is_converted=False)
+
+            max_workers = self.data_ingestion_config.max_workers
+            logging.info(f"Started downloading [{len(download_urls)}] files using [{max_workers}] workers")
+            # failed intervals wait in a queue ordered by the time they may be retried,
+            # workers keep downloading other intervals in the meantime
+            retry_queue: List[Tuple[float, int, DownloadUrl]] = []
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures: Dict[Future, DownloadUrl] = {executor.submit(self.download_data, download_url=download_url):
+                                                      download_url for download_url in download_urls.values()}
+                while len(futures) > 0 or len(retry_queue) > 0:
+                    while len(retry_queue) > 0 and retry_queue[0][0] <= time.monotonic():
+                        _, _, download_url = heapq.heappop(retry_queue)
+                        futures[executor.submit(self.download_data, download_url=download_url)] = download_url
+
+                    timeout = max(0, retry_queue[0][0] - time.monotonic()) if len(retry_queue) > 0 else None
+                    if len(futures) == 0:
+                        time.sleep(timeout)
+                        continue
+
+                    done_futures, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+                    for future in done_futures:
+                        futures.pop(future)
+                        download_result: DownloadResult = future.result()
+                        if download_result.is_success:
+                            continue
+                        retry = self.retry_download_data(download_result=download_result)
+                        if retry is not None:
+                            retry_time, download_url = retry
+                            heapq.heappush(retry_queue, (retry_time, self.n_retry_attempt, download_url))
+            logging.info(f"File download completed with [{self.n_retry_attempt}] retries and "
+                         f"[{self.retry_wait_second:.1f}] seconds spent waiting to retry")
+
+            logging.info(f"Recording downloaded volume of [{len(self.interval_volume)}] intervals")
+            self.volume_metadata.write_interval_volume(interval_volume=self.interval_volume)
+            self.raw_response_cache.evict()
 
         except Exception as e:
             raise FinanceException(e, sys)
 
-    def download_data(self, download_url: DownloadUrl):
+    def download_data(self, download_url: DownloadUrl) -> DownloadResult:
         try:
             logging.info(f"Starting download operation: {download_url}")
             download_dir = os.path.dirname(download_url.file_path)
@@ -88,60 +272,156 @@ class DataIngestion:
             # creating download directory
             os.makedirs(download_dir, exist_ok=True)
 
-            # downloading data
-            data = requests.get(download_url.url, params={'User-agent':f'your bot {uuid.uuid4()}'})
+            # closed intervals already fetched by an earlier run are served from the cache
+            is_cacheable = self.raw_response_cache.is_cacheable(to_date=download_url.to_date)
+            cache_key = RawResponseCache.get_key(datasource_url=self.data_ingestion_config.datasource_url,
+                                                 from_date=download_url.from_date, to_date=download_url.to_date)
+            if is_cacheable:
+                n_line = self.raw_response_cache.get(key=cache_key, file_path=download_url.file_path)
+                if n_line is not None:
+                    n_row = n_line if self.data_ingestion_config.stream_download else None
+                    self.manifest.update_entry(from_date=download_url.from_date, to_date=download_url.to_date,
+                                               status=DataIngestionManifest.DONE, n_row=n_row,
+                                               checksum=get_file_checksum(download_url.file_path))
+                    return DownloadResult(download_url=download_url, is_success=True, wait_second=None, content=None)
 
+            # downloading data
+            self.rate_limiter.wait(download_url.url)
             try:
-                logging.info(f"Started writing downloaded data into json file: {download_url.file_path}")
-                # saving downloaded data into hard disk
-                with open(download_url.file_path, "w") as file_obj:
-                    finance_complaint_data = list(map(lambda x: x["_source"],
-                                                      filter(lambda x: "_source" in x.keys(),
-                                                             json.loads(data.content)))
-                                                  )
-
-                    json.dump(finance_complaint_data, file_obj)
-                logging.info(f"Downloaded data has been written into file: {download_url.file_path}")
-            except Exception as e:
-                logging.info("Failed to download hence retry again.")
-                # removing file failed file exist
-                if os.path.exists(download_url.file_path):
-                    os.remove(download_url.file_path)
-                self.retry_download_data(data, download_url=download_url)
+                data = self.session.get(download_url.url, params={'User-agent':f'your bot {uuid.uuid4()}'},
+                                        stream=self.data_ingestion_config.stream_download)
+            except requests.RequestException as e:
+                logging.info(f"Request failed for {download_url.url}: {e}")
+                return DownloadResult(download_url=download_url, is_success=False, wait_second=None, content=b"")
+
+            # the response is closed on every path, a streamed body left unread would otherwise
+            # keep its connection out of the session pool
+            with data:
+                try:
+                    logging.info(f"Started writing downloaded data into json file: {download_url.file_path}")
+                    # saving downloaded data into hard disk
+                    if self.data_ingestion_config.stream_download:
+                        n_byte, n_row = self.write_streamed_data(data, file_path=download_url.file_path)
+                    else:
+                        with open(download_url.file_path, "w") as file_obj:
+                            finance_complaint_data = list(map(lambda x: x["_source"],
+                                                              filter(lambda x: "_source" in x.keys(),
+                                                                     json.loads(data.content)))
+                                                          )
+
+                            json.dump(finance_complaint_data, file_obj)
+                        n_byte, n_row = len(data.content), len(finance_complaint_data)
+                    self.interval_volume[(download_url.from_date, download_url.to_date)] = DailyVolume(n_byte=n_byte,
+                                                                                                       n_row=n_row)
+                    self.manifest.update_entry(from_date=download_url.from_date, to_date=download_url.to_date,
+                                               status=DataIngestionManifest.DONE, n_row=n_row,
+                                               checksum=get_file_checksum(download_url.file_path))
+                    logging.info(f"Downloaded data has been written into file: {download_url.file_path}")
+                    if is_cacheable:
+                        self.raw_response_cache.put(key=cache_key, file_path=download_url.file_path)
+                    return DownloadResult(download_url=download_url, is_success=True, wait_second=None, content=None)
+                except Exception as e:
+                    logging.info(f"Failed to download {download_url.url} hence it will be retried: {e}")
+                    # removing file failed file exist
+                    if os.path.exists(download_url.file_path):
+                        os.remove(download_url.file_path)
+                    try:
+                        content = data.content
+                    except RuntimeError:
+                        # body was already partly consumed by the streaming reader
+                        content = b""
+                    return DownloadResult(download_url=download_url, is_success=False,
+                                          wait_second=self.get_wait_second(data, content=content), content=content)
 
         except Exception as e:
             logging.error(e)
             raise FinanceException(e, sys)
 
-    def retry_download_data(self, data, download_url: DownloadUrl):
+    @staticmethod
+    def get_wait_second(data: requests.Response, content: bytes) -> Optional[int]:
+        """
+        Wait time asked by the server, from the Retry-After header or else from the error message.
+        """
+        retry_after = data.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return int(retry_after)
+        wait_second = re.findall(r"\d+", content.decode("utf-8", errors="ignore"))
+        if len(wait_second) > 0:
+            return int(wait_second[0])
+        return None
+
+    def write_streamed_data(self, data: requests.Response, file_path: str) -> Tuple[int, int]:
+        """
+        Reads the response body chunk by chunk and writes the `_source` of every
+        record as newline delimited json, so peak memory does not depend on the
+        size of the interval. Returns the number of bytes received and records written.
+        """
+        # an error response is left unread so that retry_download_data can look at it
+        data.raise_for_status()
+        temp_file_path = f"{file_path}.part"
+        n_byte, n_row = 0, 0
+
+        def count_bytes(chunks: Iterator[bytes]) -> Iterator[bytes]:
+            nonlocal n_byte
+            for chunk in chunks:
+                n_byte += len(chunk)
+                yield chunk
+
         try:
+            with open(temp_file_path, "w") as file_obj:
+                chunks = data.iter_content(chunk_size=self.data_ingestion_config.download_chunk_size)
+                for record in iter_json_array(count_bytes(chunks)):
+                    if "_source" in record:
+                        file_obj.write(json.dumps(record["_source"]))
+                        file_obj.write("\n")
+                        n_row += 1
+            os.replace(temp_file_path, file_path)
+        finally:
+            if os.path.exists(temp_file_path):
+                os.remove(temp_file_path)
+        logging.info(f"[{n_row}] records ([{n_byte}] bytes) streamed into file: {file_path}")
+        return n_byte, n_row
+
+    def retry_download_data(self, download_result: DownloadResult) -> Optional[Tuple[float, DownloadUrl]]:
+        """
+        Returns when (on the time.monotonic clock) a failed download may be retried, along
+        with its retry, or None once the interval is out of retries. The delay grows
+        exponentially with the attempt, is never shorter than the wait asked by the
+        server and is jittered so throttled intervals do not all come back at once.
+        """
+        try:
+            download_url = download_result.download_url
             if download_url.n_retry == 0:
                 self.failed_downloaded_urls.append(download_url)
+                self.manifest.update_entry(from_date=download_url.from_date, to_date=download_url.to_date,
+                                           status=DataIngestionManifest.FAILED)
                 logging.info(f"Unable to download file {download_url}")
-                return
-            
-            content = data.content.decode("utf-8")
-            wait_second = re.findall(r"\d+", content)
-
-            if len(wait_second) > 0:
-                time.sleep(int(wait_second[0]) + 2)
-
-            failed_file_path = os.path.join(self.data_ingestion_config.failed_dir,
-                                            os.path.basename(download_url.file_path))
-            os.makedirs(self.data_ingestion_config.failed_dir, exist_ok=True)
-            with open(failed_file_path, "wb") as file_obj:
-                file_obj.write(data.content)
-
-            download_url = DownloadUrl(url= download_url.url, 
-                                       file_path=download_url.file_path, 
-                                       n_retry=download_url.n_retry - 1)
-            self.download_data(download_url=download_url)
+
+                # only the last failed payload is kept
+                failed_file_path = os.path.join(self.data_ingestion_config.failed_dir,
+                                                os.path.basename(download_url.file_path))
+                os.makedirs(self.data_ingestion_config.failed_dir, exist_ok=True)
+                with open(failed_file_path, "wb") as file_obj:
+                    file_obj.write(download_result.content)
+                return None
+
+            attempt = self.n_retry - download_url.n_retry
+            backoff_second = min(self.data_ingestion_config.retry_max_second,
+                                 self.data_ingestion_config.retry_base_second * (2 ** attempt))
+            wait_second = random.uniform(backoff_second / 2, backoff_second)
+            if download_result.wait_second is not None:
+                wait_second = max(wait_second, download_result.wait_second + random.uniform(0, 2))
+
+            self.n_retry_attempt += 1
+            self.retry_wait_second += wait_second
+            logging.info(f"Retrying {download_url.url} in [{wait_second:.1f}] seconds, "
+                         f"[{download_url.n_retry}] retries left")
+            return time.monotonic() + wait_second, download_url._replace(n_retry=download_url.n_retry - 1)
         except Exception as e:
             raise FinanceException(e, sys)   
 
     def convert_files_to_parquet(self)-> str:
         try:
-            json_data_dir = self.data_ingestion_config.download_dir
             data_dir = self.data_ingestion_config.feature_store_dir
             output_file_name = self.data_ingestion_config.file_name
             os.makedirs(data_dir, exist_ok=True)
@@ -149,22 +429,218 @@ class DataIngestion:
             
             logging.info(f"Parquet file will be created at: {file_path}")
 
-            if not os.path.exists(json_data_dir):
+            # only files completed since the last conversion are read, a file
+            # changed after its download is sent back to be downloaded again
+            manifest_entries: List[ManifestEntry] = []
+            for manifest_entry in self.manifest.unconverted_entries:
+                if (not os.path.exists(manifest_entry.file_path) or
+                        get_file_checksum(manifest_entry.file_path) != manifest_entry.checksum):
+                    logging.info(f"Checksum mismatch for file: [{manifest_entry.file_path}] hence marking it failed")
+                    self.manifest.update_entry(from_date=manifest_entry.from_date, to_date=manifest_entry.to_date,
+                                               status=DataIngestionManifest.FAILED)
+                    continue
+                manifest_entries.append(manifest_entry)
+
+            if len(manifest_entries) == 0:
                 return file_path
+            json_file_paths = [manifest_entry.file_path for manifest_entry in manifest_entries]
+            json_file_names = [os.path.basename(json_file_path) for json_file_path in json_file_paths]
+
+            # every downloaded file is read in one scan with the declared schema,
+            # so spark does not run a schema inference job per file. Records not
+            # matching the declared types are kept aside in the corrupt record column.
+            # The parsed rows are persisted before being split: spark refuses a query on the
+            # raw json referencing only the corrupt record column, and pruning the other
+            # columns would also stop type mismatches from being flagged.
+            corrupt_record = self.schema.col_corrupt_record
+            dataframe: DataFrame = (spark_session.read
+                                    .schema(self.schema.raw_dataframe_schema)
+                                    .option("mode", "PERMISSIVE")
+                                    .option("columnNameOfCorruptRecord", corrupt_record)
+                                    .json(json_file_paths)
+                                    .withColumn(SOURCE_FILE_NAME, regexp_extract(input_file_name(), r"([^/]+)$", 1))
+                                    .persist(StorageLevel.MEMORY_AND_DISK))
+
+            # row counts are collected as metrics of the write itself instead of separate jobs. Rows
+            # per file are known from the download, only the file names of the rare rejected rows
+            # are gathered to count the accepted rows of each file
+            observation = Observation("data_ingestion")
+            is_accepted = col(corrupt_record).isNull()
+            observed_dataframe = dataframe.observe(observation,
+                                                   count(lit(1)).alias(TOTAL_ROW),
+                                                   collect_list(when(~is_accepted, col(SOURCE_FILE_NAME)))
+                                                   .alias(REJECTED_FILE_NAME))
+
+            logging.info(f"Converting [{len(json_file_names)}] files into parquet format at {file_path}")
+            year_column, month_column = self.schema.partition_columns
+            batch_dataframe = (observed_dataframe.filter(is_accepted)
+                               .drop(SOURCE_FILE_NAME, corrupt_record)
+                               .withColumn(year_column, year(col(self.schema.col_date_received)))
+                               .withColumn(month_column, month(col(self.schema.col_date_received))))
+            # the api filters on date_received, so the batch only falls into months of the intervals
+            self.merge_into_feature_store(dataframe=batch_dataframe, file_path=file_path,
+                                          from_date=min(entry.from_date for entry in manifest_entries),
+                                          to_date=max(entry.to_date for entry in manifest_entries))
+
+            metrics = observation.get
+            n_rejected_row_by_file = Counter(metrics.get(REJECTED_FILE_NAME) or [])
+            n_rejected_row = sum(n_rejected_row_by_file.values())
+            # rows of files whose record count was not kept at download are not known per file
+            self.row_count_by_file = {os.path.basename(entry.file_path):
+                                      entry.n_row - n_rejected_row_by_file[os.path.basename(entry.file_path)]
+                                      for entry in manifest_entries if entry.n_row is not None}
+            logging.info(f"[{metrics.get(TOTAL_ROW) or 0}] rows read, [{n_rejected_row}] rejected, "
+                         f"rows accepted per file: {self.row_count_by_file}")
+            for manifest_entry in manifest_entries:
+                self.manifest.update_entry(from_date=manifest_entry.from_date, to_date=manifest_entry.to_date,
+                                           is_converted=True)
+
+            # type mismatches are rare, the rejected area is only scanned for when there are some
+            if n_rejected_row > 0:
+                rejected_file_path = os.path.join(self.data_ingestion_config.rejected_dir, output_file_name)
+                logging.info(f"Writing [{n_rejected_row}] rows not matching the schema into: [{rejected_file_path}]")
+                (dataframe.filter(~is_accepted)
+                          .select(SOURCE_FILE_NAME, corrupt_record)
+                          .write.mode('append').parquet(rejected_file_path))
+            dataframe.unpersist()
+            return file_path
+        except Exception as e:
+            raise FinanceException(e, sys) 
+
+    def merge_into_feature_store(self, dataframe: DataFrame, file_path: str, from_date: str, to_date: str) -> int:
+        """
+        Appends the complaints of the batch whose complaint_id is not in the feature store yet,
+        so overlapping or repeated runs do not add duplicates. Stored keys are kept in a
+        compact index partitioned by the year/month of date_received like the store itself,
+        only the months of [from_date, to_date] and the month of missing dates are read, so the
+        cost of a merge follows the window of the batch and not the size of the store. A month
+        of the index is read whole, it holds a few bytes per complaint of that month.
+        New rows are appended to their year/month partitions, partitions without new
+        complaints are never rewritten.
+        Returns the number of rows added to the feature store.
+        """
+        try:
+            key_column = self.schema.col_complaint_id
+            key_index_dir = self.data_ingestion_config.key_index_dir
+            year_column, month_column = self.schema.partition_columns
+
+            self.migrate_legacy_feature_store(file_path=file_path)
+            if os.path.exists(key_index_dir) and any(file_name.startswith(LEGACY_KEY_BUCKET)
+                                                     for file_name in os.listdir(key_index_dir)):
+                logging.info(f"Dropping complaint_id index partitioned by hash bucket: [{key_index_dir}]")
+                shutil.rmtree(key_index_dir)
+            if not os.path.exists(key_index_dir) and os.path.exists(file_path):
+                logging.info(f"Building complaint_id index of existing feature store at: [{key_index_dir}]")
+                existing_dataframe = spark_session.read.schema(self.schema.feature_store_schema).parquet(file_path)
+                self.write_key_index(existing_dataframe)
+
+            # complaints without an id cannot be matched, each of them gets its own dedup key
+            # and, as a null key never matches the index, they are always added
+            dedup_key = coalesce(col(key_column), concat(lit("_"), monotonically_increasing_id().cast("string")))
+            batch_dataframe = (dataframe.withColumn(DEDUP_KEY, dedup_key)
+                               .dropDuplicates([DEDUP_KEY])
+                               .drop(DEDUP_KEY)
+                               .persist(StorageLevel.MEMORY_AND_DISK))
+
+            new_dataframe = batch_dataframe
+            if os.path.exists(key_index_dir):
+                from_date_obj = datetime.strptime(from_date, "%Y-%m-%d")
+                to_date_obj = datetime.strptime(to_date, "%Y-%m-%d")
+                year_month = col(year_column) * 100 + col(month_column)
+                existing_key_dataframe = (spark_session.read
+                                          .schema(self.key_index_schema)
+                                          .parquet(key_index_dir)
+                                          .filter(year_month.between(from_date_obj.year * 100 + from_date_obj.month,
+                                                                     to_date_obj.year * 100 + to_date_obj.month)
+                                                  | col(year_column).isNull())
+                                          .select(*[col(column).alias(f"{INDEX_PREFIX}{column}")
+                                                    for column in self.key_index_schema.names]))
+                is_indexed = ((col(key_column) == col(f"{INDEX_PREFIX}{key_column}"))
+                              & col(year_column).eqNullSafe(col(f"{INDEX_PREFIX}{year_column}"))
+                              & col(month_column).eqNullSafe(col(f"{INDEX_PREFIX}{month_column}")))
+                logging.info(f"Batch is matched against index months of window: [{from_date}, {to_date}]")
+                new_dataframe = batch_dataframe.join(existing_key_dataframe, on=is_indexed, how="left_anti")
+            new_dataframe = new_dataframe.persist(StorageLevel.MEMORY_AND_DISK)
+
+            # each month of the batch is written by a single task so it lands in one file per run
+            observation = Observation("feature_store_merge")
+            (new_dataframe.observe(observation, count(lit(1)).alias(TOTAL_ROW))
+                          .repartition(self.data_ingestion_config.n_output_file, year_column, month_column)
+                          .write.mode('append').partitionBy(year_column, month_column).parquet(file_path))
+            n_new_row = observation.get.get(TOTAL_ROW) or 0
+
+            # index is written after the data, a failure in between can only repeat rows, never lose them
+            self.write_key_index(new_dataframe.filter(col(key_column).isNotNull()))
+
+            new_dataframe.unpersist()
+            batch_dataframe.unpersist()
+            logging.info(f"[{n_new_row}] new rows merged into feature store: [{file_path}]")
+            return n_new_row
+        except Exception as e:
+            raise FinanceException(e, sys)
 
-            for file_name in os.listdir(json_data_dir):
-                json_file_path = os.path.join(json_data_dir, file_name)
-                logging.debug(f"Converting {json_file_path} into parquet format at {file_path}")
+    def is_legacy_feature_store(self, file_path: str) -> bool:
+        """
+        Feature store written before it was partitioned: parquet files at the top level, as
+        appended from json with inferred types.
+        """
+        return (os.path.isdir(file_path) and
+                any(file_name.endswith(".parquet") for file_name in os.listdir(file_path)))
+
+    def migrate_legacy_feature_store(self, file_path: str) -> None:
+        """
+        Rewrites a legacy feature store once into the year/month layout with the declared schema,
+        duplicated complaints appended by earlier runs are dropped. The legacy files are only
+        removed once the new layout is in place.
+        """
+        try:
+            if not self.is_legacy_feature_store(file_path=file_path):
+                return
+            migrating_file_path = f"{file_path}.migrating"
+            legacy_file_path = f"{file_path}.legacy"
+            logging.info(f"Migrating legacy feature store: [{file_path}] to year/month partitions")
+            shutil.rmtree(migrating_file_path, ignore_errors=True)
+            legacy_dataframe = spark_session.read.parquet(file_path)
+            # columns are cast from the types inferred from json, columns missing in old files are null
+            dataframe = legacy_dataframe.select(*[
+                (col(field.name) if field.name in legacy_dataframe.columns else lit(None))
+                .cast(field.dataType).alias(field.name) for field in self.schema.dataframe_schema.fields])
+            year_column, month_column = self.schema.partition_columns
+            key_column = self.schema.col_complaint_id
+            dedup_key = coalesce(col(key_column), concat(lit("_"), monotonically_increasing_id().cast("string")))
+            (dataframe.withColumn(DEDUP_KEY, dedup_key)
+                      .dropDuplicates([DEDUP_KEY])
+                      .drop(DEDUP_KEY)
+                      .withColumn(year_column, year(col(self.schema.col_date_received)))
+                      .withColumn(month_column, month(col(self.schema.col_date_received)))
+                      .repartition(self.data_ingestion_config.n_output_file, year_column, month_column)
+                      .write.partitionBy(year_column, month_column).parquet(migrating_file_path))
+            os.replace(file_path, legacy_file_path)
+            os.replace(migrating_file_path, file_path)
+            shutil.rmtree(legacy_file_path, ignore_errors=True)
+            # an index built on the legacy layout does not match the migrated one
+            shutil.rmtree(self.data_ingestion_config.key_index_dir, ignore_errors=True)
+            logging.info(f"Legacy feature store migrated: [{file_path}]")
+        except Exception as e:
+            raise FinanceException(e, sys)
 
-                df = spark_session.read.json(json_file_path)
+    @property
+    def key_index_schema(self) -> StructType:
+        year_column, month_column = self.schema.partition_columns
+        return StructType([StructField(self.schema.col_complaint_id, StringType()),
+                           StructField(year_column, IntegerType()),
+                           StructField(month_column, IntegerType())])
 
-                if df.count() > 0:
-                    df.write.mode('append').parquet(file_path)
-            return file_path
+    def write_key_index(self, dataframe: DataFrame) -> None:
+        try:
+            year_column, month_column = self.schema.partition_columns
+            (dataframe.select(*self.key_index_schema.names)
+                      .repartition(year_column, month_column)
+                      .write.mode('append').partitionBy(year_column, month_column)
+                      .parquet(self.data_ingestion_config.key_index_dir))
         except Exception as e:
-            raise FinanceException(e, sys) 
+            raise FinanceException(e, sys)
 
-    
     def write_metadata(self, file_path: str) -> None:
         try:
             logging.info("Writting metadata info into metadata file")
@@ -182,10 +658,9 @@ class DataIngestion:
         try:
             logging.info(f"Started downloading json file")
 
-            if self.data_ingestion_config.from_date != self.data_ingestion_config.to_date:
-                self.download_files()
+            self.download_files()
 
-            if os.path.exists(self.data_ingestion_config.download_dir):
+            if len(self.manifest.unconverted_entries) > 0:
                 logging.info("Converting and combining downloaded json into parquet file")
                 file_path = self.convert_files_to_parquet()
                 self.write_metadata(file_path=file_path)
@@ -195,7 +670,11 @@ class DataIngestion:
             artifact = DataIngestionArtifact(
                                     feature_store_file_path=feature_store_file_path,
                                     download_dir = self.data_ingestion_config.download_dir,
-                                    metadata_file_path = self.data_ingestion_config.metadata_file_path)
+                                    metadata_file_path = self.data_ingestion_config.metadata_file_path,
+                                    n_retry_attempt = self.n_retry_attempt,
+                                    retry_wait_second = self.retry_wait_second,
+                                    from_date = self.data_ingestion_config.from_date,
+                                    to_date = self.data_ingestion_config.to_date)
             
             logging.info(f"Data Ingestion Artifact: {artifact}")
             return artifact
@@ -4,15 +4,24 @@ from finance_complaint.exception import FinanceException
 from finance_complaint.logger import logging
 from finance_complaint.entity import DataTransformationConfig
 from finance_complaint.entity import DataValidationArtifact, DataTransformationArtifact
+from finance_complaint.entity import ColumnProfile, CategoryCount, CategoryCountMetadata
 from finance_complaint.ml.feature import FrequencyImputer, DerivedFeatureGenerator, FrequencyEncoder
+from finance_complaint.ml.feature import get_string_indexer_model_from_profile, get_partition_category_counts
+from finance_complaint.ml.feature import get_fused_pipeline_model, MemoizedTextFeaturizer
+from finance_complaint.data_access.feature_cache import FeatureCache
 
-from pyspark.sql import DataFrame
-from pyspark.sql.functions import col, rand
+from pyspark.sql import DataFrame, Column
+from pyspark.sql.functions import col, lit, count, xxhash64, pmod, sum as sql_sum
+from pyspark.sql.types import DecimalType
 from pyspark.ml.pipeline import Pipeline
 from pyspark.ml.feature import (StandardScaler, VectorAssembler, OneHotEncoder, 
-                                        StringIndexer, Imputer, IDF, Tokenizer, HashingTF)
+                                        StringIndexer, Imputer, StringIndexerModel)
+from typing import Dict, List, Optional, Tuple
+import hashlib
 import os, sys
 
+N_SPLIT_BUCKET = 10000
+
 
 class DataTransformation:
 
@@ -29,14 +38,215 @@ class DataTransformation:
     def read_data(self)->DataFrame:
         try:
             file_path = self.data_val_artifact.accepted_file_path
-            dataframe: DataFrame = spark_session.read.parquet(file_path)
+            from_date, to_date = self.data_tf_config.from_date, self.data_tf_config.to_date
+            dataframe: DataFrame = (spark_session.read
+                                    .schema(self.schema.required_dataframe_schema)
+                                    .parquet(file_path)
+                                    .filter(self.schema.get_date_window_filter(from_date=from_date, to_date=to_date)))
             dataframe.printSchema()
             return dataframe
         except Exception as e:
             raise FinanceException(e, sys)
 
-    def get_data_transformation_pipeline(self)-> Pipeline:
+    def get_test_split_filter(self) -> Column:
+        """
+        Rows of the test split, chosen by a hash of the row and the split seed instead of a random
+        number so that every row lands in the same split on each run.
+        """
+        try:
+            row_hash = xxhash64(*[col(column) for column in self.schema.required_dataframe_schema.fieldNames()],
+                                lit(self.data_tf_config.split_seed))
+            return pmod(row_hash, lit(N_SPLIT_BUCKET)) < lit(int(self.data_tf_config.test_size * N_SPLIT_BUCKET))
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    def split_data(self, dataframe: DataFrame) -> Tuple[DataFrame, DataFrame]:
+        try:
+            is_test = self.get_test_split_filter()
+            return dataframe.filter(~is_test), dataframe.filter(is_test)
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    def get_partition_signatures(self) -> Dict[Tuple[int, int], str]:
+        """
+        Signature of each year/month partition of the feature store within the training window.
+        Feature store partitions are append only, so the listing of their files changes exactly
+        when rows are added. Window bounds falling inside a partition and the category domains of
+        data validation are part of the signature as they decide which of its rows are accepted,
+        test size and split seed as they decide which of them are in the train split.
+        """
+        try:
+            feature_store_file_path = self.data_val_artifact.feature_store_file_path
+            year_column, month_column = self.schema.partition_columns
+            from_date, to_date = self.data_tf_config.from_date, self.data_tf_config.to_date
+            from_year_month = int(from_date[:4]) * 100 + int(from_date[5:7]) if from_date is not None else None
+            to_year_month = int(to_date[:4]) * 100 + int(to_date[5:7]) if to_date is not None else None
+            signatures: Dict[Tuple[int, int], str] = dict()
+            for year_dir in os.listdir(feature_store_file_path):
+                if not year_dir.startswith(f"{year_column}="):
+                    continue
+                year = int(year_dir.split("=", 1)[1])
+                for month_dir in os.listdir(os.path.join(feature_store_file_path, year_dir)):
+                    if not month_dir.startswith(f"{month_column}="):
+                        continue
+                    month = int(month_dir.split("=", 1)[1])
+                    year_month = year * 100 + month
+                    if from_year_month is not None and year_month < from_year_month:
+                        continue
+                    if to_year_month is not None and year_month > to_year_month:
+                        continue
+                    partition_dir = os.path.join(feature_store_file_path, year_dir, month_dir)
+                    file_sizes = sorted((file_name, os.path.getsize(os.path.join(partition_dir, file_name)))
+                                        for file_name in os.listdir(partition_dir)
+                                        if not file_name.startswith((".", "_")))
+                    window = (from_date if year_month == from_year_month else None,
+                              to_date if year_month == to_year_month else None)
+                    signature_data = repr((file_sizes, window, self.schema.categorical_domains,
+                                           self.data_tf_config.test_size, self.data_tf_config.split_seed))
+                    signatures[(year, month)] = hashlib.sha256(signature_data.encode("utf-8")).hexdigest()
+            return signatures
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    @staticmethod
+    def get_column_profile_from_counts(category_counts: List[CategoryCount],
+                                       columns: List[str]) -> Optional[Dict[str, ColumnProfile]]:
+        """
+        Column profile of the given columns from the sum of the category counts of several partitions.
+        """
+        try:
+            column_profile: Dict[str, ColumnProfile] = dict()
+            for column in columns:
+                merged_counts = dict()
+                for category_count in category_counts:
+                    for category, n_row in category_count.counts[column]:
+                        merged_counts[category] = merged_counts.get(category, 0) + n_row
+                null_count = merged_counts.pop(None, 0)
+                if len(merged_counts) == 0:
+                    logging.info(f"No category of [{column}] is counted")
+                    return None
+                top_categories = sorted([[category, n_row] for category, n_row in merged_counts.items()],
+                                        key=lambda category_n_row: (-category_n_row[1], category_n_row[0]))
+                column_profile[column] = ColumnProfile(total_row=sum(merged_counts.values()) + null_count,
+                                                       null_count=null_count,
+                                                       approx_distinct_count=len(top_categories),
+                                                       n_category=len(top_categories),
+                                                       top_categories=top_categories,
+                                                       is_complete=True,
+                                                       quantiles=None)
+            return column_profile
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    def get_incremental_column_profile(self, train_dataframe: DataFrame) -> Optional[Dict[str, ColumnProfile]]:
+        """
+        Column profile of the one hot encoding features merged from the category counts of the
+        train split rows of each feature store partition in the training window. Counts of partitions whose signature is
+        unchanged are read back from previous runs and the other partitions are counted together
+        in one job, so refit cost scales with the newly ingested data.
+        """
+        try:
+            feature_store_file_path = self.data_val_artifact.feature_store_file_path
+            if feature_store_file_path is None or not os.path.exists(feature_store_file_path):
+                logging.info("Feature store is not available, category counts are not kept")
+                return None
+            columns = self.schema.one_hot_encoding_features
+            category_count_metadata = CategoryCountMetadata(self.data_tf_config.category_count_dir)
+            signatures = self.get_partition_signatures()
+
+            category_counts: Dict[Tuple[int, int], CategoryCount] = dict()
+            stale_partitions = []
+            for partition, signature in signatures.items():
+                category_count = category_count_metadata.get_category_count(partition=partition)
+                if (category_count is None or category_count.signature != signature
+                        or any(column not in category_count.counts for column in columns)):
+                    stale_partitions.append(partition)
+                else:
+                    category_counts[partition] = category_count
+            logging.info(f"Counting categories of [{len(stale_partitions)}] of [{len(signatures)}] "
+                         f"feature store partitions")
+
+            if len(stale_partitions) > 0:
+                year_column, month_column = self.schema.partition_columns
+                year_month = col(year_column) * 100 + col(month_column)
+                dataframe = train_dataframe.filter(year_month.isin([year * 100 + month
+                                                                     for year, month in stale_partitions]))
+                partition_counts = get_partition_category_counts(dataframe=dataframe, columns=columns,
+                                                              partition_columns=self.schema.partition_columns)
+                for partition in stale_partitions:
+                    counts = partition_counts.get(partition, [[] for _ in columns])
+                    counts = {column: [[category, n_row] for category, n_row in column_counts]
+                              for column, column_counts in zip(columns, counts)}
+                    category_count = CategoryCount(signature=signatures[partition], counts=counts)
+                    category_count_metadata.write_category_count(partition=partition, category_count=category_count)
+                    category_counts[partition] = category_count
+
+            return self.get_column_profile_from_counts(category_counts=list(category_counts.values()),
+                                                       columns=columns)
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    def get_column_profile(self, train_dataframe: DataFrame) -> Optional[Dict[str, ColumnProfile]]:
+        """
+        Column profile of the one hot encoding features over the train split, category based
+        estimators are fitted from it when enabled in config. When enabled as well, incrementally
+        maintained category counts are used first.
+        """
+        try:
+            if not self.data_tf_config.use_column_profile:
+                return None
+            if self.data_tf_config.incremental_fit:
+                column_profile = self.get_incremental_column_profile(train_dataframe=train_dataframe)
+                if column_profile is not None:
+                    return column_profile
+            columns = self.schema.one_hot_encoding_features
+            counts = get_partition_category_counts(dataframe=train_dataframe, columns=columns,
+                                                   partition_columns=[]).get((), [[] for _ in columns])
+            category_count = CategoryCount(signature=None,
+                                           counts={column: [[category, n_row] for category, n_row in column_counts]
+                                                   for column, column_counts in zip(columns, counts)})
+            return self.get_column_profile_from_counts(category_counts=[category_count], columns=columns)
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    def get_data_fingerprint(self, dataframe: DataFrame) -> Tuple[int, str]:
+        """
+        Number of rows and a fingerprint of the accepted data computed in one job: the sum of a hash
+        of every row, which does not depend on row order or partitioning.
+        """
+        try:
+            row = dataframe.agg(count(lit(1)).alias("n_row"),
+                                sql_sum(xxhash64(*[col(column) for column in dataframe.columns])
+                                        .cast(DecimalType(38, 0))).alias("row_hash")).first()
+            return row["n_row"], f"{row['n_row']}_{row['row_hash']}"
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    def get_feature_cache_key(self, data_fingerprint: str, pipeline: Pipeline) -> str:
+        """
+        Key of the transformation output of the given data: stages of the pipeline definition with
+        their params, including the state of the stages already fitted from the column profile.
+        """
+        try:
+            stages = []
+            for stage in pipeline.getStages():
+                params = sorted((param.name, repr(stage.getOrDefault(param)))
+                                for param in stage.params if stage.isDefined(param))
+                if isinstance(stage, StringIndexerModel):
+                    params.append(("labelsArray", repr(stage.labelsArray)))
+                stages.append((type(stage).__name__, params))
+            definition = repr((data_fingerprint, stages, self.schema.required_columns,
+                               self.data_tf_config.test_size, self.data_tf_config.split_seed,
+                               self.data_tf_config.fuse_pipeline))
+            return hashlib.sha256(definition.encode("utf-8")).hexdigest()
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    def get_data_transformation_pipeline(self, train_dataframe: DataFrame)-> Pipeline:
         try:
+            # frequency imputer and string indexers are fitted from the column profile when available,
+            # pipeline keeps fitted models as they are
+            column_profile = self.get_column_profile(train_dataframe=train_dataframe)
             stages=[]
             derived_feature = DerivedFeatureGenerator(inputCols=self.schema.derived_input_features,
                                                       outputCols=self.schema.derived_output_features)
@@ -46,26 +256,35 @@ class DataTransformation:
             stages.append(imputer)
 
             frequency_imputer = FrequencyImputer(inputCols=self.schema.one_hot_encoding_features, 
-                                                 outputCols=self.schema.im_one_hot_encoding_features)
+                                                 outputCols=self.schema.im_one_hot_encoding_features,
+                                                 approximate=self.data_tf_config.imputer_approximate,
+                                                 sampleFraction=self.data_tf_config.imputer_sample_fraction)
+            if column_profile is not None:
+                frequency_imputer = frequency_imputer.fitFromProfile(columnProfile=column_profile)
             stages.append(frequency_imputer)
 
-            for im_one_hot_feature, string_indexer_col in zip(self.schema.im_one_hot_encoding_features, 
-                                                              self.schema.string_indexer_one_hot_features):
-                string_indexer = StringIndexer(inputCol=im_one_hot_feature, outputCol=string_indexer_col)
+            for one_hot_feature, im_one_hot_feature, string_indexer_col in zip(
+                    self.schema.one_hot_encoding_features,
+                    self.schema.im_one_hot_encoding_features,
+                    self.schema.string_indexer_one_hot_features):
+                if column_profile is not None:
+                    string_indexer = get_string_indexer_model_from_profile(
+                        column_profile=column_profile[one_hot_feature],
+                        inputCol=im_one_hot_feature, outputCol=string_indexer_col)
+                else:
+                    string_indexer = StringIndexer(inputCol=im_one_hot_feature, outputCol=string_indexer_col)
                 stages.append(string_indexer)
 
             one_hot_encoder = OneHotEncoder(inputCols=self.schema.string_indexer_one_hot_features,
                                             outputCols=self.schema.tf_one_hot_encoding_features)
             stages.append(one_hot_encoder)
 
-            tokenizer = Tokenizer(inputCol=self.schema.tfidf_features[0], outputCol="words")
-            stages.append(tokenizer)
-
-            hashing_tf = HashingTF(inputCol=tokenizer.getOutputCol(), outputCol="rawfeatures", numFeatures=40)
-            stages.append(hashing_tf)
-
-            idf = IDF(inputCol=hashing_tf.getOutputCol(), outputCol=self.schema.tf_tfidf_features[0])
-            stages.append(idf)
+            # tokenizer, hashing tf and idf applied once per distinct issue
+            text_featurizer = MemoizedTextFeaturizer(inputCol=self.schema.tfidf_features[0],
+                                                     outputCol=self.schema.tf_tfidf_features[0],
+                                                     tokensCol="words", rawFeaturesCol="rawfeatures", numFeatures=40,
+                                                     maxDistinct=self.data_tf_config.text_max_distinct)
+            stages.append(text_featurizer)
 
             vector_assembler = VectorAssembler(inputCols=self.schema.input_features, 
                                                outputCol=self.schema.vector_assembler_output)
@@ -89,20 +308,48 @@ class DataTransformation:
             logging.info(f"{'>>'*20} Data Transformation Started {'<<'*20}")
             dataframe: DataFrame = self.read_data()
 
-            logging.info(f"Number of row: [{dataframe.count()}] and column: [{len(dataframe.columns)}]")
+            n_row, data_fingerprint = self.get_data_fingerprint(dataframe=dataframe)
+            logging.info(f"Number of row: [{n_row}] and column: [{len(dataframe.columns)}]")
 
-            test_size = self.data_tf_config.test_size
+            export_pipeline_file_path = self.data_tf_config.export_pipeline_dir
+            transformed_train_data_file_path = os.path.join(self.data_tf_config.tranformed_train_dir,
+                                                            self.data_tf_config.file_name)
+            transformed_test_data_file_path = os.path.join(self.data_tf_config.tranformed_test_dir,
+                                                           self.data_tf_config.file_name)
 
+            test_size = self.data_tf_config.test_size
             logging.info(f"Splitting dataset into train and test set using ratio: {1-test_size}:{test_size}")
-            train_dataframe, test_dataframe = dataframe.randomSplit([1-test_size, test_size])
+            train_dataframe, test_dataframe = self.split_data(dataframe=dataframe)
+
+            pipeline = self.get_data_transformation_pipeline(train_dataframe=train_dataframe)
+            feature_cache, cache_key = None, None
+            if self.data_tf_config.use_feature_cache:
+                feature_cache = FeatureCache(cache_dir=self.data_tf_config.feature_cache_dir,
+                                             max_byte=self.data_tf_config.feature_cache_max_byte,
+                                             max_entry=self.data_tf_config.feature_cache_max_entry)
+                cache_key = self.get_feature_cache_key(data_fingerprint=data_fingerprint, pipeline=pipeline)
+                feature_cache_entry = feature_cache.get(key=cache_key)
+                if feature_cache_entry is not None:
+                    # outputs are linked into this run, later stages do not depend on the entry surviving eviction
+                    feature_cache_entry = feature_cache.restore(entry=feature_cache_entry,
+                                                                pipeline_file_path=export_pipeline_file_path,
+                                                                train_file_path=transformed_train_data_file_path,
+                                                                test_file_path=transformed_test_data_file_path)
+                    data_tf_artifact = DataTransformationArtifact(
+                                        transformed_train_file_path=feature_cache_entry.train_file_path,
+                                        transformed_test_file_path=feature_cache_entry.test_file_path,
+                                        exported_pipeline_file_path=feature_cache_entry.pipeline_file_path)
+                    logging.info(f"Data Transformation Artifact served from feature cache: [{data_tf_artifact}]")
+                    return data_tf_artifact
 
             logging.info(f"Train dataset has number of row: [{train_dataframe.count()}] and"
                                    f" column: [{len(train_dataframe.columns)}]")
             logging.info(f"Test dataset has number of row: [{test_dataframe.count()}] and"
                                    f" column: [{len(test_dataframe.columns)}]")
 
-            pipeline = self.get_data_transformation_pipeline()
             transformed_pipeline = pipeline.fit(train_dataframe)
+            if self.data_tf_config.fuse_pipeline:
+                transformed_pipeline = get_fused_pipeline_model(pipeline_model=transformed_pipeline)
             required_columns = [self.schema.scaled_vector_input_features, self.schema.target_column]
 
             transformed_trained_dataframe = transformed_pipeline.transform(train_dataframe)
@@ -111,16 +358,10 @@ class DataTransformation:
             transformed_test_dataframe = transformed_pipeline.transform(test_dataframe)
             transformed_test_dataframe = transformed_test_dataframe.select(required_columns)
 
-            export_pipeline_file_path = self.data_tf_config.export_pipeline_dir
             os.makedirs(export_pipeline_file_path, exist_ok=True)
             os.makedirs(self.data_tf_config.tranformed_train_dir, exist_ok=True)
             os.makedirs(self.data_tf_config.tranformed_test_dir, exist_ok=True)
 
-            transformed_train_data_file_path = os.path.join(self.data_tf_config.tranformed_train_dir,
-                                                            self.data_tf_config.file_name)
-            transformed_test_data_file_path = os.path.join(self.data_tf_config.tranformed_test_dir,
-                                                            self.data_tf_config.file_name)
-            
             logging.info(f"Saving transformation pipeline at: [{export_pipeline_file_path}]")
             transformed_pipeline.save(export_pipeline_file_path)   
             
@@ -132,6 +373,12 @@ class DataTransformation:
             print(transformed_test_dataframe.count(), len(transformed_test_dataframe.columns))
             transformed_test_dataframe.write.parquet(transformed_test_data_file_path) 
 
+            if feature_cache is not None:
+                feature_cache.put(key=cache_key, pipeline_file_path=export_pipeline_file_path,
+                                  train_file_path=transformed_train_data_file_path,
+                                  test_file_path=transformed_test_data_file_path)
+                feature_cache.evict()
+
             data_tf_artifact = DataTransformationArtifact(
                                         transformed_train_file_path=transformed_train_data_file_path, 
                                         transformed_test_file_path=transformed_test_data_file_path, 
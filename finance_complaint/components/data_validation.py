@@ -1,19 +1,51 @@
 from finance_complaint.entity import DataIngestionArtifact, DataValidationArtifact
 from finance_complaint.entity import DataValidationConfig
 from finance_complaint.entity import FinanceDataSchema
+from finance_complaint.entity import ColumnProfile, ColumnProfileMetadata
 from finance_complaint.config.spark_manager import spark_session
 from finance_complaint.exception import FinanceException
 from finance_complaint.logger import logging
+from finance_complaint.utils import write_yaml_file
 
-from pyspark.sql.functions import lit, col
-from pyspark.sql import DataFrame
+from pyspark.sql.functions import (lit, col, count, when, approx_count_distinct, percentile_approx,
+                                   struct, array, explode, desc, row_number, concat_ws, current_date, date_add,
+                                   sum as sql_sum)
+from pyspark.sql.types import StringType, NumericType, TimestampType, LongType
+from pyspark.sql.window import Window
+from pyspark.sql import DataFrame, Column, Observation
+from pyspark import StorageLevel
 
 import os, sys
+import math
+import shutil
 from collections import namedtuple
-from typing import List, Dict
+from typing import List, Dict, Tuple
 
-MissingReport = namedtuple('MissingReport', ["total_row", "missing_row", "missing_percentage"])
-ERROR_MESSAGE = "error_msg"
+# bounds and distinct count are only meaningful for approximate reports, exact reports
+# have lower and upper bounds equal to missing_percentage
+MissingReport = namedtuple('MissingReport', ["total_row", "missing_row", "missing_percentage",
+                                             "missing_percentage_lower", "missing_percentage_upper",
+                                             "n_distinct", "n_distinct_upper", "is_approximate"],
+                           defaults=[None, None, None, None, False])
+VALIDATION_STATUS = "validation_status"
+ACCEPTED = "accepted"
+REJECTED = "rejected"
+REASON_CODE = "reason_code"
+MISSING_VALUE = "missing_value"
+INVALID_TYPE = "invalid_type"
+INVALID_DATE = "invalid_date"
+INVALID_CATEGORY = "invalid_category"
+TOTAL_ROW = "__total_row"
+REJECTED_ROW = "__rejected_row"
+NULL_COUNT = "__null_count"
+DISTINCT_COUNT = "__distinct_count"
+SINGLETON_COUNT = "__singleton_count"
+QUANTILE = "__quantile"
+PROFILE_PAIR = "__pair"
+PROFILE_COLUMN = "column"
+PROFILE_CATEGORY = "category"
+PROFILE_RANK = "rank"
+PROFILE_N_CATEGORY = "n_category"
 
 class DataValidation:
     def __init__(self, data_validation_config: DataValidationConfig,
@@ -28,10 +60,14 @@ class DataValidation:
 
     def read_data(self)->DataFrame:
         try:
-            dataframe: DataFrame = spark_session.read.parquet(
-                                        self.data_ingestion_artifact.feature_store_file_path).limit(10000)
-            logging.info(f"Dataframe is created using file: {self.data_ingestion_artifact.feature_store_file_path}")
-            logging.info(f"Number of row: {dataframe.count()} and column: {len(dataframe.columns)}")
+            from_date, to_date = self.data_validation_config.from_date, self.data_validation_config.to_date
+            dataframe: DataFrame = (spark_session.read
+                                    .schema(self.schema.feature_store_schema)
+                                    .parquet(self.data_ingestion_artifact.feature_store_file_path)
+                                    .filter(self.schema.get_date_window_filter(from_date=from_date, to_date=to_date)))
+            logging.info(f"Dataframe is created using file: {self.data_ingestion_artifact.feature_store_file_path} "
+                         f"for date window: [{from_date}, {to_date}]")
+            logging.info(f"Number of column: {len(dataframe.columns)}")
             return dataframe
         except Exception as e:
             raise FinanceException(e, sys)    
@@ -41,22 +77,202 @@ class DataValidation:
         try:
             missing_report: Dict[str:MissingReport] = dict()
             logging.info("Preparing missing report for each column")
-            number_of_row = dataframe.count()
+            # null count of every column and total row count are computed in a single aggregation job
+            null_count_columns = [count(when(col(column).isNull(), lit(1))).alias(column)
+                                  for column in dataframe.columns]
+            null_count_row = dataframe.agg(count(lit(1)).alias(TOTAL_ROW), *null_count_columns).collect()[0]
+            number_of_row = null_count_row[TOTAL_ROW]
 
             for column in dataframe.columns:
-                missing_row = dataframe.filter(f"{column} is null").count()
-                missing_percentage = (missing_row * 100) / number_of_row
+                missing_row = null_count_row[column]
+                missing_percentage = (missing_row * 100) / number_of_row if number_of_row else 0.0
                 missing_report[column] = MissingReport(total_row = number_of_row,
                                                         missing_row=missing_row,
-                                                        missing_percentage=missing_percentage)
+                                                        missing_percentage=missing_percentage,
+                                                        missing_percentage_lower=missing_percentage,
+                                                        missing_percentage_upper=missing_percentage)
             logging.info(f"Missing report prepared: {missing_report}")  
             return missing_report
         except Exception as e:
             raise FinanceException(e, sys) 
 
+    @staticmethod
+    def get_wilson_interval(n_success: int, n_trial: int, z: float) -> Tuple[float, float]:
+        """
+        Wilson score interval of a binomial proportion, which stays within [0, 1]
+        and remains usable for proportions close to 0 or 1 and small samples.
+        """
+        if n_trial == 0:
+            return 0.0, 1.0
+        proportion = n_success / n_trial
+        denominator = 1 + z ** 2 / n_trial
+        center = (proportion + z ** 2 / (2 * n_trial)) / denominator
+        half_width = z * math.sqrt(proportion * (1 - proportion) / n_trial + z ** 2 / (4 * n_trial ** 2)) / denominator
+        return max(0.0, center - half_width), min(1.0, center + half_width)
+
+    @staticmethod
+    def get_distinct_bounds(n_distinct: int, n_singleton: int, n_sample_row: int, n_row: int,
+                            sample_fraction: float) -> Tuple[int, int]:
+        """
+        Bounds of the distinct count of the full data from the distinct count of a sample. Every
+        value of the sample is in the full data, so n_distinct is a lower bound. Values seen once
+        in the sample stand for the rare values the sample misses, each of them is scaled by the
+        inverse sample fraction for the upper estimate, which cannot exceed one new value per
+        unsampled row.
+        """
+        n_unseen = min(n_singleton * (1 / sample_fraction - 1), max(n_row - n_sample_row, 0))
+        return n_distinct, math.ceil(n_distinct + n_unseen)
+
+    @staticmethod
+    def get_approximate_missing_report(dataframe: DataFrame, sample_fraction: float, confidence_z: float,
+                                       seed: int = 42) -> Dict[str, MissingReport]:
+        """
+        Missing percentage of each column is estimated from a bernoulli sample of the rows, with
+        Wilson confidence bounds at `confidence_z`. Distinct count is bounded from the counts of the
+        values of the same sample, see get_distinct_bounds. All statistics are computed in a single
+        job over the sample.
+        """
+        try:
+            missing_report: Dict[str:MissingReport] = dict()
+            logging.info(f"Preparing approximate missing report on sample fraction: [{sample_fraction}]")
+            sample_dataframe = dataframe.sample(withReplacement=False, fraction=sample_fraction, seed=seed)
+            value_pairs = [struct(lit(column).alias(PROFILE_COLUMN),
+                                  col(column).cast(StringType()).alias(PROFILE_CATEGORY))
+                           for column in dataframe.columns]
+            is_singleton = col(PROFILE_CATEGORY).isNotNull() & (col("count") == 1)
+            aggregate_rows = (sample_dataframe
+                              .select(explode(array(*value_pairs)).alias(PROFILE_PAIR))
+                              .select(f"{PROFILE_PAIR}.*")
+                              .groupBy(PROFILE_COLUMN, PROFILE_CATEGORY)
+                              .count()
+                              .groupBy(PROFILE_COLUMN)
+                              .agg(sql_sum("count").alias(TOTAL_ROW),
+                                   sql_sum(when(col(PROFILE_CATEGORY).isNull(), col("count"))).alias(NULL_COUNT),
+                                   count(col(PROFILE_CATEGORY)).alias(DISTINCT_COUNT),
+                                   count(when(is_singleton, lit(1))).alias(SINGLETON_COUNT))
+                              .collect())
+            aggregate_rows = {row[PROFILE_COLUMN]: row for row in aggregate_rows}
+            number_of_sample_row = next(iter(aggregate_rows.values()))[TOTAL_ROW] if aggregate_rows else 0
+            number_of_row = round(number_of_sample_row / sample_fraction)
+
+            for column in dataframe.columns:
+                aggregate_row = aggregate_rows.get(column)
+                missing_sample_row = (aggregate_row[NULL_COUNT] or 0) if aggregate_row is not None else 0
+                lower, upper = DataValidation.get_wilson_interval(n_success=missing_sample_row,
+                                                                  n_trial=number_of_sample_row,
+                                                                  z=confidence_z)
+                missing_percentage = ((missing_sample_row * 100) / number_of_sample_row
+                                      if number_of_sample_row else 0.0)
+                n_distinct, n_distinct_upper = DataValidation.get_distinct_bounds(
+                    n_distinct=aggregate_row[DISTINCT_COUNT] if aggregate_row is not None else 0,
+                    n_singleton=aggregate_row[SINGLETON_COUNT] if aggregate_row is not None else 0,
+                    n_sample_row=number_of_sample_row, n_row=number_of_row, sample_fraction=sample_fraction)
+                missing_report[column] = MissingReport(total_row=number_of_row,
+                                                       missing_row=round(missing_sample_row / sample_fraction),
+                                                       missing_percentage=missing_percentage,
+                                                       missing_percentage_lower=lower * 100,
+                                                       missing_percentage_upper=upper * 100,
+                                                       n_distinct=n_distinct,
+                                                       n_distinct_upper=n_distinct_upper,
+                                                       is_approximate=True)
+            logging.info(f"Approximate missing report prepared from [{number_of_sample_row}] "
+                         f"sampled rows: {missing_report}")
+            return missing_report
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    def write_missing_report(self, missing_report: Dict[str, MissingReport]) -> None:
+        try:
+            report = {column: dict(column_report._asdict()) for column, column_report in missing_report.items()}
+            logging.info(f"Writing missing report into file: [{self.data_validation_config.report_file_path}]")
+            write_yaml_file(file_path=self.data_validation_config.report_file_path, data=report)
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    def get_column_profile(self, dataframe: DataFrame) -> Dict[str, ColumnProfile]:
+        """
+        Profile of every column computed in two jobs. The first is one aggregation of null counts,
+        HyperLogLog distinct counts and approximate quantiles of numeric and timestamp columns.
+        The second unpivots all string columns into (column, category) pairs and groups them once
+        to get the exact category count and top k categories of each column.
+        """
+        try:
+            top_k = self.data_validation_config.profile_top_k
+            quantiles = self.data_validation_config.profile_quantiles
+            field_types = {field.name: field.dataType for field in dataframe.schema.fields}
+            category_columns = [column for column, data_type in field_types.items()
+                                if isinstance(data_type, StringType)]
+            quantile_columns = [column for column, data_type in field_types.items()
+                                if isinstance(data_type, (NumericType, TimestampType))]
+            logging.info(f"Preparing column profile, categories of: {category_columns} "
+                         f"and quantiles of: {quantile_columns}")
+
+            aggregate_columns = [count(lit(1)).alias(TOTAL_ROW)]
+            for column in dataframe.columns:
+                aggregate_columns.append(count(when(col(column).isNull(), lit(1))).alias(f"{column}{NULL_COUNT}"))
+                aggregate_columns.append(approx_count_distinct(col(column),
+                                                               rsd=self.data_validation_config.distinct_rsd)
+                                         .alias(f"{column}{DISTINCT_COUNT}"))
+            for column in quantile_columns:
+                # timestamps are profiled as epoch seconds
+                quantile_column = (col(column).cast(LongType()) if isinstance(field_types[column], TimestampType)
+                                   else col(column))
+                aggregate_columns.append(percentile_approx(quantile_column, quantiles,
+                                                           self.data_validation_config.profile_quantile_accuracy)
+                                         .alias(f"{column}{QUANTILE}"))
+            aggregate_row = dataframe.agg(*aggregate_columns).collect()[0]
+
+            top_categories: Dict[str, List] = {column: [] for column in category_columns}
+            n_category: Dict[str, int] = {column: 0 for column in category_columns}
+            if len(category_columns) > 0:
+                category_pairs = [struct(lit(column).alias(PROFILE_COLUMN), col(column).alias(PROFILE_CATEGORY))
+                                  for column in category_columns]
+                category_count_dataframe = (dataframe
+                                            .select(explode(array(*category_pairs)).alias(PROFILE_PAIR))
+                                            .select(f"{PROFILE_PAIR}.*")
+                                            .filter(col(PROFILE_CATEGORY).isNotNull())
+                                            .groupBy(PROFILE_COLUMN, PROFILE_CATEGORY)
+                                            .count())
+                # categories ranked by count descending then category, as StringIndexer frequencyDesc
+                column_window = Window.partitionBy(PROFILE_COLUMN)
+                top_category_rows = (category_count_dataframe
+                                     .withColumn(PROFILE_RANK, row_number().over(
+                                         column_window.orderBy(desc("count"), col(PROFILE_CATEGORY))))
+                                     .withColumn(PROFILE_N_CATEGORY, count(lit(1)).over(column_window))
+                                     .filter(col(PROFILE_RANK) <= top_k)
+                                     .collect())
+                for row in sorted(top_category_rows, key=lambda row: (row[PROFILE_COLUMN], row[PROFILE_RANK])):
+                    top_categories[row[PROFILE_COLUMN]].append([row[PROFILE_CATEGORY], row["count"]])
+                    n_category[row[PROFILE_COLUMN]] = row[PROFILE_N_CATEGORY]
+
+            column_profile: Dict[str, ColumnProfile] = dict()
+            for column in dataframe.columns:
+                is_category = column in top_categories
+                column_quantiles = aggregate_row[f"{column}{QUANTILE}"] if column in quantile_columns else None
+                column_profile[column] = ColumnProfile(
+                    total_row=aggregate_row[TOTAL_ROW],
+                    null_count=aggregate_row[f"{column}{NULL_COUNT}"],
+                    approx_distinct_count=aggregate_row[f"{column}{DISTINCT_COUNT}"],
+                    n_category=n_category[column] if is_category else None,
+                    top_categories=top_categories[column] if is_category else None,
+                    is_complete=is_category and n_category[column] <= top_k,
+                    quantiles=dict(zip(quantiles, column_quantiles)) if column_quantiles is not None else None)
+            logging.info(f"Column profile prepared for columns: {list(column_profile.keys())}")
+            return column_profile
+        except Exception as e:
+            raise FinanceException(e, sys)
+
     def get_unwanted_and_high_missing_value_columns(self, dataframe: DataFrame, threshold: float=0.2)-> List[str]:
         try:
-            missing_report: Dict[str, MissingReport] = self.get_missing_report(dataframe=dataframe)
+            dataframe = self.drop_columns(dataframe=dataframe, columns=[REASON_CODE, VALIDATION_STATUS])
+            if self.data_validation_config.is_approximate:
+                missing_report: Dict[str, MissingReport] = self.get_approximate_missing_report(
+                    dataframe=dataframe,
+                    sample_fraction=self.data_validation_config.sample_fraction,
+                    confidence_z=self.data_validation_config.confidence_z)
+            else:
+                missing_report: Dict[str, MissingReport] = self.get_missing_report(dataframe=dataframe)
+            self.write_missing_report(missing_report=missing_report)
 
             unwanted_column: List[str] = self.schema.unwanted_columns
             for column in missing_report:
@@ -67,29 +283,122 @@ class DataValidation:
         except Exception as e:
             raise FinanceException(e, sys)
 
-    def drop_unwanted_columns(self, dataframe: DataFrame)->DataFrame:
+    @staticmethod
+    def drop_columns(dataframe: DataFrame, columns: List[str]) -> DataFrame:
+        return dataframe.drop(*columns)
+
+    def get_dropped_columns(self, dataframe: DataFrame) -> List[str]:
+        """
+        Unwanted and mostly missing columns, left out of the accepted output only: rejected rows
+        keep every column so they can be traced back and reprocessed.
+        """
         try:
-            unwanted_columns: List = self.get_unwanted_and_high_missing_value_columns(dataframe=dataframe)
+            unwanted_columns: List = self.get_unwanted_and_high_missing_value_columns(
+                dataframe=dataframe, threshold=self.data_validation_config.missing_threshold)
             logging.info(f"Dropping feature: {','.join(unwanted_columns)}")
-            unwanted_dataframe: DataFrame = dataframe.select(unwanted_columns)
 
-            unwanted_dataframe = unwanted_dataframe.withColumn(ERROR_MESSAGE, lit("Contains many missing values"))
-            rejected_dir = os.path.join(self.data_validation_config.rejected_data_dir, "missing_data")
-            os.makedirs(rejected_dir, exist_ok=True)
+            # only the names of dropped columns are recorded, their values stay in the feature store
+            dropped_columns = {column: ("Unwanted column" if column in self.schema.unwanted_columns
+                                        else "Contains many missing values")
+                               for column in unwanted_columns}
+            logging.info(f"Writting dropped columns into file: [{self.data_validation_config.dropped_column_file_path}]")
+            write_yaml_file(file_path=self.data_validation_config.dropped_column_file_path, data=dropped_columns)
+            return unwanted_columns
+        except Exception as e:
+            raise FinanceException(e, sys)
 
-            file_path= os.path.join(rejected_dir, self.data_validation_config.file_name)
+    def get_validated_dataframe(self, dataframe: DataFrame) -> DataFrame:
+        """
+        Adds the validation status of every row and, for rejected rows, the comma separated reason
+        codes of the failed checks, e.g. "missing_value:issue,invalid_category:timely".
+        All checks are column expressions evaluated in a single projection.
+        """
+        try:
+            reason_codes: List[Column] = []
+            for column in self.schema.non_null_columns:
+                reason_codes.append(when(col(column).isNull(), lit(f"{MISSING_VALUE}:{column}")))
+            for column, pattern in self.schema.column_patterns.items():
+                reason_codes.append(when(col(column).isNotNull() & ~col(column).rlike(pattern),
+                                         lit(f"{INVALID_TYPE}:{column}")))
+            for column in self.schema.date_columns:
+                date_column = col(column).cast("date")
+                is_out_of_range = ((date_column < lit(self.schema.min_date).cast("date"))
+                                   | (date_column > date_add(current_date(), 1)))
+                reason_codes.append(when(col(column).isNotNull() & is_out_of_range, lit(f"{INVALID_DATE}:{column}")))
+            for column, domain in self.schema.categorical_domains.items():
+                reason_codes.append(when(col(column).isNotNull() & ~col(column).isin(domain),
+                                         lit(f"{INVALID_CATEGORY}:{column}")))
 
-            logging.info(f"Writting dropped column into file: [{file_path}]")
-            unwanted_dataframe.write.mode("append").parquet(file_path)
-            dataframe: DataFrame = dataframe.drop(*unwanted_columns)
-            logging.info(f"Remaining number of columns: [{dataframe.columns}]")
+            reason_code = concat_ws(",", *reason_codes)
+            dataframe = (dataframe
+                         .withColumn(REASON_CODE, when(reason_code != "", reason_code))
+                         .withColumn(VALIDATION_STATUS, when(col(REASON_CODE).isNull(), lit(ACCEPTED))
+                                     .otherwise(lit(REJECTED))))
             return dataframe
         except Exception as e:
             raise FinanceException(e, sys)
 
-    def is_required_columns_exist(self, dataframe: DataFrame):
+    def write_validated_data(self, dataframe: DataFrame, accepted_columns: List[str]) -> str:
+        """
+        Writes accepted rows with accepted_columns and rejected rows with every column and their
+        reason code into the staging directory, both from one scan of the persisted rows, then
+        moves each of them into place.
+        Returns the accepted file path.
+        """
+        try:
+            staging_file_path = os.path.join(self.data_validation_config.staging_data_dir,
+                                             self.data_validation_config.file_name)
+            dataframe = dataframe.persist(StorageLevel.MEMORY_AND_DISK)
+            observation = Observation("data_validation")
+            (dataframe.observe(observation, count(lit(1)).alias(TOTAL_ROW), count(col(REASON_CODE)).alias(REJECTED_ROW))
+                      .filter(col(VALIDATION_STATUS) == ACCEPTED)
+                      .select(*accepted_columns)
+                      .write.mode("overwrite")
+                      .partitionBy(*self.schema.partition_columns)
+                      .parquet(os.path.join(staging_file_path, f"{VALIDATION_STATUS}={ACCEPTED}")))
+            metrics = observation.get
+            n_rejected_row = metrics.get(REJECTED_ROW) or 0
+            logging.info(f"[{metrics.get(TOTAL_ROW) or 0}] rows validated, [{n_rejected_row}] rejected")
+            if n_rejected_row > 0:
+                (dataframe.filter(col(VALIDATION_STATUS) == REJECTED)
+                          .drop(VALIDATION_STATUS)
+                          .write.mode("overwrite")
+                          .partitionBy(*self.schema.partition_columns)
+                          .parquet(os.path.join(staging_file_path, f"{VALIDATION_STATUS}={REJECTED}")))
+            dataframe.unpersist()
+            return self.move_validated_data(staging_file_path=staging_file_path)
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    def move_validated_data(self, staging_file_path: str) -> str:
+        """
+        Moves the accepted and rejected partitions of the staging directory into place.
+        Returns the accepted file path.
+        """
+        try:
+            accepted_staging_path = os.path.join(staging_file_path, f"{VALIDATION_STATUS}={ACCEPTED}")
+            rejected_staging_path = os.path.join(staging_file_path, f"{VALIDATION_STATUS}={REJECTED}")
+            if not os.path.exists(accepted_staging_path):
+                raise Exception(f"No row passed validation, rejected rows are in: [{staging_file_path}]")
+
+            os.makedirs(self.data_validation_config.accepted_data_dir, exist_ok=True)
+            accepted_file_path = os.path.join(self.data_validation_config.accepted_data_dir,
+                                              self.data_validation_config.file_name)
+            shutil.move(accepted_staging_path, accepted_file_path)
+            if os.path.exists(rejected_staging_path):
+                os.makedirs(self.data_validation_config.invalid_row_dir, exist_ok=True)
+                rejected_file_path = os.path.join(self.data_validation_config.invalid_row_dir,
+                                                  self.data_validation_config.file_name)
+                logging.info(f"Moving rejected rows into: [{rejected_file_path}]")
+                shutil.move(rejected_staging_path, rejected_file_path)
+            shutil.rmtree(self.data_validation_config.staging_data_dir, ignore_errors=True)
+            return accepted_file_path
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    def is_required_columns_exist(self, columns: List[str]):
         try:
-            columns = list(filter(lambda x: x in self.schema.required_columns, dataframe.columns))
+            columns = list(filter(lambda x: x in self.schema.required_columns, columns))
 
             if len(columns) != len(self.schema.required_columns):
                 raise Exception(f"Required columns missing\n Expected columns: {self.schema.required_columns}\n\
@@ -97,27 +406,47 @@ class DataValidation:
         except Exception as e:
             raise FinanceException(e, sys)
 
+    def read_accepted_data(self, accepted_file_path: str, columns: List[str]) -> DataFrame:
+        try:
+            return (spark_session.read
+                    .schema(self.schema.get_dataframe_schema(columns))
+                    .parquet(accepted_file_path))
+        except Exception as e:
+            raise FinanceException(e, sys)
+
     def initiate_data_validation(self) -> DataValidationArtifact:
         try:
             logging.info(f"Initiating data validation")
             dataframe: DataFrame = self.read_data()
 
+            logging.info("Validating rows")
+            dataframe: DataFrame = self.get_validated_dataframe(dataframe=dataframe)
+
             logging.info("Dropping Unwanted Columns")
-            dataframe: DataFrame = self.drop_unwanted_columns(dataframe=dataframe)
+            dropped_columns = self.get_dropped_columns(dataframe=dataframe)
+            accepted_columns = [column for column in dataframe.columns
+                                if column not in dropped_columns and column not in (REASON_CODE, VALIDATION_STATUS)]
 
-            self.is_required_columns_exist(dataframe=dataframe)
+            self.is_required_columns_exist(columns=accepted_columns)
             logging.info(f"Saving validated data")
-            print(f"Row: [{dataframe.count()}] Columns: [{len(dataframe.columns)}]")
-            print(f"Expected Columns: [{self.schema.required_columns}]\nPresent Columns: [{dataframe.columns}]")
+            logging.info(f"Expected Columns: [{self.schema.required_columns}] "
+                         f"Present Columns: [{accepted_columns}]")
 
-            os.makedirs(self.data_validation_config.accepted_data_dir, exist_ok=True)
-            accepted_file_path = os.path.join(self.data_validation_config.accepted_data_dir,
-                                                self.data_validation_config.file_name)
+            accepted_file_path = self.write_validated_data(dataframe=dataframe, accepted_columns=accepted_columns)
 
-            dataframe.write.parquet(accepted_file_path)
+            # accepted rows are profiled from the written output
+            accepted_dataframe = self.read_accepted_data(accepted_file_path=accepted_file_path,
+                                                         columns=accepted_columns)
+            column_profile = self.get_column_profile(dataframe=accepted_dataframe)
+            logging.info(f"Writing column profile into file: [{self.data_validation_config.column_profile_file_path}]")
+            ColumnProfileMetadata(self.data_validation_config.column_profile_file_path).write_column_profile(
+                column_profile=column_profile)
 
             data_validation_artifact = DataValidationArtifact(accepted_file_path=accepted_file_path,
-                                                              rejected_dir=self.data_validation_config.rejected_data_dir)
+                                                              rejected_dir=self.data_validation_config.rejected_data_dir,
+                                                              report_file_path=self.data_validation_config.report_file_path,
+                                                              column_profile_file_path=self.data_validation_config.column_profile_file_path,
+                                                              feature_store_file_path=self.data_ingestion_artifact.feature_store_file_path)
             logging.info(f"Data Validation artifact: [{data_validation_artifact}]")
             return data_validation_artifact
         except Exception as e:
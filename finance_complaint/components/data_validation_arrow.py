@@ -0,0 +1,333 @@
+from finance_complaint.components.data_validation import (DataValidation, MissingReport, TOTAL_ROW,
+                                                          VALIDATION_STATUS, ACCEPTED, REJECTED, REASON_CODE,
+                                                          MISSING_VALUE, INVALID_TYPE, INVALID_DATE, INVALID_CATEGORY)
+from finance_complaint.entity import DataIngestionArtifact, DataValidationConfig
+from finance_complaint.entity import FinanceDataSchema, ColumnProfile
+from finance_complaint.exception import FinanceException
+from finance_complaint.logger import logging
+from finance_complaint.config.spark_manager import spark_session
+
+from pyspark.sql.types import (StructType, StringType, TimestampType, BooleanType, IntegerType, LongType,
+                               FloatType, DoubleType, NumericType)
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pandas as pd
+import numpy as np
+
+import os, sys
+from dateutil import tz
+from datetime import datetime, timedelta, tzinfo
+from typing import List, Dict
+
+SPARK_SESSION_TIME_ZONE = "spark.sql.session.timeZone"
+SPARK_BACKEND = "spark"
+PANDAS_BACKEND = "pandas"
+AUTO_BACKEND = "auto"
+
+ARROW_TYPES = {
+    StringType: pa.string(),
+    # spark timestamps are instants, written as utc adjusted microseconds
+    TimestampType: pa.timestamp("us", tz="UTC"),
+    BooleanType: pa.bool_(),
+    IntegerType: pa.int32(),
+    LongType: pa.int64(),
+    FloatType: pa.float32(),
+    DoubleType: pa.float64(),
+}
+
+
+def get_arrow_schema(schema: StructType) -> pa.Schema:
+    return pa.schema([pa.field(field.name, ARROW_TYPES[type(field.dataType)]) for field in schema.fields])
+
+
+def get_partitioning(columns: List[str], schema: FinanceDataSchema) -> ds.Partitioning:
+    """
+    Hive partitioning with the same directory layout spark writes with partitionBy.
+    """
+    fields = {field.name: field for field in get_arrow_schema(schema.feature_store_schema)}
+    partition_fields = [fields[column] if column in fields else pa.field(column, pa.string()) for column in columns]
+    return ds.partitioning(pa.schema(partition_fields), flavor="hive")
+
+
+def get_partition_window_expression(schema: FinanceDataSchema, from_date: str = None,
+                                    to_date: str = None) -> ds.Expression:
+    """
+    Condition on the year/month partition columns only, evaluated from directory names.
+    """
+    year, month = [ds.field(column) for column in schema.partition_columns]
+    expression = ds.scalar(True)
+    if from_date is not None:
+        from_date_obj = datetime.strptime(from_date, "%Y-%m-%d")
+        expression = expression & ((year > from_date_obj.year)
+                                   | ((year == from_date_obj.year) & (month >= from_date_obj.month)))
+    if to_date is not None:
+        to_date_obj = datetime.strptime(to_date, "%Y-%m-%d")
+        expression = expression & ((year < to_date_obj.year)
+                                   | ((year == to_date_obj.year) & (month <= to_date_obj.month)))
+    return expression
+
+
+def get_session_time_zone() -> tzinfo:
+    """
+    Time zone spark casts timestamps to dates in. It is read from the session config when the
+    session is already running, otherwise it is the default of that config, the local time zone
+    of the JVM, so no session is started for it.
+    """
+    if not spark_session.is_started:
+        return tz.tzlocal()
+    time_zone_name = spark_session.conf.get(SPARK_SESSION_TIME_ZONE)
+    time_zone = tz.gettz(time_zone_name)
+    if time_zone is None:
+        raise ValueError(f"Unknown time zone [{time_zone_name}] in [{SPARK_SESSION_TIME_ZONE}]")
+    return time_zone
+
+
+def get_window_expression(schema: FinanceDataSchema, from_date: str = None, to_date: str = None,
+                          time_zone: tzinfo = None) -> ds.Expression:
+    """
+    Arrow counterpart of FinanceDataSchema.get_date_window_filter, days are taken in the
+    time zone of the spark session.
+    """
+    time_zone = get_session_time_zone() if time_zone is None else time_zone
+    expression = get_partition_window_expression(schema=schema, from_date=from_date, to_date=to_date)
+    date_received = ds.field(schema.col_date_received)
+    timestamp_type = ARROW_TYPES[TimestampType]
+    if from_date is not None:
+        from_datetime = datetime.strptime(from_date, "%Y-%m-%d").replace(tzinfo=time_zone)
+        expression = expression & (date_received >= pa.scalar(from_datetime, type=timestamp_type))
+    if to_date is not None:
+        to_datetime = (datetime.strptime(to_date, "%Y-%m-%d") + timedelta(days=1)).replace(tzinfo=time_zone)
+        expression = expression & (date_received < pa.scalar(to_datetime, type=timestamp_type))
+    return expression
+
+
+def get_feature_store_dataset(file_path: str, schema: FinanceDataSchema, columns: List[str] = None) -> ds.Dataset:
+    dataframe_schema = (schema.feature_store_schema if columns is None
+                        else schema.get_dataframe_schema(columns))
+    return ds.dataset(file_path, format="parquet", schema=get_arrow_schema(dataframe_schema),
+                      partitioning=get_partitioning(schema.partition_columns, schema))
+
+
+def get_feature_store_row_count(file_path: str, schema: FinanceDataSchema, from_date: str = None,
+                                to_date: str = None) -> int:
+    """
+    Upper bound of the rows in the date window, read from parquet footers of the
+    partitions overlapping the window without scanning any data.
+    """
+    try:
+        dataset = get_feature_store_dataset(file_path=file_path, schema=schema)
+        return dataset.count_rows(filter=get_partition_window_expression(schema=schema, from_date=from_date,
+                                                                         to_date=to_date))
+    except Exception as e:
+        raise FinanceException(e, sys)
+
+
+class ArrowDataValidation(DataValidation):
+    """
+    DataValidation running in process on arrow tables and pandas, without spark, for
+    runs small enough that starting a JVM and scheduling jobs dominates the work.
+    Reads and writes the same files as the spark implementation.
+    """
+
+    def read_data(self) -> pd.DataFrame:
+        try:
+            from_date, to_date = self.data_validation_config.from_date, self.data_validation_config.to_date
+            dataset = get_feature_store_dataset(file_path=self.data_ingestion_artifact.feature_store_file_path,
+                                                schema=self.schema)
+            table = dataset.to_table(columns=self.schema.feature_store_schema.names,
+                                     filter=get_window_expression(schema=self.schema, from_date=from_date,
+                                                                  to_date=to_date))
+            dataframe = table.to_pandas()
+            logging.info(f"Dataframe is created using file: {self.data_ingestion_artifact.feature_store_file_path} "
+                         f"for date window: [{from_date}, {to_date}]")
+            logging.info(f"Number of row: {len(dataframe)} and column: {len(dataframe.columns)}")
+            return dataframe
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    @staticmethod
+    def get_missing_report(dataframe: pd.DataFrame) -> Dict[str, MissingReport]:
+        try:
+            missing_report: Dict[str, MissingReport] = dict()
+            logging.info("Preparing missing report for each column")
+            number_of_row = len(dataframe)
+            null_count = dataframe.isna().sum()
+            for column in dataframe.columns:
+                missing_row = int(null_count[column])
+                missing_percentage = (missing_row * 100) / number_of_row if number_of_row else 0.0
+                missing_report[column] = MissingReport(total_row=number_of_row,
+                                                       missing_row=missing_row,
+                                                       missing_percentage=missing_percentage,
+                                                       missing_percentage_lower=missing_percentage,
+                                                       missing_percentage_upper=missing_percentage)
+            logging.info(f"Missing report prepared: {missing_report}")
+            return missing_report
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    @staticmethod
+    def get_approximate_missing_report(dataframe: pd.DataFrame, sample_fraction: float, confidence_z: float,
+                                       seed: int = 42) -> Dict[str, MissingReport]:
+        try:
+            missing_report: Dict[str, MissingReport] = dict()
+            logging.info(f"Preparing approximate missing report on sample fraction: [{sample_fraction}]")
+            sample_dataframe = dataframe.sample(frac=sample_fraction, random_state=seed)
+            number_of_sample_row = len(sample_dataframe)
+            number_of_row = round(number_of_sample_row / sample_fraction)
+            null_count = sample_dataframe.isna().sum()
+            for column in dataframe.columns:
+                missing_sample_row = int(null_count[column])
+                lower, upper = DataValidation.get_wilson_interval(n_success=missing_sample_row,
+                                                                  n_trial=number_of_sample_row,
+                                                                  z=confidence_z)
+                missing_percentage = ((missing_sample_row * 100) / number_of_sample_row
+                                      if number_of_sample_row else 0.0)
+                value_counts = sample_dataframe[column].value_counts(dropna=True)
+                n_distinct, n_distinct_upper = DataValidation.get_distinct_bounds(
+                    n_distinct=len(value_counts), n_singleton=int((value_counts == 1).sum()),
+                    n_sample_row=number_of_sample_row, n_row=number_of_row, sample_fraction=sample_fraction)
+                missing_report[column] = MissingReport(total_row=number_of_row,
+                                                       missing_row=round(missing_sample_row / sample_fraction),
+                                                       missing_percentage=missing_percentage,
+                                                       missing_percentage_lower=lower * 100,
+                                                       missing_percentage_upper=upper * 100,
+                                                       n_distinct=n_distinct,
+                                                       n_distinct_upper=n_distinct_upper,
+                                                       is_approximate=True)
+            logging.info(f"Approximate missing report prepared from [{number_of_sample_row}] "
+                         f"sampled rows: {missing_report}")
+            return missing_report
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    @staticmethod
+    def drop_columns(dataframe: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+        return dataframe.drop(columns=[column for column in columns if column in dataframe.columns])
+
+    def get_validated_dataframe(self, dataframe: pd.DataFrame) -> pd.DataFrame:
+        try:
+            reason_code = np.full(len(dataframe), "", dtype=object)
+
+            def add_reason_code(mask: pd.Series, code: str):
+                mask = mask.to_numpy(dtype=bool)
+                reason_code[mask] = np.where(reason_code[mask] == "", code, reason_code[mask] + "," + code)
+
+            for column in self.schema.non_null_columns:
+                add_reason_code(dataframe[column].isna(), f"{MISSING_VALUE}:{column}")
+            for column, pattern in self.schema.column_patterns.items():
+                values = dataframe[column]
+                add_reason_code(values.notna() & ~values.str.contains(pattern, regex=True, na=False),
+                                f"{INVALID_TYPE}:{column}")
+            # dates are taken in the spark session time zone, as the cast to date of the spark checks
+            time_zone = get_session_time_zone()
+            min_date = pd.Timestamp(self.schema.min_date, tz=time_zone)
+            max_date = pd.Timestamp.now(tz=time_zone).normalize() + pd.Timedelta(days=1)
+            for column in self.schema.date_columns:
+                dates = dataframe[column].dt.tz_convert(time_zone).dt.normalize()
+                add_reason_code(dataframe[column].notna() & ((dates < min_date) | (dates > max_date)),
+                                f"{INVALID_DATE}:{column}")
+            for column, domain in self.schema.categorical_domains.items():
+                values = dataframe[column]
+                add_reason_code(values.notna() & ~values.isin(domain), f"{INVALID_CATEGORY}:{column}")
+
+            dataframe = dataframe.copy()
+            dataframe[REASON_CODE] = np.where(reason_code == "", None, reason_code)
+            dataframe[VALIDATION_STATUS] = np.where(reason_code == "", ACCEPTED, REJECTED)
+            return dataframe
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    def write_validated_data(self, dataframe: pd.DataFrame, accepted_columns: List[str]) -> str:
+        try:
+            staging_file_path = os.path.join(self.data_validation_config.staging_data_dir,
+                                             self.data_validation_config.file_name)
+            is_accepted = dataframe[VALIDATION_STATUS] == ACCEPTED
+            data_columns = [column for column in dataframe.columns if column not in (REASON_CODE, VALIDATION_STATUS)]
+            outputs = [(ACCEPTED, dataframe[is_accepted], get_arrow_schema(
+                            self.schema.get_dataframe_schema(accepted_columns))),
+                       (REJECTED, dataframe[~is_accepted], get_arrow_schema(
+                            self.schema.get_dataframe_schema(data_columns)).append(pa.field(REASON_CODE, pa.string())))]
+            for validation_status, status_dataframe, arrow_schema in outputs:
+                if len(status_dataframe) == 0:
+                    continue
+                table = pa.Table.from_pandas(status_dataframe[arrow_schema.names], schema=arrow_schema,
+                                             preserve_index=False)
+                ds.write_dataset(table, os.path.join(staging_file_path, f"{VALIDATION_STATUS}={validation_status}"),
+                                 format="parquet",
+                                 partitioning=get_partitioning(self.schema.partition_columns, self.schema),
+                                 existing_data_behavior="delete_matching")
+            logging.info(f"[{len(dataframe)}] rows validated, [{int((~is_accepted).sum())}] rejected")
+            return self.move_validated_data(staging_file_path=staging_file_path)
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    def read_accepted_data(self, accepted_file_path: str, columns: List[str]) -> pd.DataFrame:
+        try:
+            dataset = get_feature_store_dataset(file_path=accepted_file_path, schema=self.schema, columns=columns)
+            return dataset.to_table(columns=columns).to_pandas()
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    def get_column_profile(self, dataframe: pd.DataFrame) -> Dict[str, ColumnProfile]:
+        try:
+            top_k = self.data_validation_config.profile_top_k
+            quantiles = self.data_validation_config.profile_quantiles
+            field_types = {field.name: field.dataType for field in self.schema.feature_store_schema.fields}
+            total_row = len(dataframe)
+            column_profile: Dict[str, ColumnProfile] = dict()
+            for column in dataframe.columns:
+                values = dataframe[column]
+                data_type = field_types[column]
+                n_category, top_categories, column_quantiles = None, None, None
+                if isinstance(data_type, StringType):
+                    # ranked by count descending then category, as the spark profile
+                    category_counts = sorted(values.dropna().value_counts().items(),
+                                             key=lambda category_count: (-category_count[1], category_count[0]))
+                    n_category = len(category_counts)
+                    top_categories = [[str(category), int(n_row)] for category, n_row in category_counts[:top_k]]
+                if isinstance(data_type, (NumericType, TimestampType)) and values.notna().any():
+                    numbers = values.dropna()
+                    if isinstance(data_type, TimestampType):
+                        # timestamps are profiled as epoch seconds
+                        numbers = (numbers - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)
+                    quantile_values = numbers.astype(float).quantile(quantiles, interpolation="lower").tolist()
+                    if not isinstance(data_type, (FloatType, DoubleType)):
+                        quantile_values = [int(value) for value in quantile_values]
+                    column_quantiles = dict(zip(quantiles, quantile_values))
+                column_profile[column] = ColumnProfile(
+                    total_row=total_row,
+                    null_count=int(values.isna().sum()),
+                    approx_distinct_count=int(values.nunique(dropna=True)),
+                    n_category=n_category,
+                    top_categories=top_categories,
+                    is_complete=n_category is not None and n_category <= top_k,
+                    quantiles=column_quantiles)
+            logging.info(f"Column profile prepared for columns: {list(column_profile.keys())}")
+            return column_profile
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+
+def get_data_validation(data_validation_config: DataValidationConfig,
+                        data_ingestion_artifact: DataIngestionArtifact,
+                        schema=FinanceDataSchema()) -> DataValidation:
+    """
+    DataValidation of the configured backend. With the auto backend the row count of the
+    date window is read from parquet metadata and runs below the threshold use pandas.
+    """
+    try:
+        backend = data_validation_config.backend
+        if backend == AUTO_BACKEND:
+            n_row = get_feature_store_row_count(file_path=data_ingestion_artifact.feature_store_file_path,
+                                                schema=schema,
+                                                from_date=data_validation_config.from_date,
+                                                to_date=data_validation_config.to_date)
+            backend = PANDAS_BACKEND if n_row <= data_validation_config.pandas_max_row else SPARK_BACKEND
+            logging.info(f"Feature store window holds at most [{n_row}] rows, using [{backend}] backend")
+        if backend == PANDAS_BACKEND:
+            return ArrowDataValidation(data_validation_config=data_validation_config,
+                                       data_ingestion_artifact=data_ingestion_artifact, schema=schema)
+        return DataValidation(data_validation_config=data_validation_config,
+                              data_ingestion_artifact=data_ingestion_artifact, schema=schema)
+    except Exception as e:
+        raise FinanceException(e, sys)
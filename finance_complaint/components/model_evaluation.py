@@ -36,7 +36,11 @@ class ModelEvaluation:
     def read_data(self) -> DataFrame:
         try:
             file_path = self.data_validation_artifact.accepted_file_path
-            dataframe: DataFrame = spark_session.read.parquet(file_path)
+            from_date, to_date = self.model_eval_config.from_date, self.model_eval_config.to_date
+            dataframe: DataFrame = (spark_session.read
+                                    .schema(self.schema.required_dataframe_schema)
+                                    .parquet(file_path)
+                                    .filter(self.schema.get_date_window_filter(from_date=from_date, to_date=to_date)))
             return dataframe
         except Exception as e:
             # Raising an exception.
@@ -63,7 +67,8 @@ class ModelEvaluation:
             trained_model_file_path = self.model_trainer_artifact.model_trainer_ref_artifact.trained_model_file_path
             label_indexer_model_path = self.model_trainer_artifact.model_trainer_ref_artifact.label_indexer_model_file_path
 
-            #load required model and label index
+            #load required model and label index, loading models needs an active spark session
+            spark_session.get_session()
             label_indexer_model = StringIndexerModel.load(label_indexer_model_path)
             trained_model = PipelineModel.load(trained_model_file_path)
 
@@ -3,6 +3,7 @@ from finance_complaint.logger import logging
 from finance_complaint.entity import ModelPusherConfig
 from finance_complaint.entity import ModelTrainerArtifact, ModelPusherArtifact
 from finance_complaint.ml.estimator import ModelResolver
+from finance_complaint.config.spark_manager import spark_session
 from pyspark.ml.pipeline import PipelineModel
 import os, sys
 
@@ -21,6 +22,8 @@ class ModelPusher:
         try:
             trained_model_path = self.model_trainer_artifact.model_trainer_ref_artifact.trained_model_file_path
             saved_model_path = self.model_resolver.get_save_model_path
+            # loading models needs an active spark session
+            spark_session.get_session()
             model = PipelineModel.load(trained_model_path)
             model.save(saved_model_path)
             model.save(self.model_pusher_config.pusher_model_dir)
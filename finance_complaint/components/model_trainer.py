@@ -28,8 +28,9 @@ class ModelTrainer:
             train_file_path = self.data_transformation_artifact.transformed_train_file_path
             test_file_path = self.data_transformation_artifact.transformed_test_file_path
 
-            train_dataframe: DataFrame = spark_session.read.parquet(train_file_path)
-            test_dataframe: DataFrame = spark_session.read.parquet(test_file_path)
+            transformed_schema = self.schema.transformed_dataframe_schema
+            train_dataframe: DataFrame = spark_session.read.schema(transformed_schema).parquet(train_file_path)
+            test_dataframe: DataFrame = spark_session.read.schema(transformed_schema).parquet(test_file_path)
             print(f"Train row: {train_dataframe.count()} Test row: {test_dataframe.count()}")
 
             dataframes: List[DataFrame] = [train_dataframe, test_dataframe]
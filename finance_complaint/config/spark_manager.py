@@ -1,10 +1,30 @@
 from pyspark.sql import SparkSession
+import threading
 
-spark_session = SparkSession.builder.master('local[*]').appName('finance_complaint').getOrCreate()
-  #  .config("spark.executor.instances","1")
-  #  .config("spark.executor.memory","6g")
-  #  .config("spark.driver.memory","6g")
-  #  .config("spark.executor.memoryOverhead","8g")
-  #  .getOrCreate()
-  #  )
 
+class LazySparkSession:
+    """
+    Stands in for the SparkSession and creates it on first use, so that importing this
+    module does not start a JVM for stages running without spark.
+    """
+
+    def __init__(self):
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_started(self) -> bool:
+        return self._session is not None
+
+    def get_session(self) -> SparkSession:
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = SparkSession.builder.master('local[*]').appName('finance_complaint').getOrCreate()
+        return self._session
+
+    def __getattr__(self, name):
+        return getattr(self.get_session(), name)
+
+
+spark_session = LazySparkSession()
@@ -17,17 +17,55 @@ DATA_INGESTION_DOWNLOADED_DATA_DIR = "downloaded_files"
 DATA_INGESTION_FILE_NAME = "finance_complaint"
 DATA_INGESTION_FEATURE_STORE_DIR = "feature_store"
 DATA_INGESTION_FAILED_DIR = "failed_downloaded_files"
+DATA_INGESTION_REJECTED_DATA_DIR = "rejected_data"
 DATA_INGESTION_METADATA_FILE_NAME = "meta_info.yaml"
+DATA_INGESTION_VOLUME_FILE_NAME = "volume_info.yaml"
+DATA_INGESTION_MANIFEST_FILE_NAME = "manifest.yaml"
 DATA_INGESTION_MIN_START_DATE ='2022-07-01'
 DATA_INGESTION_DATA_SOURCE_URL = f"https://www.consumerfinance.gov/data-research/consumer-complaints/search/api/v1/" \
                       f"?date_received_max=<todate>&date_received_min=<fromdate>" \
                       f"&field=all&format=json"
+DATA_INGESTION_MAX_WORKERS = 4
+DATA_INGESTION_MAX_REQUEST_PER_SECOND = 2.0
+DATA_INGESTION_STREAM_DOWNLOAD = True
+DATA_INGESTION_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DATA_INGESTION_N_OUTPUT_FILE = 4
+DATA_INGESTION_KEY_INDEX_DIR = "complaint_id_index"
+# interval planning, each request aims at this payload size
+DATA_INGESTION_TARGET_INTERVAL_BYTE = 64 * 1024 * 1024
+DATA_INGESTION_DEFAULT_DAILY_BYTE = 4 * 1024 * 1024
+DATA_INGESTION_MAX_INTERVAL_DAY = 365
+DATA_INGESTION_RETRY_BASE_SECOND = 2
+DATA_INGESTION_RETRY_MAX_SECOND = 300
+# raw response cache, intervals ending more than CLOSED_AFTER_DAY days ago are cached
+DATA_INGESTION_CACHE_DIR = "raw_response_cache"
+DATA_INGESTION_CACHE_MAX_BYTE = 2 * 1024 * 1024 * 1024
+DATA_INGESTION_CACHE_MAX_AGE_DAY = 90
+DATA_INGESTION_CACHE_CLOSED_AFTER_DAY = 30
 
 #Data Validation related variables
 DATA_VALIDATION_DIR = "data_validation"
 DATA_VALIDATION_FILE_NAME = 'finance_complaint'
 DATA_VALIDATION_ACCEPTED_DATA_DIR = "accepted_data"
 DATA_VALIDATION_REJECTED_DATA_DIR = "rejected_data"
+DATA_VALIDATION_REPORT_FILE_NAME = "report.yaml"
+DATA_VALIDATION_STAGING_DIR = "staging"
+DATA_VALIDATION_INVALID_ROW_DIR = "invalid_row"
+DATA_VALIDATION_DROPPED_COLUMN_FILE_NAME = "dropped_columns.yaml"
+DATA_VALIDATION_MISSING_THRESHOLD = 0.2
+# approximate statistics are computed on a sample of the data with confidence bounds
+DATA_VALIDATION_APPROXIMATE = False
+DATA_VALIDATION_SAMPLE_FRACTION = 0.1
+DATA_VALIDATION_CONFIDENCE_Z = 1.96
+DATA_VALIDATION_DISTINCT_RSD = 0.05
+# column profile of accepted data, category based estimators are fitted from the train split instead
+DATA_VALIDATION_COLUMN_PROFILE_FILE_NAME = "column_profile.yaml"
+DATA_VALIDATION_PROFILE_TOP_K = 1000
+DATA_VALIDATION_PROFILE_QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+DATA_VALIDATION_PROFILE_QUANTILE_ACCURACY = 10000
+# backend is spark, pandas or auto, auto runs windows of at most PANDAS_MAX_ROW rows with pandas
+DATA_VALIDATION_BACKEND = "auto"
+DATA_VALIDATION_PANDAS_MAX_ROW = 200000
 
 #Data Transformation related variables
 DATA_TRANSFORMATION_DIR = "data_transformation"
@@ -36,6 +74,41 @@ DATA_TRANSFORMATION_TRAIN_DIR = 'train'
 DATA_TRANSFORMATION_TEST_DIR = 'test'
 DATA_TRANSFORMATION_FILE_NAME ="finance_complaint"
 DATA_TRANSFORMATION_TEST_SIZE = 0.3
+# rows are split by a hash of the row and this seed, every row stays in the same split across runs
+DATA_TRANSFORMATION_SPLIT_SEED = 42
+# fit category based estimators from the category counts of the train split in a single aggregation
+DATA_TRANSFORMATION_USE_COLUMN_PROFILE = True
+# without a column profile, frequency imputer takes the most frequent categories on a sample when approximate
+DATA_TRANSFORMATION_IMPUTER_APPROXIMATE = False
+DATA_TRANSFORMATION_IMPUTER_SAMPLE_FRACTION = 0.1
+# with the column profile enabled, train split category counts of each feature store partition are kept
+# across runs and only changed partitions are recounted
+DATA_TRANSFORMATION_INCREMENTAL_FIT = True
+DATA_TRANSFORMATION_CATEGORY_COUNT_DIR = "category_count"
+# compile consecutive fitted feature stages into a single projection
+DATA_TRANSFORMATION_FUSE_PIPELINE = True
+# text features with at most this many distinct values are featurized once per value
+DATA_TRANSFORMATION_TEXT_MAX_DISTINCT = 10000
+# outputs of previous runs are reused when accepted data and pipeline definition are unchanged
+DATA_TRANSFORMATION_USE_FEATURE_CACHE = True
+DATA_TRANSFORMATION_FEATURE_CACHE_DIR = "feature_cache"
+DATA_TRANSFORMATION_FEATURE_CACHE_MAX_BYTE = 20 * 1024 * 1024 * 1024
+DATA_TRANSFORMATION_FEATURE_CACHE_MAX_ENTRY = 5
+
+# Data Drift related variables
+DATA_DRIFT_DIR = "data_drift"
+DATA_DRIFT_BATCH_SKETCH_DIR = "batch_sketch"
+DATA_DRIFT_REFERENCE_SKETCH_FILE_NAME = "reference_sketch.npz"
+# date window of the feature store the reference sketch was built from
+DATA_DRIFT_REFERENCE_WINDOW_FILE_NAME = "reference_window.yaml"
+DATA_DRIFT_REPORT_FILE_NAME = "report.yaml"
+DATA_DRIFT_CMS_WIDTH = 1024
+DATA_DRIFT_CMS_DEPTH = 4
+# bin edges of numerical features, fixed so that histograms of every batch can be merged
+DATA_DRIFT_NUMERICAL_BIN_EDGES = [0, 1, 2, 3, 5, 7, 10, 14, 21, 30, 45, 60, 90, 180, 365]
+# metric is either psi or js
+DATA_DRIFT_METRIC = "psi"
+DATA_DRIFT_THRESHOLD = {"psi": 0.2, "js": 0.1}
 
 # Model Training related variables
 MODEL_TRAINER_DIR = "model_trainer"
@@ -0,0 +1,118 @@
+from finance_complaint.exception import FinanceException
+from finance_complaint.logger import logging
+from finance_complaint.utils import read_yaml_file, write_yaml_file
+from collections import namedtuple
+from typing import Optional
+import shutil
+import os, sys
+
+FeatureCacheEntry = namedtuple("FeatureCacheEntry", ["pipeline_file_path", "train_file_path", "test_file_path"])
+
+
+class FeatureCache:
+    """
+    Local cache of data transformation outputs: the fitted pipeline and the transformed train and
+    test data, stored under a key computed from the accepted data and the pipeline definition.
+    An entry is complete once its entry file is written, hits refresh the entry file so that
+    entries are evicted least recently used first, once there are more than `max_entry` of them
+    or the cache grows past `max_byte`. A hit is restored into the paths of the run, so evicting
+    the entry later does not remove outputs a run still points to.
+    """
+    ENTRY_FILE_NAME = "entry.yaml"
+
+    def __init__(self, cache_dir: str, max_byte: int, max_entry: int):
+        try:
+            self.cache_dir = cache_dir
+            self.max_byte = max_byte
+            self.max_entry = max_entry
+            os.makedirs(self.cache_dir, exist_ok=True)
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    def get_entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key: str) -> Optional[FeatureCacheEntry]:
+        try:
+            entry_dir = self.get_entry_dir(key)
+            entry_file_path = os.path.join(entry_dir, self.ENTRY_FILE_NAME)
+            if not os.path.exists(entry_file_path):
+                return None
+            entry = {name: os.path.join(entry_dir, relative_path)
+                     for name, relative_path in read_yaml_file(entry_file_path).items()}
+            os.utime(entry_file_path)
+            logging.info(f"Feature cache hit: [{entry_dir}]")
+            return FeatureCacheEntry(**entry)
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    def put(self, key: str, pipeline_file_path: str, train_file_path: str, test_file_path: str) -> FeatureCacheEntry:
+        try:
+            entry_dir = self.get_entry_dir(key)
+            temp_entry_dir = f"{entry_dir}.{os.getpid()}.part"
+            shutil.rmtree(temp_entry_dir, ignore_errors=True)
+            # paths are stored relative to the entry directory
+            entry = FeatureCacheEntry(pipeline_file_path="pipeline",
+                                      train_file_path=os.path.join("train", os.path.basename(train_file_path)),
+                                      test_file_path=os.path.join("test", os.path.basename(test_file_path)))
+            for source_path, relative_path in zip([pipeline_file_path, train_file_path, test_file_path], entry):
+                shutil.copytree(source_path, os.path.join(temp_entry_dir, relative_path))
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(temp_entry_dir, entry_dir)
+            write_yaml_file(file_path=os.path.join(entry_dir, self.ENTRY_FILE_NAME), data=dict(entry._asdict()))
+            logging.info(f"Cached transformation output at: [{entry_dir}]")
+            return FeatureCacheEntry(*[os.path.join(entry_dir, relative_path) for relative_path in entry])
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    @staticmethod
+    def link_or_copy(source_path: str, target_path: str):
+        """
+        Hard links a cached file into the run, files are copied when the cache is on another device.
+        """
+        try:
+            os.link(source_path, target_path)
+        except OSError:
+            shutil.copy2(source_path, target_path)
+
+    def restore(self, entry: FeatureCacheEntry, pipeline_file_path: str, train_file_path: str,
+                test_file_path: str) -> FeatureCacheEntry:
+        try:
+            restored_entry = FeatureCacheEntry(pipeline_file_path=pipeline_file_path, train_file_path=train_file_path,
+                                               test_file_path=test_file_path)
+            for source_path, target_path in zip(entry, restored_entry):
+                shutil.rmtree(target_path, ignore_errors=True)
+                shutil.copytree(source_path, target_path, copy_function=self.link_or_copy)
+            logging.info(f"Restored feature cache entry into: [{restored_entry}]")
+            return restored_entry
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    @staticmethod
+    def get_dir_size(dir_path: str) -> int:
+        return sum(os.path.getsize(os.path.join(path, file_name))
+                   for path, _, file_names in os.walk(dir_path) for file_name in file_names)
+
+    def evict(self) -> None:
+        try:
+            entries = []
+            for key in os.listdir(self.cache_dir):
+                entry_dir = self.get_entry_dir(key)
+                entry_file_path = os.path.join(entry_dir, self.ENTRY_FILE_NAME)
+                if not os.path.exists(entry_file_path):
+                    continue
+                entries.append((os.stat(entry_file_path).st_mtime, self.get_dir_size(entry_dir), entry_dir))
+
+            total_byte = sum(size for _, size, _ in entries)
+            n_entry = len(entries)
+            n_evicted = 0
+            for _, size, entry_dir in sorted(entries):
+                if n_entry <= self.max_entry and total_byte <= self.max_byte:
+                    break
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                total_byte -= size
+                n_entry -= 1
+                n_evicted += 1
+            logging.info(f"Evicted [{n_evicted}] feature cache entries, cache size: [{total_byte}] bytes")
+        except Exception as e:
+            raise FinanceException(e, sys)
@@ -0,0 +1,97 @@
+from finance_complaint.exception import FinanceException
+from finance_complaint.logger import logging
+from datetime import datetime, timedelta
+from typing import Optional
+import hashlib
+import shutil
+import gzip
+import time
+import os, sys
+
+
+class RawResponseCache:
+    """
+    Local cache of downloaded interval files, stored gzip compressed under the hash of
+    the datasource url and interval bounds. Only closed intervals, old enough not to
+    receive new complaints anymore, are cached. Entries are evicted once older than
+    `max_age_day` and, least recently used first, once the cache grows past `max_byte`.
+    """
+
+    def __init__(self, cache_dir: str, max_byte: int, max_age_day: int, closed_after_day: int):
+        try:
+            self.cache_dir = cache_dir
+            self.max_byte = max_byte
+            self.max_age_day = max_age_day
+            self.closed_after_day = closed_after_day
+            os.makedirs(self.cache_dir, exist_ok=True)
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    @staticmethod
+    def get_key(datasource_url: str, from_date: str, to_date: str) -> str:
+        return hashlib.sha256(f"{datasource_url}|{from_date}|{to_date}".encode("utf-8")).hexdigest()
+
+    def get_entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json.gz")
+
+    def is_cacheable(self, to_date: str) -> bool:
+        closed_date = datetime.now() - timedelta(days=self.closed_after_day)
+        return datetime.strptime(to_date, "%Y-%m-%d") < closed_date
+
+    def get(self, key: str, file_path: str) -> Optional[int]:
+        """
+        Writes the cached entry, decompressed, into file_path.
+        Returns the number of lines written or None if the entry is not cached.
+        """
+        try:
+            entry_path = self.get_entry_path(key)
+            if not os.path.exists(entry_path):
+                return None
+            temp_file_path = f"{file_path}.part"
+            n_line = 0
+            with gzip.open(entry_path, "rb") as cache_file_obj, open(temp_file_path, "wb") as file_obj:
+                for line in cache_file_obj:
+                    file_obj.write(line)
+                    n_line += 1
+            os.replace(temp_file_path, file_path)
+            # entries are evicted least recently used first
+            os.utime(entry_path)
+            logging.info(f"Served file: [{file_path}] from cache entry: [{entry_path}]")
+            return n_line
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    def put(self, key: str, file_path: str) -> None:
+        try:
+            entry_path = self.get_entry_path(key)
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+            temp_entry_path = f"{entry_path}.{os.getpid()}.part"
+            with open(file_path, "rb") as file_obj, gzip.open(temp_entry_path, "wb") as cache_file_obj:
+                shutil.copyfileobj(file_obj, cache_file_obj)
+            os.replace(temp_entry_path, entry_path)
+            logging.info(f"Cached file: [{file_path}] at: [{entry_path}]")
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    def evict(self) -> None:
+        try:
+            entries = []
+            for dir_path, _, file_names in os.walk(self.cache_dir):
+                for file_name in file_names:
+                    if file_name.endswith(".json.gz"):
+                        entry_path = os.path.join(dir_path, file_name)
+                        entry_stat = os.stat(entry_path)
+                        entries.append((entry_stat.st_mtime, entry_stat.st_size, entry_path))
+
+            expiry_time = time.time() - self.max_age_day * 24 * 60 * 60
+            total_byte = sum(size for _, size, _ in entries)
+            n_evicted = 0
+            for modified_time, size, entry_path in sorted(entries):
+                if modified_time >= expiry_time and total_byte <= self.max_byte:
+                    break
+                os.remove(entry_path)
+                total_byte -= size
+                n_evicted += 1
+            logging.info(f"Evicted [{n_evicted}] cache entries, cache size: [{total_byte}] bytes")
+        except Exception as e:
+            raise FinanceException(e, sys)
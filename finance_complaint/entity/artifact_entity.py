@@ -7,11 +7,28 @@ class DataIngestionArtifact:
     feature_store_file_path: str  # parquet file location
     metadata_file_path: str
     download_dir: str
+    n_retry_attempt: int = 0
+    retry_wait_second: float = 0.0
+    # date_received window of the ingested batch
+    from_date: str = None
+    to_date: str = None
 
 @dataclass
 class DataValidationArtifact:
     accepted_file_path: str
     rejected_dir: str
+    report_file_path: str
+    column_profile_file_path: str
+    # feature store the accepted data was validated from
+    feature_store_file_path: str = None
+
+@dataclass
+class DataDriftArtifact:
+    report_file_path: str
+    batch_sketch_file_path: str
+    reference_sketch_file_path: str
+    is_drift_found: bool
+    drift_score: float
 
 @dataclass
 class DataTransformationArtifact:
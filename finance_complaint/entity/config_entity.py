@@ -10,6 +10,9 @@ from datetime import datetime
 class TrainingPipelineConfig:
     pipeline_name:str = "artifact"
     artifact_dir:str = os.path.join(pipeline_name,TIMESTAMP)
+    # window of date_received used for training, None means no bound
+    data_from_date:str = None
+    data_to_date:str = None
 
 
 class DataIngestionConfig:
@@ -31,6 +34,8 @@ class DataIngestionConfig:
 
             self.data_ingestion_dir = os.path.join(data_ingestion_master_dir, TIMESTAMP)
             self.metadata_file_path = os.path.join(data_ingestion_master_dir, DATA_INGESTION_METADATA_FILE_NAME)
+            self.volume_file_path = os.path.join(data_ingestion_master_dir, DATA_INGESTION_VOLUME_FILE_NAME)
+            self.manifest_file_path = os.path.join(data_ingestion_master_dir, DATA_INGESTION_MANIFEST_FILE_NAME)
 
             data_ingestion_metadata = DataIngestionMetadata(metadata_file_path = self.metadata_file_path)
 
@@ -40,10 +45,26 @@ class DataIngestionConfig:
 
             self.download_dir = os.path.join(self.data_ingestion_dir, DATA_INGESTION_DOWNLOADED_DATA_DIR)
             self.failed_dir = os.path.join(self.data_ingestion_dir, DATA_INGESTION_FAILED_DIR)
+            self.rejected_dir = os.path.join(self.data_ingestion_dir, DATA_INGESTION_REJECTED_DATA_DIR)
             self.file_name = DATA_INGESTION_FILE_NAME
 
             self.feature_store_dir = os.path.join(data_ingestion_master_dir, DATA_INGESTION_FEATURE_STORE_DIR)
+            self.key_index_dir = os.path.join(self.feature_store_dir, DATA_INGESTION_KEY_INDEX_DIR)
+            self.target_interval_byte = DATA_INGESTION_TARGET_INTERVAL_BYTE
+            self.default_daily_byte = DATA_INGESTION_DEFAULT_DAILY_BYTE
+            self.max_interval_day = DATA_INGESTION_MAX_INTERVAL_DAY
+            self.retry_base_second = DATA_INGESTION_RETRY_BASE_SECOND
+            self.retry_max_second = DATA_INGESTION_RETRY_MAX_SECOND
+            self.cache_dir = os.path.join(data_ingestion_master_dir, DATA_INGESTION_CACHE_DIR)
+            self.cache_max_byte = DATA_INGESTION_CACHE_MAX_BYTE
+            self.cache_max_age_day = DATA_INGESTION_CACHE_MAX_AGE_DAY
+            self.cache_closed_after_day = DATA_INGESTION_CACHE_CLOSED_AFTER_DAY
             self.datasource_url = DATA_INGESTION_DATA_SOURCE_URL
+            self.max_workers = DATA_INGESTION_MAX_WORKERS
+            self.max_request_per_second = DATA_INGESTION_MAX_REQUEST_PER_SECOND
+            self.stream_download = DATA_INGESTION_STREAM_DOWNLOAD
+            self.download_chunk_size = DATA_INGESTION_DOWNLOAD_CHUNK_SIZE
+            self.n_output_file = DATA_INGESTION_N_OUTPUT_FILE
         
         except Exception as e:
             raise FinanceException(e, sys)
@@ -52,9 +73,27 @@ class DataValidationConfig:
     def __init__(self, training_pipeline_config: TrainingPipelineConfig)-> None:
         try:
             data_validation_dir = os.path.join(training_pipeline_config.artifact_dir, DATA_VALIDATION_DIR)
+            self.from_date = training_pipeline_config.data_from_date
+            self.to_date = training_pipeline_config.data_to_date
             self.accepted_data_dir = os.path.join(data_validation_dir, DATA_VALIDATION_ACCEPTED_DATA_DIR)
             self.rejected_data_dir = os.path.join(data_validation_dir, DATA_VALIDATION_REJECTED_DATA_DIR)
             self.file_name = DATA_VALIDATION_FILE_NAME
+            self.staging_data_dir = os.path.join(data_validation_dir, DATA_VALIDATION_STAGING_DIR)
+            self.invalid_row_dir = os.path.join(self.rejected_data_dir, DATA_VALIDATION_INVALID_ROW_DIR)
+            self.dropped_column_file_path = os.path.join(self.rejected_data_dir,
+                                                         DATA_VALIDATION_DROPPED_COLUMN_FILE_NAME)
+            self.report_file_path = os.path.join(data_validation_dir, DATA_VALIDATION_REPORT_FILE_NAME)
+            self.missing_threshold = DATA_VALIDATION_MISSING_THRESHOLD
+            self.is_approximate = DATA_VALIDATION_APPROXIMATE
+            self.sample_fraction = DATA_VALIDATION_SAMPLE_FRACTION
+            self.confidence_z = DATA_VALIDATION_CONFIDENCE_Z
+            self.distinct_rsd = DATA_VALIDATION_DISTINCT_RSD
+            self.column_profile_file_path = os.path.join(data_validation_dir, DATA_VALIDATION_COLUMN_PROFILE_FILE_NAME)
+            self.profile_top_k = DATA_VALIDATION_PROFILE_TOP_K
+            self.profile_quantiles = DATA_VALIDATION_PROFILE_QUANTILES
+            self.profile_quantile_accuracy = DATA_VALIDATION_PROFILE_QUANTILE_ACCURACY
+            self.backend = DATA_VALIDATION_BACKEND
+            self.pandas_max_row = DATA_VALIDATION_PANDAS_MAX_ROW
         except Exception as e:
             raise FinanceException(e, sys)
 
@@ -62,11 +101,49 @@ class DataTransformationConfig:
     def __init__(self, training_pipeline_config: TrainingPipelineConfig)-> None:
         try:
             data_transformation_dir = os.path.join(training_pipeline_config.artifact_dir, DATA_TRANSFORMATION_DIR)
+            # category counts outlive a single run, they are kept next to the feature store
+            data_transformation_master_dir = os.path.join(os.path.dirname(training_pipeline_config.artifact_dir),
+                                                          DATA_TRANSFORMATION_DIR)
+            self.from_date = training_pipeline_config.data_from_date
+            self.to_date = training_pipeline_config.data_to_date
             self.export_pipeline_dir = os.path.join(data_transformation_dir, DATA_TRANSFORMATION_PIPELINE_DIR)
             self.tranformed_train_dir = os.path.join(data_transformation_dir, DATA_TRANSFORMATION_TRAIN_DIR)
             self.tranformed_test_dir = os.path.join(data_transformation_dir, DATA_TRANSFORMATION_TEST_DIR)
             self.file_name = DATA_TRANSFORMATION_FILE_NAME
             self.test_size = DATA_TRANSFORMATION_TEST_SIZE
+            self.split_seed = DATA_TRANSFORMATION_SPLIT_SEED
+            self.use_column_profile = DATA_TRANSFORMATION_USE_COLUMN_PROFILE
+            self.imputer_approximate = DATA_TRANSFORMATION_IMPUTER_APPROXIMATE
+            self.imputer_sample_fraction = DATA_TRANSFORMATION_IMPUTER_SAMPLE_FRACTION
+            self.incremental_fit = DATA_TRANSFORMATION_INCREMENTAL_FIT
+            self.category_count_dir = os.path.join(data_transformation_master_dir, DATA_TRANSFORMATION_CATEGORY_COUNT_DIR)
+            self.fuse_pipeline = DATA_TRANSFORMATION_FUSE_PIPELINE
+            self.text_max_distinct = DATA_TRANSFORMATION_TEXT_MAX_DISTINCT
+            self.use_feature_cache = DATA_TRANSFORMATION_USE_FEATURE_CACHE
+            self.feature_cache_dir = os.path.join(os.path.dirname(training_pipeline_config.artifact_dir),
+                                                  DATA_TRANSFORMATION_FEATURE_CACHE_DIR)
+            self.feature_cache_max_byte = DATA_TRANSFORMATION_FEATURE_CACHE_MAX_BYTE
+            self.feature_cache_max_entry = DATA_TRANSFORMATION_FEATURE_CACHE_MAX_ENTRY
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+class DataDriftConfig:
+    def __init__(self, training_pipeline_config: TrainingPipelineConfig)-> None:
+        try:
+            # sketches outlive a single run, they are kept next to the feature store
+            data_drift_master_dir = os.path.join(os.path.dirname(training_pipeline_config.artifact_dir), DATA_DRIFT_DIR)
+            data_drift_dir = os.path.join(training_pipeline_config.artifact_dir, DATA_DRIFT_DIR)
+            self.from_date = training_pipeline_config.data_from_date
+            self.to_date = training_pipeline_config.data_to_date
+            self.batch_sketch_dir = os.path.join(data_drift_master_dir, DATA_DRIFT_BATCH_SKETCH_DIR)
+            self.reference_sketch_file_path = os.path.join(data_drift_master_dir, DATA_DRIFT_REFERENCE_SKETCH_FILE_NAME)
+            self.reference_window_file_path = os.path.join(data_drift_master_dir, DATA_DRIFT_REFERENCE_WINDOW_FILE_NAME)
+            self.report_file_path = os.path.join(data_drift_dir, DATA_DRIFT_REPORT_FILE_NAME)
+            self.cms_width = DATA_DRIFT_CMS_WIDTH
+            self.cms_depth = DATA_DRIFT_CMS_DEPTH
+            self.numerical_bin_edges = DATA_DRIFT_NUMERICAL_BIN_EDGES
+            self.metric = DATA_DRIFT_METRIC
+            self.threshold = DATA_DRIFT_THRESHOLD[DATA_DRIFT_METRIC]
         except Exception as e:
             raise FinanceException(e, sys)
 
@@ -88,6 +165,8 @@ class ModelEvaluationConfig:
         try:
             self.model_evaluation_dir = os.path.join(training_pipeline_config.artifact_dir,
                                                         MODEL_EVALUATION_DIR)
+            self.from_date = training_pipeline_config.data_from_date
+            self.to_date = training_pipeline_config.data_to_date
             self.threshold=MODEL_EVALUATION_THRESHOLD_VALUE
             self.metric_list = MODEL_EVALUATION_METRIC_NAMES
         except Exception as e:
@@ -108,7 +187,9 @@ class BatchPredictionConfig:
             self.inbox_dir = os.path.join("data","inbox")
             self.outbox_dir = os.path.join("data","outbox")
             self.archive_dir = os.path.join("data","archive")
+            self.rejected_dir = os.path.join("data","rejected")
             os.makedirs(self.outbox_dir, exist_ok=True)
             os.makedirs(self.archive_dir, exist_ok=True)
+            os.makedirs(self.rejected_dir, exist_ok=True)
         except Exception as e:
             raise FinanceException(e, sys)
@@ -3,6 +3,10 @@ from collections import namedtuple
 from finance_complaint.exception import FinanceException
 from finance_complaint.utils import read_yaml_file, write_yaml_file
 from finance_complaint.logger import logging
+from typing import Dict, Tuple, List, Optional, Set
+from datetime import datetime, timedelta
+import pandas as pd
+import threading
 import os, sys
 
 DataIngestionMetadataInfo = namedtuple("DataIngestionMetadataInfo", ["from_date", "to_date","data_file_path"])
@@ -37,3 +41,190 @@ class DataIngestionMetadata:
             return metadata_info
         except Exception as e:
             raise FinanceException(e, sys)
+
+
+DailyVolume = namedtuple("DailyVolume", ["n_byte", "n_row"])
+
+
+class DataIngestionVolumeMetadata:
+    """
+    Bytes and rows returned by the datasource for each day of date_received, used
+    to plan download intervals of a similar payload size.
+    """
+    def __init__(self, volume_file_path):
+        self.volume_file_path = volume_file_path
+
+    @property
+    def is_volume_file_present(self)-> bool:
+        return os.path.exists(self.volume_file_path)
+
+    def get_daily_volume(self) -> Dict[str, DailyVolume]:
+        try:
+            if not self.is_volume_file_present:
+                return dict()
+            volume_info = read_yaml_file(self.volume_file_path) or dict()
+            return {day: DailyVolume(**volume) for day, volume in volume_info.items()}
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    def write_interval_volume(self, interval_volume: Dict[Tuple[str, str], DailyVolume]):
+        """
+        Spreads the volume observed for each downloaded interval evenly over its days
+        and merges it into the volume file. Intervals end before their to_date, the next
+        interval starts on it.
+        """
+        try:
+            daily_volume = self.get_daily_volume()
+            for (from_date, to_date), volume in interval_volume.items():
+                days = pd.date_range(start=from_date, end=to_date, freq="D",
+                                     inclusive="left").strftime("%Y-%m-%d").tolist()
+                if len(days) == 0:
+                    continue
+                for day in days:
+                    daily_volume[day] = DailyVolume(n_byte=volume.n_byte // len(days),
+                                                    n_row=volume.n_row // len(days))
+            write_yaml_file(file_path=self.volume_file_path,
+                            data={day: dict(volume._asdict()) for day, volume in sorted(daily_volume.items())})
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+
+ManifestEntry = namedtuple("ManifestEntry", ["from_date", "to_date", "file_path", "status",
+                                             "checksum", "n_row", "is_converted"])
+
+
+class DataIngestionManifest:
+    """
+    Status of every download interval, persisted after each change so that a run
+    dying mid-backfill can be resumed: only pending or failed intervals are fetched
+    again and only downloaded files not converted yet are read into the feature store.
+    """
+    PENDING = "pending"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, manifest_file_path):
+        self.manifest_file_path = manifest_file_path
+        self.lock = threading.Lock()
+        self.entries: Dict[str, ManifestEntry] = self.read_entries()
+
+    @staticmethod
+    def get_key(from_date: str, to_date: str) -> str:
+        return f"{from_date}_{to_date}"
+
+    def read_entries(self) -> Dict[str, ManifestEntry]:
+        try:
+            if not os.path.exists(self.manifest_file_path):
+                return dict()
+            manifest = read_yaml_file(self.manifest_file_path) or dict()
+            return {key: ManifestEntry(**entry) for key, entry in manifest.items()}
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    def get_entry(self, from_date: str, to_date: str) -> Optional[ManifestEntry]:
+        return self.entries.get(self.get_key(from_date, to_date))
+
+    def update_entry(self, from_date: str, to_date: str, **kwargs) -> ManifestEntry:
+        try:
+            key = self.get_key(from_date, to_date)
+            with self.lock:
+                entry = self.entries.get(key, ManifestEntry(from_date=from_date, to_date=to_date, file_path=None,
+                                                            status=self.PENDING, checksum=None, n_row=None,
+                                                            is_converted=False))
+                entry = entry._replace(**kwargs)
+                self.entries[key] = entry
+                write_yaml_file(file_path=self.manifest_file_path,
+                                data={key: dict(entry._asdict()) for key, entry in self.entries.items()})
+            return entry
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    @property
+    def covered_days(self) -> Set[str]:
+        """
+        Days of [from_date, to_date) of every interval in the manifest, whatever its status.
+        """
+        covered_days = set()
+        for entry in self.entries.values():
+            day = datetime.strptime(entry.from_date, "%Y-%m-%d")
+            to_date = datetime.strptime(entry.to_date, "%Y-%m-%d")
+            while day < to_date:
+                covered_days.add(day.strftime("%Y-%m-%d"))
+                day += timedelta(days=1)
+        return covered_days
+
+    @property
+    def incomplete_entries(self) -> List[ManifestEntry]:
+        return [entry for entry in self.entries.values() if entry.status != self.DONE]
+
+    @property
+    def unconverted_entries(self) -> List[ManifestEntry]:
+        return [entry for entry in self.entries.values() if entry.status == self.DONE and not entry.is_converted]
+
+
+ColumnProfile = namedtuple("ColumnProfile", ["total_row", "null_count", "approx_distinct_count", "n_category",
+                                             "top_categories", "is_complete", "quantiles"])
+
+
+class ColumnProfileMetadata:
+    """
+    Statistics of every accepted column written by data validation, so that downstream
+    stages can fit category based estimators without scanning the data again.
+    top_categories is a list of [category, count] ordered by count descending then category
+    and is_complete tells whether it holds every non null category of the column.
+    """
+    def __init__(self, column_profile_file_path):
+        self.column_profile_file_path = column_profile_file_path
+
+    @property
+    def is_column_profile_file_present(self) -> bool:
+        return self.column_profile_file_path is not None and os.path.exists(self.column_profile_file_path)
+
+    def write_column_profile(self, column_profile: Dict[str, ColumnProfile]):
+        try:
+            write_yaml_file(file_path=self.column_profile_file_path,
+                            data={column: dict(profile._asdict()) for column, profile in column_profile.items()})
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    def get_column_profile(self) -> Dict[str, ColumnProfile]:
+        try:
+            if not self.is_column_profile_file_present:
+                raise Exception("No column profile file available")
+            column_profile = read_yaml_file(self.column_profile_file_path) or dict()
+            return {column: ColumnProfile(**profile) for column, profile in column_profile.items()}
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+
+CategoryCount = namedtuple("CategoryCount", ["signature", "counts"])
+
+
+class CategoryCountMetadata:
+    """
+    Category counts of the accepted data of each year/month partition of the feature store, kept
+    across runs so that count based estimators are refitted from the counts of changed partitions only.
+    counts maps a column to its [category, count] pairs, missing values are counted under a None category.
+    signature identifies the partition content the counts were taken from.
+    """
+    def __init__(self, category_count_dir):
+        self.category_count_dir = category_count_dir
+
+    def get_file_path(self, partition: Tuple[int, int]) -> str:
+        year, month = partition
+        return os.path.join(self.category_count_dir, f"{year}_{month:02d}.yaml")
+
+    def get_category_count(self, partition: Tuple[int, int]) -> Optional[CategoryCount]:
+        try:
+            file_path = self.get_file_path(partition)
+            if not os.path.exists(file_path):
+                return None
+            return CategoryCount(**read_yaml_file(file_path))
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    def write_category_count(self, partition: Tuple[int, int], category_count: CategoryCount):
+        try:
+            write_yaml_file(file_path=self.get_file_path(partition), data=dict(category_count._asdict()))
+        except Exception as e:
+            raise FinanceException(e, sys)
@@ -1,7 +1,10 @@
 from typing import List, Dict
-from pyspark.sql.types import (TimestampType, StringType, FloatType, StructType, StructField)
+from pyspark.sql.types import (TimestampType, StringType, FloatType, BooleanType, IntegerType, StructType, StructField)
+from pyspark.sql.functions import col, lit
+from pyspark.ml.linalg import VectorUDT
 from finance_complaint.exception import FinanceException
-from pyspark.sql import DataFrame
+from pyspark.sql import DataFrame, Column
+from datetime import datetime
 import os, sys
 
 
@@ -24,11 +27,17 @@ class FinanceDataSchema:
         self.col_sub_product: str = 'sub_product'
         self.col_complaint_what_happened: str = 'complaint_what_happened'
         self.col_company_public_response: str = 'company_public_response'
+        self.col_sub_issue: str = 'sub_issue'
+        self.col_tags: str = 'tags'
+        self.col_has_narrative: str = 'has_narrative'
+        self.col_corrupt_record: str = '_corrupt_record'
+        self.col_date_received_year: str = 'date_received_year'
+        self.col_date_received_month: str = 'date_received_month'
     
     @property
     def dataframe_schema(self)-> StructType:
         try:
-            schema = StringType([
+            schema = StructType([
                 StructField(self.col_company_response, StringType()),
                 StructField(self.col_consumer_consent_provided, StringType()),
                 StructField(self.col_submitted_via, StringType()),
@@ -41,11 +50,70 @@ class FinanceDataSchema:
                 StructField(self.col_state, StringType()),
                 StructField(self.col_zip_code, StringType()),
                 StructField(self.col_consumer_disputed, StringType()),
+                StructField(self.col_complaint_id, StringType()),
+                StructField(self.col_sub_product, StringType()),
+                StructField(self.col_complaint_what_happened, StringType()),
+                StructField(self.col_company_public_response, StringType()),
+                StructField(self.col_sub_issue, StringType()),
+                StructField(self.col_tags, StringType()),
+                StructField(self.col_has_narrative, BooleanType()),
             ])
             return schema
         except Exception as e:
             raise FinanceException(e, sys)
 
+    @property
+    def raw_dataframe_schema(self) -> StructType:
+        """
+        Schema used to read downloaded json, records not matching the declared
+        types are kept as text in the corrupt record column.
+        """
+        return self.dataframe_schema.add(StructField(self.col_corrupt_record, StringType()))
+
+    @property
+    def partition_columns(self) -> List[str]:
+        return [self.col_date_received_year, self.col_date_received_month]
+
+    @property
+    def feature_store_schema(self) -> StructType:
+        """
+        Declared schema plus the year/month of date_received the feature store is partitioned by.
+        """
+        partition_fields = [StructField(column, IntegerType()) for column in self.partition_columns]
+        return StructType(self.dataframe_schema.fields + partition_fields)
+
+    def get_dataframe_schema(self, columns: List[str]) -> StructType:
+        try:
+            fields = {field.name: field for field in self.feature_store_schema.fields}
+            return StructType([fields[column] for column in columns])
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    @property
+    def required_dataframe_schema(self) -> StructType:
+        return self.get_dataframe_schema(self.required_columns + self.partition_columns)
+
+    def get_date_window_filter(self, from_date: str = None, to_date: str = None) -> Column:
+        """
+        Condition keeping rows with date_received between from_date and to_date (both inclusive).
+        The condition is repeated on the year/month partition columns so that spark
+        prunes the partitions outside the window instead of scanning them.
+        """
+        try:
+            condition = lit(True)
+            year_month = col(self.col_date_received_year) * 100 + col(self.col_date_received_month)
+            if from_date is not None:
+                from_date_obj = datetime.strptime(from_date, "%Y-%m-%d")
+                condition = (condition & (year_month >= from_date_obj.year * 100 + from_date_obj.month)
+                             & (col(self.col_date_received).cast("date") >= lit(from_date).cast("date")))
+            if to_date is not None:
+                to_date_obj = datetime.strptime(to_date, "%Y-%m-%d")
+                condition = (condition & (year_month <= to_date_obj.year * 100 + to_date_obj.month)
+                             & (col(self.col_date_received).cast("date") <= lit(to_date).cast("date")))
+            return condition
+        except Exception as e:
+            raise FinanceException(e, sys)
+
     @property
     def target_column(self) -> str:
         return self.col_consumer_disputed
@@ -113,6 +181,47 @@ class FinanceDataSchema:
                     [self.col_date_sent_to_company, self.col_date_received]
         return features    
         
+    @property
+    def non_null_columns(self) -> List[str]:
+        """
+        Columns a row is rejected without: the label, the date partitions are derived from
+        and the text tokenized for tf-idf.
+        """
+        return [self.target_column, self.col_date_received, self.col_issue]
+
+    @property
+    def date_columns(self) -> List[str]:
+        return [self.col_date_sent_to_company, self.col_date_received]
+
+    @property
+    def min_date(self) -> str:
+        # first date complaints were received by CFPB
+        return "2011-12-01"
+
+    @property
+    def column_patterns(self) -> Dict[str, str]:
+        """
+        Pattern non null values of string typed columns holding other types have to match.
+        """
+        return {self.col_complaint_id: r"^[0-9]+$"}
+
+    @property
+    def categorical_domains(self) -> Dict[str, List[str]]:
+        """
+        Allowed values of categorical columns, missing values are handled by imputation.
+        """
+        domains = {
+            self.col_company_response: ["Closed with explanation", "Closed with non-monetary relief",
+                                        "Closed with monetary relief", "Closed without relief",
+                                        "Closed with relief", "Closed", "In progress", "Untimely response"],
+            self.col_consumer_consent_provided: ["Consent provided", "Consent not provided", "Consent withdrawn",
+                                                 "None", "Other", "N/A"],
+            self.col_submitted_via: ["Web", "Web Referral", "Referral", "Phone", "Postal mail", "Fax", "Email"],
+            self.col_timely: ["Yes", "No"],
+            self.col_consumer_disputed: ["Yes", "No", "N/A"],
+        }
+        return domains
+
     @property
     def unwanted_columns(self)-> List[str]:
         features = [self.col_complaint_id, self.col_sub_product, self.col_complaint_what_happened]
@@ -126,6 +235,14 @@ class FinanceDataSchema:
     def scaled_vector_input_features(self) -> str:
         return "scaled_input_features"
 
+    @property
+    def transformed_dataframe_schema(self) -> StructType:
+        """
+        Schema of the train and test data written by data transformation.
+        """
+        return StructType([StructField(self.scaled_vector_input_features, VectorUDT()),
+                           StructField(self.target_column, StringType())])
+
     @property
     def target_indexed_label(self) -> str:
         return f"indexed_{self.target_column}"
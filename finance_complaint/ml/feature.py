@@ -1,38 +1,239 @@
 from pyspark import keyword_only
 from pyspark.ml import Transformer
 from pyspark.ml.param.shared import Param, Params, TypeConverters, HasOutputCols, HasInputCols
+from pyspark.ml.param.shared import HasInputCol, HasOutputCol, HasNumFeatures
 from pyspark.ml.util import DefaultParamsReadable, DefaultParamsWritable
+from pyspark.ml.util import DefaultParamsReader, DefaultParamsWriter, MLReader, MLWriter
 from pyspark.ml import Estimator
-from pyspark.sql import DataFrame
+from pyspark.sql import DataFrame, Column
 from pyspark.sql.functions import desc
-from pyspark.sql.functions import col, abs
-from typing import List
-from pyspark.sql.types import TimestampType, LongType
+from pyspark.sql.functions import col, abs, lit, struct, array, explode, create_map, coalesce, when
+from pyspark.sql.functions import row_number, sum, min, least, element_at, concat, raise_error, broadcast
+from pyspark.sql.window import Window
+from typing import Callable, List, Dict, Tuple, Optional
+from collections import namedtuple
+import numpy as np
+import pyarrow as pa
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+import io
+import os
+from abc import ABC, abstractmethod
+from urllib.parse import urlparse
+from pyspark.sql import Row
+from pyspark.sql.types import TimestampType, LongType, StringType, ArrayType, DoubleType, StructType
+from pyspark.ml.feature import StringIndexerModel, ImputerModel, Tokenizer, HashingTF, IDF, IDFModel
+from pyspark.ml.pipeline import PipelineModel
+from finance_complaint.entity.metadata_entity import ColumnProfile
 from finance_complaint.logger import logging
 from finance_complaint.config.spark_manager import spark_session
+from finance_complaint.ml.sketch import CountMinSketch
+
+CATEGORY_INDEX = "idx"
+CATEGORY_STRUCT = "__category"
+CATEGORY_VALUE = "value"
+CATEGORY_MODE = "mode"
+CATEGORY_RANK = "rank"
+
+
+def _category_counts(dataframe: DataFrame, columns: List[str]) -> List[List[Tuple]]:
+    """
+    (category, count) pairs of every column, missing values included, computed in one job.
+    Rows are unpivoted into structs (idx, v0, ..., vn) where only v<idx> holds the value of
+    column idx in its own type, so a single group by counts the categories of all columns.
+    """
+    value_columns = [f"v{index}" for index in range(len(columns))]
+    data_types = [dataframe.schema[column].dataType for column in columns]
+    value_structs = [struct(lit(index).alias(CATEGORY_INDEX),
+                            *[(col(column) if value_index == index else lit(None).cast(data_type)).alias(value_column)
+                              for value_index, (value_column, data_type) in enumerate(zip(value_columns, data_types))])
+                     for index, column in enumerate(columns)]
+    rows = (dataframe
+            .select(explode(array(*value_structs)).alias(CATEGORY_STRUCT))
+            .select(f"{CATEGORY_STRUCT}.*")
+            .groupBy(CATEGORY_INDEX, *value_columns)
+            .count()
+            .collect())
+    category_counts = [[] for _ in columns]
+    for row in rows:
+        index = row[CATEGORY_INDEX]
+        category_counts[index].append((row[value_columns[index]], row["count"]))
+    return category_counts
+
+
+def get_partition_category_counts(dataframe: DataFrame, columns: List[str],
+                               partition_columns: List[str]) -> Dict[Tuple, List[List[Tuple]]]:
+    """
+    (category, count) pairs of every column within each partition, missing values included,
+    computed in one job. Categories are compared as strings.
+    """
+    value_structs = [struct(lit(index).alias(CATEGORY_INDEX), col(column).cast(StringType()).alias(CATEGORY_VALUE))
+                     for index, column in enumerate(columns)]
+    rows = (dataframe
+            .select(*partition_columns, explode(array(*value_structs)).alias(CATEGORY_STRUCT))
+            .select(*partition_columns, f"{CATEGORY_STRUCT}.*")
+            .groupBy(*partition_columns, CATEGORY_INDEX, CATEGORY_VALUE)
+            .count()
+            .collect())
+    category_counts: Dict[Tuple, List[List[Tuple]]] = dict()
+    for row in rows:
+        partition = tuple(row[column] for column in partition_columns)
+        counts = category_counts.setdefault(partition, [[] for _ in columns])
+        counts[row[CATEGORY_INDEX]].append((row[CATEGORY_VALUE], row["count"]))
+    return category_counts
+
+
+def get_category_counts(column_profile: ColumnProfile, impute_missing: bool = False) -> List[List]:
+    """
+    [category, count] pairs of a column profile ordered by count descending then category.
+    With impute_missing, missing values are counted in the most frequent category as
+    FrequencyImputer replaces them by it.
+    """
+    if not column_profile.is_complete:
+        raise Exception(f"Column profile holds [{len(column_profile.top_categories or [])}] "
+                        f"of [{column_profile.n_category}] categories")
+    category_counts = [[category, n_row] for category, n_row in column_profile.top_categories]
+    if impute_missing and len(category_counts) > 0:
+        category_counts[0][1] += column_profile.null_count
+    return category_counts
+
+
+def get_string_indexer_model_from_profile(column_profile: ColumnProfile, inputCol: str, outputCol: str,
+                                          impute_missing: bool = True) -> StringIndexerModel:
+    """
+    StringIndexerModel equal to fitting a frequencyDesc StringIndexer on the profiled data.
+    """
+    labels = [category for category, _ in get_category_counts(column_profile=column_profile,
+                                                              impute_missing=impute_missing)]
+    return StringIndexerModel.from_labels(labels, inputCol=inputCol, outputCol=outputCol)
+
+
+def get_file_system(path: str) -> Tuple[pafs.FileSystem, str]:
+    """
+    Arrow file system of a path spark reads and writes models at, local or remote (hdfs, s3, ...),
+    and the path within that file system.
+    """
+    if urlparse(path).scheme == "":
+        path = os.path.abspath(path)
+    return pafs.FileSystem.from_uri(path)
+
+
+class ParquetStateWriter(MLWriter):
+    """
+    Saves the params of a model as stage metadata, except the param holding its fitted state
+    which is written as parquet files in the data sub directory.
+    """
+
+    def __init__(self, instance: "ParquetStateModel"):
+        super(ParquetStateWriter, self).__init__()
+        self.instance = instance
+
+    def saveImpl(self, path: str):
+        state_param_name = self.instance.state_param.name
+        param_map = {param.name: value for param, value in self.instance._paramMap.items()
+                     if param.name != state_param_name}
+        DefaultParamsWriter.saveMetadata(self.instance, path, self.sc, paramMap=param_map)
+        file_system, model_path = get_file_system(path)
+        data_dir = f"{model_path}/data"
+        file_system.create_dir(data_dir, recursive=True)
+        for table_name, table in self.instance.get_state_tables().items():
+            pq.write_table(table, f"{data_dir}/{table_name}.parquet", filesystem=file_system)
+
+
+class ParquetStateReader(MLReader):
+    """
+    Loads the params of a model from stage metadata, its fitted state is only read from the
+    parquet files when first used. Models saved with their state in the metadata load as before.
+    """
+
+    def __init__(self, cls):
+        super(ParquetStateReader, self).__init__()
+        self.cls = cls
+
+    def load(self, path: str) -> "ParquetStateModel":
+        metadata = DefaultParamsReader.loadMetadata(path, self.sc)
+        instance = self.cls()
+        DefaultParamsReader.getAndSetParams(instance, metadata)
+        file_system, model_path = get_file_system(path)
+        if file_system.get_file_info(f"{model_path}/data").type == pafs.FileType.Directory:
+            instance.set_state_dir(f"{path.rstrip('/')}/data")
+        return instance
+
+
+class ParquetStateModel(ABC):
+    """
+    Model whose fitted state param is saved in parquet side files by ParquetStateWriter and read
+    back lazily. Subclasses name the state param and convert it from and to arrow tables.
+    """
+    state_dir: Optional[str] = None
+
+    @property
+    @abstractmethod
+    def state_param(self) -> Param:
+        pass
+
+    @abstractmethod
+    def get_state_tables(self) -> Dict[str, pa.Table]:
+        pass
+
+    @abstractmethod
+    def set_state_tables(self, tables: Dict[str, pa.Table]):
+        pass
+
+    def set_state_dir(self, state_dir: str):
+        self.state_dir = state_dir
+        return self
+
+    def load_state(self):
+        if self.state_dir is None:
+            return
+        file_system, state_dir = get_file_system(self.state_dir)
+        file_infos = file_system.get_file_info(pafs.FileSelector(state_dir))
+        tables = {os.path.splitext(file_info.base_name)[0]: pq.read_table(file_info.path, filesystem=file_system)
+                  for file_info in sorted(file_infos, key=lambda file_info: file_info.base_name)
+                  if file_info.base_name.endswith(".parquet")}
+        self.state_dir = None
+        self.set_state_tables(tables)
+
+    def write(self) -> ParquetStateWriter:
+        return ParquetStateWriter(self)
+
+    @classmethod
+    def read(cls) -> ParquetStateReader:
+        return ParquetStateReader(cls)
 
 
 class FrequencyEncoder(Estimator, HasInputCols, HasOutputCols,
                        DefaultParamsReadable, DefaultParamsWritable):
     frequencyInfo = Param(Params._dummy(), "getfrequencyInfo", "getfrequencyInfo",
                           typeConverter=TypeConverters.toList)
+    defaultFrequency = Param(Params._dummy(), "defaultFrequency",
+                             "frequency given to categories not seen during fit",
+                             typeConverter=TypeConverters.toInt)
 
     @keyword_only
-    def __init__(self, inputCols: List[str] = None, outputCols: List[str] = None, ):
+    def __init__(self, inputCols: List[str] = None, outputCols: List[str] = None, defaultFrequency: int = 0, ):
         super(FrequencyEncoder, self).__init__()
         kwargs = self._input_kwargs
 
         self.frequencyInfo = Param(self, "frequencyInfo", "")
         self._setDefault(frequencyInfo="")
+        self._setDefault(defaultFrequency=0)
         # self._set(**kwargs)
 
         self.setParams(**kwargs)
 
     @keyword_only
-    def setParams(self, inputCols: List[str] = None, outputCols: List[str] = None, ):
+    def setParams(self, inputCols: List[str] = None, outputCols: List[str] = None, defaultFrequency: int = 0, ):
         kwargs = self._input_kwargs
         return self._set(**kwargs)
 
+    def setDefaultFrequency(self, value: int):
+        return self._set(defaultFrequency=value)
+
+    def getDefaultFrequency(self) -> int:
+        return self.getOrDefault(self.defaultFrequency)
+
     def setInputCols(self, value: List[str]):
         """
         Sets the value of :py:attr:`inputCol`.
@@ -57,26 +258,85 @@ class FrequencyEncoder(Estimator, HasInputCols, HasOutputCols,
         output_columns = self.getOutputCols()
         print(f"Output columns: {output_columns}")
         replace_info = []
+        category_counts = _category_counts(dataframe=dataframe, columns=input_columns)
+        for column, new_column, counts in zip(input_columns, output_columns, category_counts):
+            freq = [Row(**{f'g_{column}': category, new_column: n_row}) for category, n_row in counts]
+            logging.info(f"{column} has [{len(freq)}] unique category")
+            replace_info.append(freq)
+
+        self.setfrequencyInfo(frequencyInfo=replace_info)
+        estimator = FrequencyEncoderModel(inputCols=input_columns, outputCols=output_columns,
+                                          defaultFrequency=self.getDefaultFrequency())
+        estimator.setfrequencyInfo(frequencyInfo=replace_info)
+        return estimator
+
+    def fitFromProfile(self, columnProfile: Dict[str, ColumnProfile]):
+        """
+        Fits the encoder from the category counts of a complete column profile without scanning data.
+        """
+        input_columns = self.getInputCols()
+        output_columns = self.getOutputCols()
+        replace_info = []
         for column, new_column in zip(input_columns, output_columns):
-            freq = (dataframe.
-                    select(col(column).
-                           alias(f'g_{column}')).
-                    groupby(f'g_{column}').
-                    count().
-                    withColumn(new_column, col('count')))
-            freq = freq.drop('count')
-            logging.info(f"{column} has [{freq.count()}] unique category")
-            replace_info.append(freq.collect())
+            profile = columnProfile[column]
+            freq = [Row(**{f'g_{column}': category, new_column: n_row})
+                    for category, n_row in get_category_counts(column_profile=profile)]
+            if profile.null_count > 0:
+                freq.append(Row(**{f'g_{column}': None, new_column: profile.null_count}))
+            logging.info(f"{column} has [{len(freq)}] unique category")
+            replace_info.append(freq)
 
         self.setfrequencyInfo(frequencyInfo=replace_info)
-        estimator = FrequencyEncoderModel(inputCols=input_columns, outputCols=output_columns)
+        estimator = FrequencyEncoderModel(inputCols=input_columns, outputCols=output_columns,
+                                          defaultFrequency=self.getDefaultFrequency())
         estimator.setfrequencyInfo(frequencyInfo=replace_info)
         return estimator
 
-class FrequencyEncoderModel(FrequencyEncoder, Transformer):
+class FrequencyEncoderModel(ParquetStateModel, FrequencyEncoder, Transformer):
 
-    def __init__(self, inputCols: List[str] = None, outputCols: List[str] = None, ):
-        super(FrequencyEncoderModel, self).__init__(inputCols=inputCols, outputCols=outputCols)
+    def __init__(self, inputCols: List[str] = None, outputCols: List[str] = None, defaultFrequency: int = 0, ):
+        super(FrequencyEncoderModel, self).__init__(inputCols=inputCols, outputCols=outputCols,
+                                                    defaultFrequency=defaultFrequency)
+
+    @property
+    def state_param(self) -> Param:
+        return self.frequencyInfo
+
+    def get_state_tables(self) -> Dict[str, pa.Table]:
+        # one table per input column as categories of different columns may differ in type
+        return {f"frequency_{index}": pa.table({"category": [row[0] for row in freq_info],
+                                                "frequency": pa.array([row[1] for row in freq_info], pa.int64())})
+                for index, freq_info in enumerate(self.getfrequencyInfo())}
+
+    def set_state_tables(self, tables: Dict[str, pa.Table]):
+        frequency_info = []
+        for index in range(len(self.getInputCols())):
+            table = tables[f"frequency_{index}"]
+            frequency_info.append([list(category_frequency) for category_frequency in
+                                   zip(table.column("category").to_pylist(), table.column("frequency").to_pylist())])
+        self.setfrequencyInfo(frequencyInfo=frequency_info)
+
+    def getfrequencyInfo(self):
+        self.load_state()
+        return self.getOrDefault(self.frequencyInfo)
+
+    def get_frequency_column(self, in_col: str, freq_info: list) -> Column:
+        """
+        Frequency of the category of in_col looked up in a literal map, without any join.
+        Missing values get the frequency of the missing group seen during fit and
+        categories not seen during fit get defaultFrequency.
+        """
+        default_frequency = lit(self.getDefaultFrequency()).cast(LongType())
+        frequency = {row[0]: row[1] for row in freq_info if row[0] is not None}
+        missing_frequency = [row[1] for row in freq_info if row[0] is None]
+        missing_frequency = (lit(missing_frequency[0]).cast(LongType()) if len(missing_frequency) > 0
+                             else default_frequency)
+        if len(frequency) == 0:
+            return when(col(in_col).isNull(), missing_frequency).otherwise(default_frequency)
+        frequency_map = create_map(*[lit(item) for category, n_row in frequency.items()
+                                     for item in (category, n_row)])
+        return (when(col(in_col).isNull(), missing_frequency)
+                .otherwise(coalesce(frequency_map.getItem(col(in_col)).cast(LongType()), default_frequency)))
 
     def _transform(self, dataframe: DataFrame):
         inputCols = self.getInputCols()
@@ -86,19 +346,214 @@ class FrequencyEncoderModel(FrequencyEncoder, Transformer):
 
         print(f"Output columns: {outputCols}")
         freqInfo = self.getfrequencyInfo()
-        
-        for in_col, out_col, freq_info in zip(inputCols, outputCols, freqInfo):
-            frequency_dataframe: DataFrame = spark_session.createDataFrame(freq_info)
-
-            columns = frequency_dataframe.columns
-            dataframe = dataframe.join(frequency_dataframe,
-                                       on=dataframe[in_col] == frequency_dataframe[columns[0]])
-
-            dataframe = dataframe.drop(columns[0])
-            if out_col not in dataframe.columns:
-                dataframe = dataframe.withColumn(out_col, col(columns[1]))
-                dataframe = dataframe.drop(columns[1])
-        return dataframe
+
+        # every output column is added in a single narrow projection, no row is dropped
+        frequency_columns = {out_col: self.get_frequency_column(in_col=in_col, freq_info=freq_info)
+                             for in_col, out_col, freq_info in zip(inputCols, outputCols, freqInfo)}
+        return dataframe.withColumns(frequency_columns)
+
+SketchFrequency = namedtuple("SketchFrequency", ["top_categories", "null_count", "sketch"])
+SKETCH_ROW = "sketch_row"
+SKETCH_BUCKET = "sketch_bucket"
+SKETCH_STRUCT = "__sketch"
+SKETCH_FREQUENCY_FILE_NAME = "sketch_frequency.npz"
+
+
+class SketchFrequencyEncoder(Estimator, HasInputCols, HasOutputCols,
+                             DefaultParamsReadable, DefaultParamsWritable):
+    """
+    Frequency encoder for high cardinality columns whose fitted state does not grow with the
+    number of categories: the topK most frequent categories of a column are counted exactly,
+    the other categories in a count-min sketch of sketchDepth x sketchWidth counters. Frequency
+    of a tail category is estimated as the minimum of its counters and is never below its
+    real count. Not part of the transformation pipeline, for high cardinality features.
+    """
+    sketchWidth = Param(Params._dummy(), "sketchWidth", "number of counters in each row of the count-min sketch",
+                        typeConverter=TypeConverters.toInt)
+    sketchDepth = Param(Params._dummy(), "sketchDepth", "number of rows of the count-min sketch",
+                        typeConverter=TypeConverters.toInt)
+    topK = Param(Params._dummy(), "topK", "number of most frequent categories counted exactly",
+                 typeConverter=TypeConverters.toInt)
+
+    @keyword_only
+    def __init__(self, inputCols: List[str] = None, outputCols: List[str] = None,
+                 sketchWidth: int = 1024, sketchDepth: int = 4, topK: int = 100, ):
+        super(SketchFrequencyEncoder, self).__init__()
+        kwargs = self._input_kwargs
+        self._setDefault(sketchWidth=1024, sketchDepth=4, topK=100)
+        self.setParams(**kwargs)
+
+    @keyword_only
+    def setParams(self, inputCols: List[str] = None, outputCols: List[str] = None,
+                  sketchWidth: int = 1024, sketchDepth: int = 4, topK: int = 100, ):
+        kwargs = self._input_kwargs
+        return self._set(**kwargs)
+
+    def getSketchWidth(self) -> int:
+        return self.getOrDefault(self.sketchWidth)
+
+    def getSketchDepth(self) -> int:
+        return self.getOrDefault(self.sketchDepth)
+
+    def getTopK(self) -> int:
+        return self.getOrDefault(self.topK)
+
+    def _fit(self, dataframe: DataFrame):
+        """
+        Categories of all columns are unpivoted and counted with one group by, the counts are
+        ranked per column. One job collects the topK categories and missing value counts, a
+        second one the sketch counters of the remaining categories, so the driver never holds
+        more than topK categories per column.
+        """
+        input_columns = self.getInputCols()
+        output_columns = self.getOutputCols()
+        top_k = self.getTopK()
+        sketches = [CountMinSketch(width=self.getSketchWidth(), depth=self.getSketchDepth())
+                    for _ in input_columns]
+
+        value_structs = [struct(lit(index).alias(CATEGORY_INDEX), col(column).cast(StringType()).alias(CATEGORY_VALUE))
+                         for index, column in enumerate(input_columns)]
+        rank_window = Window.partitionBy(CATEGORY_INDEX).orderBy(col(CATEGORY_VALUE).isNull(), desc("count"),
+                                                                 col(CATEGORY_VALUE))
+        category_count = (dataframe
+                          .select(explode(array(*value_structs)).alias(CATEGORY_STRUCT))
+                          .select(f"{CATEGORY_STRUCT}.*")
+                          .groupBy(CATEGORY_INDEX, CATEGORY_VALUE)
+                          .count()
+                          .withColumn(CATEGORY_RANK, row_number().over(rank_window))
+                          .persist())
+        try:
+            top_categories = [dict() for _ in input_columns]
+            null_counts = [0 for _ in input_columns]
+            for row in (category_count
+                        .filter(col(CATEGORY_VALUE).isNull() | (col(CATEGORY_RANK) <= top_k))
+                        .collect()):
+                if row[CATEGORY_VALUE] is None:
+                    null_counts[row[CATEGORY_INDEX]] = row["count"]
+                else:
+                    top_categories[row[CATEGORY_INDEX]][row[CATEGORY_VALUE]] = row["count"]
+
+            bucket_pairs = [struct(lit(row).alias(SKETCH_ROW), bucket_column.alias(SKETCH_BUCKET))
+                            for row, bucket_column in enumerate(sketches[0].get_bucket_columns(col(CATEGORY_VALUE)))]
+            for row in (category_count
+                        .filter(col(CATEGORY_VALUE).isNotNull() & (col(CATEGORY_RANK) > top_k))
+                        .select(CATEGORY_INDEX, "count", explode(array(*bucket_pairs)).alias(SKETCH_STRUCT))
+                        .groupBy(CATEGORY_INDEX, f"{SKETCH_STRUCT}.{SKETCH_ROW}", f"{SKETCH_STRUCT}.{SKETCH_BUCKET}")
+                        .agg(sum("count").alias("count"))
+                        .collect()):
+                sketches[row[CATEGORY_INDEX]].add(row=row[SKETCH_ROW], bucket=row[SKETCH_BUCKET], n=row["count"])
+        finally:
+            category_count.unpersist()
+
+        sketch_frequencies = []
+        for column, top_category, null_count, sketch in zip(input_columns, top_categories, null_counts, sketches):
+            logging.info(f"{column} has [{len(top_category)}] top categories and [{sketch.total}] rows in its sketch")
+            sketch_frequencies.append(SketchFrequency(top_categories=top_category, null_count=null_count,
+                                                      sketch=sketch))
+        model = SketchFrequencyEncoderModel(inputCols=input_columns, outputCols=output_columns,
+                                            sketchWidth=self.getSketchWidth(), sketchDepth=self.getSketchDepth(),
+                                            topK=top_k)
+        model.setSketchFrequencies(sketch_frequencies)
+        return model
+
+
+class SketchFrequencyEncoderModelWriter(MLWriter):
+    """
+    Saves the params as stage metadata and the fitted counts of all columns as one binary
+    numpy file next to it, instead of inlining them into the JSON metadata.
+    """
+
+    def __init__(self, instance: "SketchFrequencyEncoderModel"):
+        super(SketchFrequencyEncoderModelWriter, self).__init__()
+        self.instance = instance
+
+    def saveImpl(self, path: str):
+        DefaultParamsWriter.saveMetadata(self.instance, path, self.sc)
+        file_system, model_path = get_file_system(path)
+        data_dir = f"{model_path}/data"
+        file_system.create_dir(data_dir, recursive=True)
+        arrays = dict()
+        for index, sketch_frequency in enumerate(self.instance.getSketchFrequencies()):
+            arrays[f"category_{index}"] = np.array(list(sketch_frequency.top_categories.keys()), dtype=str)
+            arrays[f"count_{index}"] = np.array(list(sketch_frequency.top_categories.values()), dtype=np.int64)
+            arrays[f"null_count_{index}"] = np.array(sketch_frequency.null_count, dtype=np.int64)
+            arrays[f"sketch_{index}"] = sketch_frequency.sketch.table
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **arrays)
+        with file_system.open_output_stream(f"{data_dir}/{SKETCH_FREQUENCY_FILE_NAME}") as file_obj:
+            file_obj.write(buffer.getvalue())
+
+
+class SketchFrequencyEncoderModelReader(MLReader):
+
+    def __init__(self, cls):
+        super(SketchFrequencyEncoderModelReader, self).__init__()
+        self.cls = cls
+
+    def load(self, path: str) -> "SketchFrequencyEncoderModel":
+        metadata = DefaultParamsReader.loadMetadata(path, self.sc)
+        instance = self.cls()
+        DefaultParamsReader.getAndSetParams(instance, metadata)
+        sketch_frequencies = []
+        file_system, model_path = get_file_system(path)
+        with file_system.open_input_file(f"{model_path}/data/{SKETCH_FREQUENCY_FILE_NAME}") as file_obj:
+            buffer = io.BytesIO(file_obj.read())
+        with np.load(buffer, allow_pickle=False) as arrays:
+            for index in range(len(instance.getInputCols())):
+                table = arrays[f"sketch_{index}"]
+                depth, width = table.shape
+                top_categories = dict(zip(arrays[f"category_{index}"].tolist(), arrays[f"count_{index}"].tolist()))
+                sketch_frequencies.append(SketchFrequency(top_categories=top_categories,
+                                                          null_count=int(arrays[f"null_count_{index}"]),
+                                                          sketch=CountMinSketch(width=width, depth=depth, table=table)))
+        instance.setSketchFrequencies(sketch_frequencies)
+        return instance
+
+
+class SketchFrequencyEncoderModel(SketchFrequencyEncoder, Transformer):
+
+    def __init__(self, inputCols: List[str] = None, outputCols: List[str] = None,
+                 sketchWidth: int = 1024, sketchDepth: int = 4, topK: int = 100, ):
+        super(SketchFrequencyEncoderModel, self).__init__(inputCols=inputCols, outputCols=outputCols,
+                                                          sketchWidth=sketchWidth, sketchDepth=sketchDepth,
+                                                          topK=topK)
+        self.sketch_frequencies: List[SketchFrequency] = []
+
+    def setSketchFrequencies(self, sketch_frequencies: List[SketchFrequency]):
+        self.sketch_frequencies = sketch_frequencies
+        return self
+
+    def getSketchFrequencies(self) -> List[SketchFrequency]:
+        return self.sketch_frequencies
+
+    def write(self) -> SketchFrequencyEncoderModelWriter:
+        return SketchFrequencyEncoderModelWriter(self)
+
+    @classmethod
+    def read(cls) -> SketchFrequencyEncoderModelReader:
+        return SketchFrequencyEncoderModelReader(cls)
+
+    @staticmethod
+    def get_frequency_column(in_col: str, sketch_frequency: SketchFrequency) -> Column:
+        value = col(in_col).cast(StringType())
+        sketch = sketch_frequency.sketch
+        # minimum of the counters of the value, one counter per sketch row
+        counters = [array(*[lit(int(n_row)) for n_row in sketch.table[row]]).cast(ArrayType(LongType()))
+                    for row in range(sketch.depth)]
+        row_frequencies = [element_at(counters[row], bucket_column + 1)
+                           for row, bucket_column in enumerate(sketch.get_bucket_columns(value))]
+        tail_frequency = least(*row_frequencies) if len(row_frequencies) > 1 else row_frequencies[0]
+        if len(sketch_frequency.top_categories) > 0:
+            frequency_map = create_map(*[lit(item) for category, n_row in sketch_frequency.top_categories.items()
+                                         for item in (category, n_row)])
+            tail_frequency = coalesce(frequency_map.getItem(value).cast(LongType()), tail_frequency)
+        return when(value.isNull(), lit(sketch_frequency.null_count).cast(LongType())).otherwise(tail_frequency)
+
+    def _transform(self, dataframe: DataFrame):
+        frequency_columns = {out_col: self.get_frequency_column(in_col=in_col, sketch_frequency=sketch_frequency)
+                             for in_col, out_col, sketch_frequency in zip(self.getInputCols(), self.getOutputCols(),
+                                                                          self.getSketchFrequencies())}
+        return dataframe.withColumns(frequency_columns)
 
 class DerivedFeatureGenerator(Transformer, HasInputCols, HasOutputCols,
                               DefaultParamsReadable, DefaultParamsWritable):
@@ -148,20 +603,33 @@ class FrequencyImputer(
                     DefaultParamsReadable, DefaultParamsWritable):
     topCategorys = Param(Params._dummy(), "getTopCategorys", "getTopCategorys",
                          typeConverter=TypeConverters.toListString)
+    approximate = Param(Params._dummy(), "approximate", "take the most frequent categories on a sample of rows",
+                        typeConverter=TypeConverters.toBoolean)
+    sampleFraction = Param(Params._dummy(), "sampleFraction", "fraction of rows sampled in approximate mode",
+                           typeConverter=TypeConverters.toFloat)
     @keyword_only
-    def __init__(self, inputCols: List[str] = None, outputCols: List[str] = None, ):
+    def __init__(self, inputCols: List[str] = None, outputCols: List[str] = None,
+                 approximate: bool = False, sampleFraction: float = 0.1, ):
         super(FrequencyImputer, self).__init__()
         self.topCategorys = Param(self, "topCategorys", "")
         self._setDefault(topCategorys="")
+        self._setDefault(approximate=False, sampleFraction=0.1)
         kwargs = self._input_kwargs
         print(kwargs)
         self.setParams(**kwargs)
 
     @keyword_only
-    def setParams(self, inputCols: List[str] = None, outputCols: List[str] = None, ):
+    def setParams(self, inputCols: List[str] = None, outputCols: List[str] = None,
+                  approximate: bool = False, sampleFraction: float = 0.1, ):
         kwargs = self._input_kwargs
         return self._set(**kwargs)
 
+    def getApproximate(self) -> bool:
+        return self.getOrDefault(self.approximate)
+
+    def getSampleFraction(self) -> float:
+        return self.getOrDefault(self.sampleFraction)
+
     
     def setTopCategorys(self, value: List[str]):
         return self._set(topCategorys=value)
@@ -182,14 +650,55 @@ class FrequencyImputer(
         return self._set(outputCols=value)
 
 
+    @staticmethod
+    def get_top_categories(dataset: DataFrame, columns: List[str]) -> Dict[str, str]:
+        """
+        Most frequent non missing category of every column in one job. Categories of all columns are
+        unpivoted and counted with one group by, the mode of each column is then min(struct(-count, category)),
+        i.e. the highest count and the smallest category among ties, without sorting the counts.
+        """
+        value_structs = [struct(lit(index).alias(CATEGORY_INDEX), col(column).cast(StringType()).alias(CATEGORY_VALUE))
+                         for index, column in enumerate(columns)]
+        rows = (dataset
+                .select(explode(array(*value_structs)).alias(CATEGORY_STRUCT))
+                .select(f"{CATEGORY_STRUCT}.*")
+                .filter(col(CATEGORY_VALUE).isNotNull())
+                .groupBy(CATEGORY_INDEX, CATEGORY_VALUE)
+                .count()
+                .groupBy(CATEGORY_INDEX)
+                .agg(min(struct((-col("count")).alias("count"), col(CATEGORY_VALUE))).alias(CATEGORY_MODE))
+                .collect())
+        return {columns[row[CATEGORY_INDEX]]: row[CATEGORY_MODE][CATEGORY_VALUE] for row in rows}
+
     def _fit(self, dataset: DataFrame):
         inputCols = self.getInputCols()
-        topCategorys = []
+        if self.getApproximate():
+            top_categories = self.get_top_categories(dataset=dataset.sample(fraction=self.getSampleFraction(), seed=42),
+                                                     columns=inputCols)
+            # columns without any value in the sample fall back to the exact mode
+            missing_columns = [column for column in inputCols if column not in top_categories]
+            if len(missing_columns) > 0:
+                top_categories.update(self.get_top_categories(dataset=dataset, columns=missing_columns))
+        else:
+            top_categories = self.get_top_categories(dataset=dataset, columns=inputCols)
         for column in inputCols:
-            categoryCountByDesc = dataset.groupBy(column).count().filter(f'{column} is not null').sort(
-                desc('count'))
-            topCat = categoryCountByDesc.take(1)[0][column]
-            topCategorys.append(topCat)
+            if column not in top_categories:
+                raise Exception(f"Column [{column}] has no category to impute missing values with")
+        topCategorys = [top_categories[column] for column in inputCols]
+
+        self.setTopCategorys(value=topCategorys)
+
+        estimator = FrequencyImputerModel(inputCols=self.getInputCols(),
+                                          outputCols=self.getOutputCols())
+
+        estimator.setTopCategorys(value=topCategorys)
+        return estimator
+
+    def fitFromProfile(self, columnProfile: Dict[str, ColumnProfile]):
+        """
+        Fits the imputer from the most frequent category of each column profile without scanning data.
+        """
+        topCategorys = [columnProfile[column].top_categories[0][0] for column in self.getInputCols()]
 
         self.setTopCategorys(value=topCategorys)
 
@@ -199,11 +708,28 @@ class FrequencyImputer(
         estimator.setTopCategorys(value=topCategorys)
         return estimator
 
-class FrequencyImputerModel(FrequencyImputer, Transformer):
+class FrequencyImputerModel(ParquetStateModel, FrequencyImputer, Transformer):
 
     def __init__(self, inputCols: List[str] = None, outputCols: List[str] = None, ):
         super(FrequencyImputerModel, self).__init__(inputCols=inputCols, outputCols=outputCols)
 
+    @property
+    def state_param(self) -> Param:
+        return self.topCategorys
+
+    def get_state_tables(self) -> Dict[str, pa.Table]:
+        return {"top_category": pa.table({"column": pa.array(self.getInputCols(), pa.string()),
+                                          "top_category": pa.array(self.getTopCategorys(), pa.string())})}
+
+    def set_state_tables(self, tables: Dict[str, pa.Table]):
+        top_category = dict(zip(tables["top_category"].column("column").to_pylist(),
+                                tables["top_category"].column("top_category").to_pylist()))
+        self.setTopCategorys(value=[top_category[column] for column in self.getInputCols()])
+
+    def getTopCategorys(self):
+        self.load_state()
+        return self.getOrDefault(self.topCategorys)
+
     def _transform(self, dataset: DataFrame):
         topCategorys = self.getTopCategorys()
         outputCols = self.getOutputCols()
@@ -220,3 +746,353 @@ class FrequencyImputerModel(FrequencyImputer, Transformer):
 
         return dataset
 
+MEMOIZED_KEY = "__memoized_key"
+MEMOIZED_MATCH = "__memoized_match"
+MEMOIZED_PREFIX = "__memoized_"
+UNSEEN_PREFIX = "__unseen_"
+
+
+def get_distinct_dataframe(dataframe: DataFrame, input_col: str, max_distinct: int) -> Optional[DataFrame]:
+    """
+    Distinct values of input_col as a dataframe held by the driver. None when input_col has more
+    than max_distinct distinct values, the distinct values are collected with a limit so a high
+    cardinality column is never collected in full.
+    """
+    values = dataframe.select(input_col).distinct().limit(max_distinct + 1).collect()
+    if len(values) > max_distinct:
+        logging.info(f"[{input_col}] has more than [{max_distinct}] distinct values, it is featurized per row")
+        return None
+    logging.info(f"[{input_col}] has [{len(values)}] distinct values, each of them is featurized once")
+    return spark_session.createDataFrame([(row[input_col],) for row in values],
+                                         schema=StructType([dataframe.schema[input_col]]))
+
+
+def get_memoized_dataframe(dataframe: DataFrame, input_col: str, featurized_dataframe: DataFrame) -> DataFrame:
+    """
+    Broadcast joins the columns featurized once per distinct value of input_col back onto the
+    rows, which keep their columns and order.
+    """
+    featurized_dataframe = featurized_dataframe.withColumnRenamed(input_col, MEMOIZED_KEY)
+    return (dataframe
+            .join(broadcast(featurized_dataframe), on=col(input_col).eqNullSafe(col(MEMOIZED_KEY)), how="left")
+            .drop(MEMOIZED_KEY))
+
+
+class MemoizedTextFeaturizer(Estimator, HasInputCol, HasOutputCol, HasNumFeatures,
+                             DefaultParamsReadable, DefaultParamsWritable):
+    """
+    Tokenizer, HashingTF and IDF of a low cardinality text column computed once per distinct
+    value instead of once per row. Columns and vectors are the same as the three stages chained,
+    tokens and raw term frequencies included. The fitted model keeps the featurized distinct
+    values of the fit data, values not seen during fit are featurized per row. Columns with more
+    than maxDistinct distinct values are featurized per row.
+    """
+    tokensCol = Param(Params._dummy(), "tokensCol", "output column of the tokenizer",
+                      typeConverter=TypeConverters.toString)
+    rawFeaturesCol = Param(Params._dummy(), "rawFeaturesCol", "output column of the term frequencies",
+                           typeConverter=TypeConverters.toString)
+    maxDistinct = Param(Params._dummy(), "maxDistinct", "highest number of distinct values featurized once each",
+                        typeConverter=TypeConverters.toInt)
+
+    @keyword_only
+    def __init__(self, inputCol: str = None, outputCol: str = None, tokensCol: str = "words",
+                 rawFeaturesCol: str = "rawfeatures", numFeatures: int = 1 << 18, maxDistinct: int = 10000, ):
+        super(MemoizedTextFeaturizer, self).__init__()
+        kwargs = self._input_kwargs
+        self._setDefault(tokensCol="words", rawFeaturesCol="rawfeatures", numFeatures=1 << 18, maxDistinct=10000)
+        self.setParams(**kwargs)
+
+    @keyword_only
+    def setParams(self, inputCol: str = None, outputCol: str = None, tokensCol: str = "words",
+                  rawFeaturesCol: str = "rawfeatures", numFeatures: int = 1 << 18, maxDistinct: int = 10000, ):
+        kwargs = self._input_kwargs
+        return self._set(**kwargs)
+
+    def getTokensCol(self) -> str:
+        return self.getOrDefault(self.tokensCol)
+
+    def getRawFeaturesCol(self) -> str:
+        return self.getOrDefault(self.rawFeaturesCol)
+
+    def getMaxDistinct(self) -> int:
+        return self.getOrDefault(self.maxDistinct)
+
+    @property
+    def featurized_cols(self) -> List[str]:
+        return [self.getTokensCol(), self.getRawFeaturesCol(), self.getOutputCol()]
+
+    def get_term_frequency_stages(self, prefix: str = "") -> List[Transformer]:
+        """
+        Tokenizer and HashingTF, with prefix added to their input and output column names.
+        """
+        tokenizer = Tokenizer(inputCol=f"{prefix}{self.getInputCol()}", outputCol=f"{prefix}{self.getTokensCol()}")
+        hashing_tf = HashingTF(inputCol=f"{prefix}{self.getTokensCol()}",
+                               outputCol=f"{prefix}{self.getRawFeaturesCol()}", numFeatures=self.getNumFeatures())
+        return [tokenizer, hashing_tf]
+
+    @staticmethod
+    def get_featurized(dataframe: DataFrame, stages: List[Transformer]) -> DataFrame:
+        for stage in stages:
+            dataframe = stage.transform(dataframe)
+        return dataframe
+
+    def _fit(self, dataframe: DataFrame):
+        # document frequencies are counted per row, only the term frequencies are memoized
+        term_frequency_stages = self.get_term_frequency_stages()
+        distinct_dataframe = get_distinct_dataframe(dataframe=dataframe, input_col=self.getInputCol(),
+                                                    max_distinct=self.getMaxDistinct())
+        if distinct_dataframe is None:
+            term_frequency = self.get_featurized(dataframe, term_frequency_stages)
+        else:
+            term_frequency = get_memoized_dataframe(
+                dataframe=dataframe, input_col=self.getInputCol(),
+                featurized_dataframe=self.get_featurized(distinct_dataframe, term_frequency_stages))
+        idf_model = IDF(inputCol=self.getRawFeaturesCol(), outputCol=self.getOutputCol()).fit(term_frequency)
+        model = MemoizedTextFeaturizerModel(inputCol=self.getInputCol(), outputCol=self.getOutputCol(),
+                                            tokensCol=self.getTokensCol(), rawFeaturesCol=self.getRawFeaturesCol(),
+                                            numFeatures=self.getNumFeatures(), maxDistinct=self.getMaxDistinct())
+        model.setIdfModel(idf_model)
+        if distinct_dataframe is not None:
+            # at most maxDistinct rows, held by the driver so transform does not recompute them from the fit data
+            memo = self.get_featurized(distinct_dataframe, term_frequency_stages + [idf_model])
+            memo = memo.select(self.getInputCol(), *self.featurized_cols)
+            model.setMemo(spark_session.createDataFrame(memo.collect(), schema=memo.schema))
+        return model
+
+
+class MemoizedTextFeaturizerModelWriter(MLWriter):
+    """
+    Saves the params as stage metadata, the fitted IDFModel in the idf sub directory and the
+    featurized distinct values as parquet in the memo sub directory.
+    """
+
+    def __init__(self, instance: "MemoizedTextFeaturizerModel"):
+        super(MemoizedTextFeaturizerModelWriter, self).__init__()
+        self.instance = instance
+
+    def saveImpl(self, path: str):
+        DefaultParamsWriter.saveMetadata(self.instance, path, self.sc)
+        self.instance.getIdfModel().save(os.path.join(path, "idf"))
+        if self.instance.getMemo() is not None:
+            self.instance.getMemo().coalesce(1).write.parquet(os.path.join(path, "memo"))
+
+
+class MemoizedTextFeaturizerModelReader(MLReader):
+
+    def __init__(self, cls):
+        super(MemoizedTextFeaturizerModelReader, self).__init__()
+        self.cls = cls
+
+    def load(self, path: str) -> "MemoizedTextFeaturizerModel":
+        metadata = DefaultParamsReader.loadMetadata(path, self.sc)
+        instance = self.cls()
+        DefaultParamsReader.getAndSetParams(instance, metadata)
+        instance.setIdfModel(IDFModel.load(os.path.join(path, "idf")))
+        memo_file_path = os.path.join(path, "memo")
+        file_system, memo_path = get_file_system(memo_file_path)
+        if file_system.get_file_info(memo_path).type == pafs.FileType.Directory:
+            instance.setMemo(spark_session.read.parquet(memo_file_path))
+        return instance
+
+
+class MemoizedTextFeaturizerModel(MemoizedTextFeaturizer, Transformer):
+
+    def __init__(self, inputCol: str = None, outputCol: str = None, tokensCol: str = "words",
+                 rawFeaturesCol: str = "rawfeatures", numFeatures: int = 1 << 18, maxDistinct: int = 10000, ):
+        super(MemoizedTextFeaturizerModel, self).__init__(inputCol=inputCol, outputCol=outputCol,
+                                                          tokensCol=tokensCol, rawFeaturesCol=rawFeaturesCol,
+                                                          numFeatures=numFeatures, maxDistinct=maxDistinct)
+        self.idf_model: Optional[IDFModel] = None
+        self.memo: Optional[DataFrame] = None
+
+    def setIdfModel(self, idf_model: IDFModel):
+        self.idf_model = idf_model
+        return self
+
+    def getIdfModel(self) -> IDFModel:
+        return self.idf_model
+
+    def setMemo(self, memo: DataFrame):
+        self.memo = memo
+        return self
+
+    def getMemo(self) -> Optional[DataFrame]:
+        return self.memo
+
+    def write(self) -> MemoizedTextFeaturizerModelWriter:
+        return MemoizedTextFeaturizerModelWriter(self)
+
+    @classmethod
+    def read(cls) -> MemoizedTextFeaturizerModelReader:
+        return MemoizedTextFeaturizerModelReader(cls)
+
+    def get_unseen_stages(self) -> List[Transformer]:
+        idf_model = (self.idf_model.copy().setInputCol(f"{UNSEEN_PREFIX}{self.getRawFeaturesCol()}")
+                     .setOutputCol(f"{UNSEEN_PREFIX}{self.getOutputCol()}"))
+        return self.get_term_frequency_stages(prefix=UNSEEN_PREFIX) + [idf_model]
+
+    def _transform(self, dataframe: DataFrame):
+        if self.memo is None:
+            return self.get_featurized(dataframe, self.get_term_frequency_stages() + [self.idf_model])
+
+        # rows whose value was seen during fit take its featurized columns from the memo, the
+        # stages only featurize the other rows, seen rows are given an empty text instead
+        input_col = self.getInputCol()
+        memo = self.memo.select(*[col(column).alias(f"{MEMOIZED_PREFIX}{column}") for column in self.featurized_cols],
+                                col(input_col), lit(True).alias(MEMOIZED_MATCH))
+        is_seen = col(MEMOIZED_MATCH).isNotNull()
+        dataframe = get_memoized_dataframe(dataframe=dataframe, input_col=input_col, featurized_dataframe=memo)
+        dataframe = dataframe.withColumn(f"{UNSEEN_PREFIX}{input_col}",
+                                         when(is_seen, lit("")).otherwise(col(input_col)))
+        dataframe = self.get_featurized(dataframe, self.get_unseen_stages())
+        featurized_columns = {column: when(is_seen, col(f"{MEMOIZED_PREFIX}{column}"))
+                              .otherwise(col(f"{UNSEEN_PREFIX}{column}")) for column in self.featurized_cols}
+        return (dataframe.withColumns(featurized_columns)
+                .drop(MEMOIZED_MATCH, f"{UNSEEN_PREFIX}{input_col}",
+                      *[f"{prefix}{column}" for prefix in (MEMOIZED_PREFIX, UNSEEN_PREFIX)
+                        for column in self.featurized_cols]))
+
+
+FUSED_STAGE_TYPE = "type"
+FUSED_DERIVED_FEATURE = "derived_feature"
+FUSED_IMPUTER = "imputer"
+FUSED_FREQUENCY_IMPUTER = "frequency_imputer"
+FUSED_STRING_INDEXER = "string_indexer"
+
+
+def _get_input_output_cols(stage: Transformer) -> Tuple[List[str], List[str]]:
+    if stage.isSet(stage.inputCols):
+        return stage.getInputCols(), stage.getOutputCols()
+    return [stage.getInputCol()], [stage.getOutputCol()]
+
+
+class FusedFeatureTransformer(Transformer, DefaultParamsReadable, DefaultParamsWritable):
+    """
+    Fitted DerivedFeatureGenerator, ImputerModel, FrequencyImputerModel and StringIndexerModel
+    stages compiled into a single select. Each stage rewrites the column expressions of the
+    previous ones instead of adding a projection per withColumn, so the logical plan stays flat
+    and is analyzed and optimized once. fusedStages holds the fitted state of each stage.
+    """
+    fusedStages = Param(Params._dummy(), "fusedStages", "fitted state of the fused stages in order",
+                        typeConverter=TypeConverters.toList)
+
+    @keyword_only
+    def __init__(self, fusedStages: List[Dict] = None, ):
+        super(FusedFeatureTransformer, self).__init__()
+        kwargs = self._input_kwargs
+        self.setParams(**kwargs)
+
+    @keyword_only
+    def setParams(self, fusedStages: List[Dict] = None, ):
+        kwargs = self._input_kwargs
+        return self._set(**kwargs)
+
+    def getFusedStages(self) -> List[Dict]:
+        return self.getOrDefault(self.fusedStages)
+
+    @staticmethod
+    def get_fused_stage(stage: Transformer) -> Optional[Dict]:
+        """
+        Fitted state of a stage that can be fused, None for any other stage.
+        """
+        if isinstance(stage, DerivedFeatureGenerator):
+            return {FUSED_STAGE_TYPE: FUSED_DERIVED_FEATURE, "inputCols": stage.getInputCols(),
+                    "outputCols": stage.getOutputCols(), "secondWithinDay": stage.second_within_day}
+        if isinstance(stage, ImputerModel):
+            input_cols, output_cols = _get_input_output_cols(stage)
+            surrogate = stage.surrogateDF.head()
+            return {FUSED_STAGE_TYPE: FUSED_IMPUTER, "inputCols": input_cols, "outputCols": output_cols,
+                    "surrogates": [float(surrogate[column]) for column in input_cols],
+                    "missingValue": stage.getMissingValue()}
+        if isinstance(stage, FrequencyImputerModel):
+            return {FUSED_STAGE_TYPE: FUSED_FREQUENCY_IMPUTER, "inputCols": stage.getInputCols(),
+                    "outputCols": stage.getOutputCols(), "topCategorys": stage.getTopCategorys()}
+        if isinstance(stage, StringIndexerModel):
+            input_cols, output_cols = _get_input_output_cols(stage)
+            return {FUSED_STAGE_TYPE: FUSED_STRING_INDEXER, "inputCols": input_cols, "outputCols": output_cols,
+                    "labelsArray": [list(labels) for labels in stage.labelsArray],
+                    "handleInvalid": stage.getHandleInvalid()}
+        return None
+
+    def _transform(self, dataframe: DataFrame):
+        # expression, type and metadata of every column after the stages applied so far
+        columns: Dict[str, Column] = {field.name: col(field.name) for field in dataframe.schema.fields}
+        data_types = {field.name: field.dataType for field in dataframe.schema.fields}
+        metadata: Dict[str, dict] = dict()
+        conditions: List[Column] = []
+
+        for fused_stage in self.getFusedStages():
+            stage_type = fused_stage[FUSED_STAGE_TYPE]
+            input_cols, output_cols = fused_stage["inputCols"], fused_stage["outputCols"]
+            if stage_type == FUSED_DERIVED_FEATURE:
+                for column in input_cols:
+                    columns[column] = columns[column].cast(TimestampType())
+                    data_types[column] = TimestampType()
+                n_second = abs(columns[input_cols[1]].cast(LongType()) - columns[input_cols[0]].cast(LongType()))
+                columns[output_cols[0]] = n_second / fused_stage["secondWithinDay"]
+                data_types[output_cols[0]] = DoubleType()
+            elif stage_type == FUSED_IMPUTER:
+                # same expression as ImputerModel
+                for input_col, output_col, surrogate in zip(input_cols, output_cols, fused_stage["surrogates"]):
+                    value = columns[input_col].cast(DoubleType())
+                    columns[output_col] = (when(value.isNull(), lit(surrogate))
+                                           .when(value == lit(fused_stage["missingValue"]), lit(surrogate))
+                                           .otherwise(value)
+                                           .cast(data_types[input_col]))
+                    data_types[output_col] = data_types[input_col]
+            elif stage_type == FUSED_FREQUENCY_IMPUTER:
+                # na.fill of FrequencyImputerModel only fills string columns
+                for input_col, output_col, top_category in zip(input_cols, output_cols, fused_stage["topCategorys"]):
+                    columns[output_col] = (coalesce(columns[input_col], lit(top_category))
+                                           if isinstance(data_types[input_col], StringType) else columns[input_col])
+                    data_types[output_col] = data_types[input_col]
+            elif stage_type == FUSED_STRING_INDEXER:
+                handle_invalid = fused_stage["handleInvalid"]
+                for input_col, output_col, labels in zip(input_cols, output_cols, fused_stage["labelsArray"]):
+                    value = columns[input_col].cast(StringType())
+                    label_map = create_map(*[lit(item) for index, label in enumerate(labels)
+                                             for item in (label, float(index))])
+                    index = label_map.getItem(value)
+                    if handle_invalid == "keep":
+                        index = coalesce(index, lit(float(len(labels))))
+                    elif handle_invalid == "skip":
+                        conditions.append(index.isNotNull())
+                    else:
+                        index = when(index.isNull(), raise_error(
+                            concat(lit(f"Unseen label or NULL value in [{input_col}]: "),
+                                   coalesce(value, lit("NULL"))))).otherwise(index)
+                    columns[output_col] = index.cast(DoubleType())
+                    data_types[output_col] = DoubleType()
+                    # same ml attribute as StringIndexerModel, read by OneHotEncoderModel
+                    values = labels + ["__unknown"] if handle_invalid == "keep" else labels
+                    metadata[output_col] = {"ml_attr": {"type": "nominal", "name": output_col, "vals": values}}
+            else:
+                raise Exception(f"Stage type [{stage_type}] can't be fused")
+
+        for condition in conditions:
+            dataframe = dataframe.filter(condition)
+        # existing columns keep their position, new ones are appended in the order they were added
+        return dataframe.select(*[columns[column].alias(column, metadata=metadata[column]) if column in metadata
+                                  else columns[column].alias(column) for column in columns])
+
+
+def get_fused_pipeline_model(pipeline_model: PipelineModel) -> PipelineModel:
+    """
+    PipelineModel where every run of consecutive stages FusedFeatureTransformer can compile is
+    replaced by a single FusedFeatureTransformer, the other stages are kept as they are.
+    """
+    stages: List[Transformer] = []
+    fused_stages: List[Dict] = []
+    for stage in pipeline_model.stages:
+        fused_stage = FusedFeatureTransformer.get_fused_stage(stage)
+        if fused_stage is not None:
+            fused_stages.append(fused_stage)
+            continue
+        if len(fused_stages) > 0:
+            stages.append(FusedFeatureTransformer(fusedStages=fused_stages))
+            fused_stages = []
+        stages.append(stage)
+    if len(fused_stages) > 0:
+        stages.append(FusedFeatureTransformer(fusedStages=fused_stages))
+    logging.info(f"[{len(pipeline_model.stages)}] pipeline stages fused into [{len(stages)}] stages")
+    return PipelineModel(stages=stages)
@@ -0,0 +1,161 @@
+from pyspark.sql import Column
+from pyspark.sql.functions import lit, pmod, xxhash64, when
+from pyspark.sql.types import IntegerType
+from typing import Dict, List
+from functools import reduce
+import numpy as np
+import io
+
+EPSILON = 1e-4
+
+
+class CountMinSketch:
+    """
+    Count-min sketch of the values of a column: `depth` rows of `width` counters, value v is
+    counted in bucket pmod(xxhash64(row, v), width) of each row. Buckets are computed by spark
+    with get_bucket_columns, so the sketch of a dataframe costs one aggregation and two sketches
+    of the same shape are merged by adding their tables.
+    """
+
+    def __init__(self, width: int, depth: int, table: np.ndarray = None):
+        self.width = width
+        self.depth = depth
+        self.table = table if table is not None else np.zeros((depth, width), dtype=np.int64)
+
+    def get_bucket_columns(self, column: Column) -> List[Column]:
+        # the row index seeds the hash, giving one independent hash function per row
+        return [pmod(xxhash64(lit(row), column), lit(self.width)).cast(IntegerType())
+                for row in range(self.depth)]
+
+    def add(self, row: int, bucket: int, n: int):
+        self.table[row, bucket] += n
+
+    @property
+    def total(self) -> int:
+        return int(self.table[0].sum())
+
+    def get_distributions(self) -> List[np.ndarray]:
+        return [self.table[row] for row in range(self.depth)]
+
+    def merge(self, other: "CountMinSketch") -> "CountMinSketch":
+        if self.table.shape != other.table.shape:
+            raise Exception(f"Count-min sketch of shape {self.table.shape} can't be merged "
+                            f"with shape {other.table.shape}")
+        return CountMinSketch(width=self.width, depth=self.depth, table=self.table + other.table)
+
+    def to_bytes(self) -> bytes:
+        buffer = io.BytesIO()
+        np.save(buffer, self.table, allow_pickle=False)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "CountMinSketch":
+        table = np.load(io.BytesIO(data), allow_pickle=False)
+        depth, width = table.shape
+        return cls(width=width, depth=depth, table=table)
+
+
+class HistogramSketch:
+    """
+    Histogram of a numeric column over fixed bin edges. Bucket i holds values in
+    [edge[i-1], edge[i]), the first and last buckets the values below and above all edges and
+    one extra bucket the missing values. Histograms with the same edges are merged by adding counts.
+    """
+
+    def __init__(self, bin_edges: List[float], counts: np.ndarray = None):
+        self.bin_edges = [float(edge) for edge in bin_edges]
+        self.counts = counts if counts is not None else np.zeros(len(self.bin_edges) + 2, dtype=np.int64)
+
+    @property
+    def null_bucket(self) -> int:
+        return len(self.bin_edges) + 1
+
+    def get_bucket_column(self, column: Column) -> Column:
+        bucket = reduce(lambda total, edge: total + when(column >= lit(edge), 1).otherwise(0),
+                        self.bin_edges, lit(0))
+        return when(column.isNull(), lit(self.null_bucket)).otherwise(bucket).cast(IntegerType())
+
+    def add(self, bucket: int, n: int):
+        self.counts[bucket] += n
+
+    @property
+    def total(self) -> int:
+        return int(self.counts.sum())
+
+    def get_distributions(self) -> List[np.ndarray]:
+        return [self.counts]
+
+    def merge(self, other: "HistogramSketch") -> "HistogramSketch":
+        if self.bin_edges != other.bin_edges:
+            raise Exception(f"Histogram with edges {self.bin_edges} can't be merged with edges {other.bin_edges}")
+        return HistogramSketch(bin_edges=self.bin_edges, counts=self.counts + other.counts)
+
+    def to_bytes(self) -> bytes:
+        buffer = io.BytesIO()
+        np.savez(buffer, bin_edges=np.array(self.bin_edges, dtype=np.float64), counts=self.counts)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HistogramSketch":
+        arrays = np.load(io.BytesIO(data), allow_pickle=False)
+        return cls(bin_edges=arrays["bin_edges"].tolist(), counts=arrays["counts"])
+
+
+SKETCH_TYPES = {CountMinSketch.__name__: CountMinSketch, HistogramSketch.__name__: HistogramSketch}
+
+
+def save_sketches(file_path: str, sketches: Dict[str, object]):
+    """
+    Saves sketches of several columns in a single npz file, one byte array per column.
+    """
+    arrays = {f"{type(sketch).__name__}__{column}": np.frombuffer(sketch.to_bytes(), dtype=np.uint8)
+              for column, sketch in sketches.items()}
+    with open(file_path, "wb") as file_obj:
+        np.savez(file_obj, **arrays)
+
+
+def load_sketches(file_path: str) -> Dict[str, object]:
+    sketches = dict()
+    with np.load(file_path, allow_pickle=False) as arrays:
+        for key in arrays.files:
+            sketch_type, column = key.split("__", 1)
+            sketches[column] = SKETCH_TYPES[sketch_type].from_bytes(arrays[key].tobytes())
+    return sketches
+
+
+def merge_sketches(sketches: Dict[str, object], other_sketches: Dict[str, object]) -> Dict[str, object]:
+    merged_sketches = dict(sketches)
+    for column, sketch in other_sketches.items():
+        merged_sketches[column] = merged_sketches[column].merge(sketch) if column in merged_sketches else sketch
+    return merged_sketches
+
+
+def get_normalized(counts: np.ndarray) -> np.ndarray:
+    total = counts.sum()
+    if total == 0:
+        return np.full(len(counts), 1 / len(counts))
+    return counts / total
+
+
+def get_psi(expected_counts: np.ndarray, actual_counts: np.ndarray) -> float:
+    """
+    Population stability index, empty buckets are floored at EPSILON.
+    """
+    expected = np.maximum(get_normalized(expected_counts), EPSILON)
+    actual = np.maximum(get_normalized(actual_counts), EPSILON)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def get_js_divergence(expected_counts: np.ndarray, actual_counts: np.ndarray) -> float:
+    """
+    Jensen-Shannon divergence in bits, between 0 and 1.
+    """
+    expected = get_normalized(expected_counts)
+    actual = get_normalized(actual_counts)
+    mixture = (expected + actual) / 2
+
+    def get_kl_divergence(p: np.ndarray, q: np.ndarray) -> float:
+        mask = p > 0
+        return float(np.sum(p[mask] * np.log2(p[mask] / q[mask])))
+
+    return (get_kl_divergence(expected, mixture) + get_kl_divergence(actual, mixture)) / 2
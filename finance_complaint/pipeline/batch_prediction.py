@@ -1,17 +1,40 @@
 from finance_complaint.exception import FinanceException
 from finance_complaint.logger import logging
 from finance_complaint.entity import BatchPredictionConfig
+from finance_complaint.entity import FinanceDataSchema
 from finance_complaint.ml.estimator import FinanceComplaintEstimator
 from finance_complaint.config.spark_manager import spark_session
 import os, sys, shutil
+from typing import List
 from pyspark.sql import DataFrame
+from pyspark.sql.utils import AnalysisException
 from finance_complaint.constant import TIMESTAMP
 
 
 class BatchPrediction:
-    def __init__(self, batch_config:BatchPredictionConfig):
+    def __init__(self, batch_config:BatchPredictionConfig, schema=FinanceDataSchema()):
         try:
             self.batch_config = batch_config
+            self.schema = schema
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    def get_schema_mismatch(self, data_file_path: str) -> List[str]:
+        """
+        Columns needed for prediction missing from the input file or not of the declared type, read
+        from the parquet footer without scanning the data, other columns are optional. A file spark
+        cannot read as parquet is reported as a whole.
+        """
+        try:
+            try:
+                file_schema = spark_session.read.parquet(data_file_path).schema
+            except AnalysisException as e:
+                return [f"unreadable file: {e}"]
+            data_types = {field.name: field.dataType for field in file_schema.fields}
+            return [f"{field.name}: expected {field.dataType.simpleString()} found "
+                    f"{data_types[field.name].simpleString() if field.name in data_types else 'missing'}"
+                    for field in self.schema.get_dataframe_schema(self.schema.required_prediction_columns).fields
+                    if data_types.get(field.name) != field.dataType]
         except Exception as e:
             raise FinanceException(e, sys)
 
@@ -26,16 +49,29 @@ class BatchPrediction:
 
             for file_name in input_files:
                 data_file_path = os.path.join(self.batch_config.inbox_dir, file_name)   
-                df: DataFrame = spark_session.read.parquet(data_file_path).limit(1000)
+                prediction_file_path = os.path.join(self.batch_config.outbox_dir,f"{file_name}_{TIMESTAMP}")
+                # a file not matching the declared schema is kept aside instead of failing the batch,
+                # errors of the model or of the writes are not about the input and are raised
+                schema_mismatch = self.get_schema_mismatch(data_file_path=data_file_path)
+                if len(schema_mismatch) > 0:
+                    logging.info(f"Unable to predict file: [{data_file_path}] hence moving it to rejected dir. "
+                                 f"{schema_mismatch}")
+                    rejected_file_path = os.path.join(self.batch_config.rejected_dir, f"{file_name}_{TIMESTAMP}")
+                    shutil.move(data_file_path, rejected_file_path)
+                    continue
+
+                df: DataFrame = (spark_session.read
+                                 .schema(self.schema.dataframe_schema)
+                                 .parquet(data_file_path)
+                                 .limit(1000))
 
                 prediction_df = finance_estimator.transform(dataframe=df)
-                prediction_file_path = os.path.join(self.batch_config.outbox_dir,f"{file_name}_{TIMESTAMP}")
                 prediction_df.write.parquet(prediction_file_path)
 
                 archive_file_path = os.path.join(self.batch_config.archive_dir,f"{file_name}_{TIMESTAMP}")
                 df.write.parquet(archive_file_path)
 
-                shutil.rmtree(self.batch_config.inbox_dir)
-                os.makedirs(self.batch_config.inbox_dir)
+            shutil.rmtree(self.batch_config.inbox_dir)
+            os.makedirs(self.batch_config.inbox_dir)
         except Exception as e:
             raise FinanceException(e, sys)
\ No newline at end of file
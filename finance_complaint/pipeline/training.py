@@ -1,11 +1,13 @@
 from finance_complaint.components import (DataIngestion, DataValidation, DataTransformation, 
-                                                    ModelTrainer, ModelEvaluation, ModelPusher)
+                                                    ModelTrainer, ModelEvaluation, ModelPusher, DataDriftDetection,
+                                                    get_data_validation)
 from finance_complaint.exception import FinanceException
 from finance_complaint.logger import logging
 from finance_complaint.entity import (DataIngestionConfig, TrainingPipelineConfig, DataValidationConfig, 
-                            DataTransformationConfig, ModelTrainerConfig, ModelEvaluationConfig, ModelPusherConfig)
+                            DataTransformationConfig, ModelTrainerConfig, ModelEvaluationConfig, ModelPusherConfig,
+                            DataDriftConfig)
 from finance_complaint.entity import (DataIngestionArtifact, DataValidationArtifact, DataTransformationArtifact, 
-                            ModelTrainerArtifact, ModelEvaluationArtifact, ModelPusherArtifact)
+                            ModelTrainerArtifact, ModelEvaluationArtifact, ModelPusherArtifact, DataDriftArtifact)
 import os, sys
 
 
@@ -25,13 +27,29 @@ class TrainingPipeline:
     def start_data_validation(self, data_ingestion_artifact:DataIngestionArtifact)->DataValidationArtifact:
         try:
             data_validation_config = DataValidationConfig(training_pipeline_config=self.training_pipeline_config)
-            data_validation = DataValidation(data_validation_config=data_validation_config, 
-                                             data_ingestion_artifact=data_ingestion_artifact)
+            data_validation = get_data_validation(data_validation_config=data_validation_config, 
+                                                  data_ingestion_artifact=data_ingestion_artifact)
             data_validation_artifact = data_validation.initiate_data_validation()
             return data_validation_artifact
         except Exception as e:
             raise FinanceException(e, sys)
     
+    def get_data_drift_detection(self, data_ingestion_artifact: DataIngestionArtifact) -> DataDriftDetection:
+        try:
+            data_drift_config = DataDriftConfig(training_pipeline_config=self.training_pipeline_config)
+            return DataDriftDetection(data_drift_config=data_drift_config,
+                                      data_ingestion_artifact=data_ingestion_artifact)
+        except Exception as e:
+            raise FinanceException(e, sys)
+
+    def start_data_drift_detection(self, data_ingestion_artifact: DataIngestionArtifact) -> DataDriftArtifact:
+        try:
+            data_drift_detection = self.get_data_drift_detection(data_ingestion_artifact=data_ingestion_artifact)
+            data_drift_artifact = data_drift_detection.initiate_data_drift_detection()
+            return data_drift_artifact
+        except Exception as e:
+            raise FinanceException(e, sys)
+
     def start_data_transformation(self, data_validation_artifact: DataValidationArtifact)-> DataTransformationArtifact:
         try:
             data_transformation_config = DataTransformationConfig(training_pipeline_config=self.training_pipeline_config)
@@ -77,6 +95,10 @@ class TrainingPipeline:
     def start(self):
         try:
             data_ingestion_artifact = self.start_data_ingestion()
+
+            data_drift_artifact = self.start_data_drift_detection(data_ingestion_artifact=data_ingestion_artifact)
+            logging.info(f"Drift found in ingested batch: [{data_drift_artifact.is_drift_found}] "
+                         f"with score: [{data_drift_artifact.drift_score}]")
             
             data_validation_artifact = self.start_data_validation(data_ingestion_artifact=data_ingestion_artifact)
             
@@ -89,5 +111,7 @@ class TrainingPipeline:
             
             if model_evaluation_artifact.model_accepted:
                 self.start_model_pusher(model_trainer_artifact=model_trainer_artifact)
+                # training window of the pushed model becomes the reference later batches are compared with
+                self.get_data_drift_detection(data_ingestion_artifact=data_ingestion_artifact).update_reference_sketch()
         except Exception as e:
             raise FinanceException(e, sys)
\ No newline at end of file
@@ -0,0 +1,47 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pyspark")
+
+from finance_complaint.components.data_drift import DataDriftDetection
+from finance_complaint.ml.sketch import HistogramSketch, save_sketches, load_sketches
+from finance_complaint.utils import write_yaml_file
+import numpy as np
+
+BIN_EDGES = [0, 1, 2]
+
+
+def write_histogram(file_path: str, n: int):
+    save_sketches(file_path=file_path,
+                  sketches={"diff_in_days": HistogramSketch(bin_edges=BIN_EDGES,
+                                                            counts=np.full(len(BIN_EDGES) + 2, n, dtype=np.int64))})
+
+
+def get_data_drift_detection(root: str, from_date: str, to_date: str) -> DataDriftDetection:
+    data_drift_config = SimpleNamespace(from_date=from_date, to_date=to_date,
+                                        batch_sketch_dir=os.path.join(root, "batch_sketch"),
+                                        reference_sketch_file_path=os.path.join(root, "reference_sketch.npz"),
+                                        reference_window_file_path=os.path.join(root, "reference_window.yaml"))
+    return DataDriftDetection(data_drift_config=data_drift_config, data_ingestion_artifact=None)
+
+
+def test_update_reference_sketch_merges_consecutive_windows(tmp_path):
+    root = str(tmp_path)
+    os.makedirs(os.path.join(root, "batch_sketch"))
+    write_histogram(os.path.join(root, "reference_sketch.npz"), n=10)
+    write_yaml_file(file_path=os.path.join(root, "reference_window.yaml"),
+                    data={"from_date": "2022-01-01", "to_date": "2022-01-10"})
+    # every ingestion run starts at the end date of the previous one
+    write_histogram(os.path.join(root, "batch_sketch", "2022-01-10_2022-01-20.npz"), n=1)
+    write_histogram(os.path.join(root, "batch_sketch", "2022-01-20_2022-01-30.npz"), n=2)
+
+    totals = []
+    for to_date in ["2022-01-20", "2022-01-30"]:
+        reference_sketch_file_path = get_data_drift_detection(root, from_date="2022-01-01",
+                                                              to_date=to_date).update_reference_sketch()
+        totals.append(load_sketches(reference_sketch_file_path)["diff_in_days"].total)
+
+    n_bucket = len(BIN_EDGES) + 2
+    assert totals == [11 * n_bucket, 13 * n_bucket]